@@ -0,0 +1,230 @@
+# =========================================================================
+# Copyright 2012-present Yunify, Inc.
+# -------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =========================================================================
+
+'''
+latency of NeutronDriver flows against a fake terra dc controller:
+
+    python -m common.benchmark --tenants 16 --concurrency 4 --latency-ms 20
+
+each tenant runs create_vpc, create_vxnet, join_vpc and add_node, then
+the reverse teardown: remove_node, leave_vpc, delete_vxnet, delete_vpc.
+'''
+
+import argparse
+import collections
+import logging as std_logging
+import math
+import threading
+import time
+from oslo_config import cfg
+from oslo_log import log as logging
+from networking_terra.common.executor import BoundedExecutor, wait_all
+from networking_terra.common.instrument import count_calls
+from networking_terra.l3.terra_l3 import TerraL3RouterPlugin
+from networking_terra.ml2.mech_terra import TerraMechanismDriver
+from networking_terra.qcext.qcext_terra import TerraQcExtDriver
+from networking_terra.testing.fake_controller import FakeTerraController, \
+    lognormal
+from common.neutron_driver import NeutronDriver
+
+LOG = logging.getLogger(__name__)
+cfg.CONF.import_group("ml2_terra", "networking_terra.common.config")
+
+SETUP = ("create_vpc", "create_vxnet", "join_vpc", "add_node")
+TEARDOWN = ("remove_node", "leave_vpc", "delete_vxnet", "delete_vpc")
+
+
+def percentile(values, p):
+    '''
+    nearest rank percentile of values, p from 0 to 100
+    '''
+    if not values:
+        return 0
+    values = sorted(values)
+    rank = int(math.ceil(p / 100.0 * len(values)))
+    return values[min(max(rank - 1, 0), len(values) - 1)]
+
+
+class Benchmark(object):
+
+    def __init__(self, tenants=4, vxnets=2, nodes=2, concurrency=4,
+                 latency_ms=10, latency_sigma=0.5, busy_rate=0,
+                 seed=None):
+        self.tenants = tenants
+        self.vxnets = vxnets
+        self.nodes = nodes
+        self.concurrency = concurrency
+        self.controller = FakeTerraController(
+            latency={"*": lognormal(latency_ms / 1000.0, latency_sigma)}
+            if latency_ms else None,
+            busy_rate=busy_rate, seed=seed)
+        self.latencies = collections.defaultdict(list)
+        self.calls = collections.defaultdict(int)
+        self.errors = collections.defaultdict(int)
+        self._lock = threading.Lock()
+
+    def _setup_controller(self):
+        hosts = ["host%d" % i for i in range(self.nodes)]
+        for leaf in range(max(1, self.nodes // 8)):
+            self.controller.add_device("leaf%d" % leaf,
+                                       ["Ethernet1/%d" % i
+                                        for i in range(1, 49)])
+        self.controller.start()
+        self.controller.configure("benchmark", "benchmark", "benchmark")
+
+        ml2 = TerraMechanismDriver()
+        ml2.initialize()
+        self.driver = NeutronDriver(TerraL3RouterPlugin(), ml2,
+                                    TerraQcExtDriver())
+        for i, host in enumerate(hosts):
+            leaf = "leaf%d" % min(i // 8, max(1, self.nodes // 8) - 1)
+            self.driver.create_host(host, "10.255.0.%d" % (i + 1), [{
+                "host_name": host,
+                "host_interface_name": "eth0",
+                "switch_name": leaf,
+                "switch_interface_name": "Ethernet1/%d" % (i % 48 + 1)}])
+        self.controller.reset_stats()
+        return hosts
+
+    def _timed(self, operation, *args):
+        start = time.time()
+        with count_calls(operation) as scope:
+            try:
+                getattr(self.driver, operation)(*args)
+            except Exception as e:
+                LOG.error("%s failed: %s" % (operation, e))
+                with self._lock:
+                    self.errors[operation] += 1
+        elapsed = time.time() - start
+        with self._lock:
+            self.latencies[operation].append(elapsed)
+            self.calls[operation] += scope.requests
+
+    def _tenant(self, index, hosts):
+        user_id = "usr-bench%d" % index
+        vpc_id = "rtr-bench%d" % index
+        vxnet_ids = ["vxnet-bench%d-%d" % (index, i)
+                     for i in range(self.vxnets)]
+        self._timed("create_vpc", vpc_id, 10000 + index, user_id)
+        for i, vxnet_id in enumerate(vxnet_ids):
+            vni = 20000 + index * self.vxnets + i
+            self._timed("create_vxnet", vxnet_id, vni,
+                        "10.%d.%d.0/24" % (index % 256, i),
+                        "10.%d.%d.1" % (index % 256, i), user_id)
+            self._timed("join_vpc", vpc_id, vxnet_id, user_id)
+            for host in hosts:
+                self._timed("add_node", vxnet_id, vni, host, user_id,
+                            100 + i, False)
+        for vxnet_id in vxnet_ids:
+            for host in hosts:
+                self._timed("remove_node", vxnet_id, host, user_id)
+            self._timed("leave_vpc", vpc_id, vxnet_id, user_id)
+            self._timed("delete_vxnet", vxnet_id, user_id)
+        self._timed("delete_vpc", vpc_id, user_id)
+
+    def run(self):
+        hosts = self._setup_controller()
+        executor = BoundedExecutor(self.concurrency, name="benchmark")
+        start = time.time()
+        try:
+            wait_all([executor.submit(self._tenant, i, hosts)
+                      for i in range(self.tenants)])
+        finally:
+            self.elapsed = time.time() - start
+            executor.shutdown()
+            self.controller.unconfigure()
+            self.controller.stop()
+        return self.report()
+
+    def report(self):
+        '''
+        @return: {operation: {"count", "p50", "p95", "p99", "calls"}},
+            latencies in seconds, calls is http calls per operation
+        '''
+        ret = {}
+        for operation in SETUP + TEARDOWN:
+            values = self.latencies.get(operation, [])
+            if not values:
+                continue
+            ret[operation] = {
+                "count": len(values),
+                "errors": self.errors.get(operation, 0),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+                "calls": float(self.calls[operation]) / len(values),
+            }
+        return ret
+
+    def format_report(self, report):
+        lines = ["%-14s %7s %6s %9s %9s %9s %8s"
+                 % ("operation", "count", "errors", "p50(ms)", "p95(ms)",
+                    "p99(ms)", "calls/op")]
+        total = 0
+        for operation in SETUP + TEARDOWN:
+            if operation not in report:
+                continue
+            r = report[operation]
+            total += r["count"]
+            lines.append("%-14s %7d %6d %9.1f %9.1f %9.1f %8.1f"
+                         % (operation, r["count"], r["errors"],
+                            r["p50"] * 1000, r["p95"] * 1000,
+                            r["p99"] * 1000, r["calls"]))
+        http_calls = sum(self.controller.get_stats().values())
+        lines.append("%d tenants in %.2fs: %.1f tenants/s, %.1f ops/s, "
+                     "%d http calls"
+                     % (self.tenants, self.elapsed,
+                        self.tenants / self.elapsed, total / self.elapsed,
+                        http_calls))
+        return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tenants", type=int, default=4)
+    parser.add_argument("--vxnets", type=int, default=2,
+                        help="vxnets per tenant")
+    parser.add_argument("--nodes", type=int, default=2,
+                        help="hosts added to each vxnet")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="tenants run at the same time")
+    parser.add_argument("--latency-ms", type=float, default=10,
+                        help="median latency of controller calls")
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--busy-rate", type=float, default=0,
+                        help="probability of device busy BadRequest")
+    parser.add_argument("--retry-delay", type=float, default=None,
+                        help="seconds before retrying a busy device")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--verbose", action="store_true",
+                        help="keep debug and info logs")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        std_logging.disable(std_logging.INFO)
+
+    cfg.CONF([], project="benchmark")
+    if args.retry_delay is not None:
+        cfg.CONF.set_override("retry_initial_delay", args.retry_delay,
+                              "ml2_terra")
+    benchmark = Benchmark(args.tenants, args.vxnets, args.nodes,
+                          args.concurrency, args.latency_ms,
+                          args.latency_sigma, args.busy_rate, args.seed)
+    print(benchmark.format_report(benchmark.run()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+# =========================================================================
+# Copyright 2012-present Yunify, Inc.
+# -------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =========================================================================
+
+import collections
+import sys
+import threading
+import time
+from oslo_config import cfg
+from oslo_log import log as logging
+from networking_terra.common.cache import TTLCache
+from networking_terra.common.executor import Future
+from networking_terra.common.instrument import get_call_args
+from common.driver_executor import DriverExecutor
+
+LOG = logging.getLogger(__name__)
+cfg.CONF.import_group("ml2_terra", "networking_terra.common.config")
+
+
+def _node_key(a):
+    return ("node", a["vxnet_id"], a["host"])
+
+
+def _route_key(a):
+    return ("route", a["vpc_id"], a["destination"], a["nexthop"],
+            a["device_name"])
+
+
+# operations held in queue -> function of their arguments returning the
+# key of the resource state they set
+COALESCED_OPERATIONS = {
+    "add_node": _node_key,
+    "remove_node": _node_key,
+    "add_route": _route_key,
+}
+
+# (pending operation, new operation) cancelling each other, if the node
+# was known unbound before the pending operation
+CANCELLING = set([("add_node", "remove_node")])
+
+# number of resources whose last operation sent is remembered
+LAST_SENT_CACHE_SIZE = 4096
+
+
+class _Pending(object):
+    def __init__(self, key, operation, call_args, args, kwargs, due):
+        self.key = key
+        self.operation = operation
+        self.call_args = call_args
+        self.args = args
+        self.kwargs = kwargs
+        self.due = due
+        self.futures = []
+
+
+class CoalescingQueue(object):
+    '''
+    queue of NeutronDriver operations held for window seconds before
+    they are sent, so redundant ones never reach terra dc:
+        - an operation identical to a pending one is merged into it
+        - a remove_node cancels the pending add_node of the same node,
+          and is dropped too if the last remove_node sent for the node
+          succeeded, otherwise the node may be bound and it is kept
+        - an add_node replaces the pending add_node of the same node, the
+          latest desired binding wins
+    other operations are sent at once, after everything pending so the
+    order of submission is kept. Futures of merged and replaced calls get
+    the result of the call sent, those of cancelled calls get None.
+    '''
+
+    def __init__(self, driver, window=None, max_workers=None):
+        self.driver = driver
+        self.window = cfg.CONF.ml2_terra.coalesce_window \
+            if window is None else window
+        self.executor = DriverExecutor(driver, max_workers)
+        self._pending = collections.OrderedDict()
+        # key -> (operation, Future) sent last for it
+        self._last_sent = TTLCache(LAST_SENT_CACHE_SIZE, 0)
+        self._cond = threading.Condition(threading.RLock())
+        self._closed = False
+        self._stats = collections.defaultdict(int)
+        self._thread = None
+        if self.window > 0:
+            self._thread = threading.Thread(target=self._run,
+                                            name="terra-coalesce")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def submit(self, operation, *args, **kwargs):
+        '''
+        @param operation: name of NeutronDriver method, eg: add_node
+        @return: Future of the operation result
+        '''
+        future = Future()
+        if self.window <= 0 or operation not in COALESCED_OPERATIONS:
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("coalescing queue is closed")
+                self._flush()
+                self._send(None, operation, args, kwargs, [future])
+            return future
+
+        method = getattr(self.driver, operation)
+        call_args = get_call_args(method, *args, **kwargs)
+        key = COALESCED_OPERATIONS[operation](call_args)
+        cancelled = []
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("coalescing queue is closed")
+            pending = self._pending.get(key)
+            if pending is None:
+                pass
+            elif pending.operation == operation and \
+                    pending.call_args == call_args:
+                LOG.debug("merge %s %s into pending one" % (operation, key))
+                pending.futures.append(future)
+                self._stats["merged"] += 1
+                return future
+            elif (pending.operation, operation) in CANCELLING:
+                LOG.debug("%s cancels pending %s %s"
+                          % (operation, pending.operation, key))
+                del self._pending[key]
+                cancelled = pending.futures
+                self._stats["cancelled"] += 1
+                if self._is_unbound(key):
+                    cancelled.append(future)
+                    self._stats["cancelled"] += 1
+            elif pending.operation == operation:
+                LOG.debug("replace pending %s %s" % (operation, key))
+                pending.call_args = call_args
+                pending.args = args
+                pending.kwargs = kwargs
+                pending.futures.append(future)
+                self._stats["replaced"] += 1
+                return future
+            else:
+                # can't be merged, send the pending one first
+                del self._pending[key]
+                self._send(key, pending.operation, pending.args,
+                           pending.kwargs, pending.futures)
+
+            if future not in cancelled:
+                pending = _Pending(key, operation, call_args, args, kwargs,
+                                   time.time() + self.window)
+                pending.futures.append(future)
+                self._pending[key] = pending
+                self._cond.notify()
+        for f in cancelled:
+            f.set_result(None)
+        return future
+
+    def _send(self, key, operation, args, kwargs, futures):
+        '''
+        @param key: key of the resource state set by operation, None for
+            operations which are not coalesced
+        '''
+        try:
+            sent = self.executor.submit(operation, *args, **kwargs)
+        except Exception:
+            exc_info = sys.exc_info()
+            for f in futures:
+                f.set_exception(exc_info)
+            return
+        self._stats["sent"] += 1
+        if key is not None:
+            self._last_sent.set(key, (operation, sent))
+
+        def done(sent):
+            for f in futures:
+                if sent._exc_info:
+                    f.set_exception(sent._exc_info)
+                else:
+                    f.set_result(sent._result)
+
+        sent.add_done_callback(done)
+
+    def _is_unbound(self, key):
+        '''
+        whether the last operation sent for node key is a remove_node
+        which succeeded
+        '''
+        last = self._last_sent.get(key)
+        if last is None:
+            return False
+        operation, sent = last
+        return operation == "remove_node" and sent.done() and \
+            sent.exception() is None
+
+    def _pop_due(self, now=None):
+        due = []
+        for key, pending in list(self._pending.items()):
+            if now is None or pending.due <= now:
+                due.append(pending)
+                del self._pending[key]
+        return due
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    now = time.time()
+                    if self._pending:
+                        first = min(p.due for p in self._pending.values())
+                        if first <= now:
+                            break
+                        self._cond.wait(first - now)
+                    else:
+                        self._cond.wait()
+                if self._closed:
+                    return
+                self._flush(time.time())
+
+    def flush(self):
+        '''
+        send all pending operations now
+        '''
+        with self._cond:
+            self._flush()
+
+    def _flush(self, now=None):
+        for pending in self._pop_due(now):
+            self._send(pending.key, pending.operation, pending.args,
+                       pending.kwargs, pending.futures)
+
+    def get_stats(self):
+        return dict(self._stats)
+
+    def close(self, wait=True):
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join()
+        self.executor.shutdown(wait)
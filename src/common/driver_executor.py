@@ -0,0 +1,123 @@
+# =========================================================================
+# Copyright 2012-present Yunify, Inc.
+# -------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =========================================================================
+
+from oslo_config import cfg
+from oslo_log import log as logging
+from networking_terra.common.executor import KeyedExecutor
+from networking_terra.common.instrument import get_call_args
+
+LOG = logging.getLogger(__name__)
+cfg.CONF.import_group("ml2_terra", "networking_terra.common.config")
+
+
+def _vpc(args):
+    return "vpc:%s" % args["vpc_id"]
+
+
+def _vxnet(args, name="vxnet_id"):
+    return "vxnet:%s" % args[name]
+
+
+def _node(args):
+    return "node:%s:%s" % (args["vxnet_id"], args["host"])
+
+
+def _nodes(args):
+    return ["node:%s:%s" % (args["vxnet_id"], host) for host in args["hosts"]]
+
+
+def _routes(args):
+    return "routes:%s" % args["vpc_id"]
+
+
+def _host(args):
+    return "host:%s" % args.get("hostname", args.get("host"))
+
+
+# operation -> function of its arguments returning
+# (exclusive keys, shared keys)
+OPERATION_KEYS = {
+    "create_vpc": lambda a: ([_vpc(a)], []),
+    "delete_vpc": lambda a: ([_vpc(a)], []),
+    "provision_vpc": lambda a: ([_vpc(a)], []),
+    "create_vxnet": lambda a: ([_vxnet(a)], []),
+    "delete_vxnet": lambda a: ([_vxnet(a)], []),
+    "join_vpc": lambda a: ([_vxnet(a, "subnet_id")], [_vpc(a)]),
+    "leave_vpc": lambda a: ([_vxnet(a)], [_vpc(a)]),
+    "add_subintf": lambda a: ([_vxnet(a, "network_id")], [_vpc(a)]),
+    "delete_subintf": lambda a: ([_vxnet(a, "network_id")], [_vpc(a)]),
+    "add_node": lambda a: ([_node(a)], [_vxnet(a)]),
+    "remove_node": lambda a: ([_node(a)], [_vxnet(a)]),
+    "add_nodes": lambda a: (_nodes(a), [_vxnet(a)]),
+    "remove_nodes": lambda a: (_nodes(a), [_vxnet(a)]),
+    "add_route": lambda a: ([_routes(a)], [_vpc(a)]),
+    "delete_routes": lambda a: ([_routes(a)], [_vpc(a)]),
+    "create_host": lambda a: ([_host(a)], []),
+    "delete_host": lambda a: ([_host(a)], []),
+    "get_host": lambda a: ([], [_host(a)]),
+}
+
+
+class DriverExecutor(object):
+    '''
+    run NeutronDriver operations on a pool of workers, operations on the
+    same resources run in order of submission while unrelated ones run
+    concurrently, eg: join_vpc never overtakes the create_vxnet submitted
+    before it, but vxnets of different vpcs are built at the same time.
+
+    Each operation holds its resource keys exclusively, eg: the vxnet it
+    creates, and the keys of resources it only depends on in shared
+    mode, eg: the vpc a vxnet joins, see OPERATION_KEYS.
+    '''
+
+    def __init__(self, driver, max_workers=None):
+        self.driver = driver
+        self.executor = KeyedExecutor(
+            max_workers or cfg.CONF.ml2_terra.bulk_max_workers,
+            name="terra-driver")
+
+    def get_keys(self, operation, *args, **kwargs):
+        if operation not in OPERATION_KEYS:
+            raise ValueError("no resource keys known for %s, use "
+                             "submit_with_keys" % operation)
+        method = getattr(self.driver, operation)
+        call_args = get_call_args(method, *args, **kwargs)
+        return OPERATION_KEYS[operation](call_args)
+
+    def submit(self, operation, *args, **kwargs):
+        '''
+        @param operation: name of NeutronDriver method, eg: join_vpc
+        @return: Future of the operation result
+        '''
+        keys, shared_keys = self.get_keys(operation, *args, **kwargs)
+        return self.submit_with_keys(keys, operation, args, kwargs,
+                                     shared_keys)
+
+    def submit_with_keys(self, keys, operation, args=(), kwargs=None,
+                         shared_keys=()):
+        '''
+        @param operation: name of NeutronDriver method, or function
+            running it
+        '''
+        LOG.debug("submit %s on %s, shared %s"
+                  % (operation, keys, shared_keys))
+        method = operation
+        if not callable(method):
+            method = getattr(self.driver, operation)
+        return self.executor.submit(keys, method, args, kwargs, shared_keys)
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait)
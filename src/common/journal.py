@@ -0,0 +1,297 @@
+# =========================================================================
+# Copyright 2012-present Yunify, Inc.
+# -------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =========================================================================
+
+import collections
+import functools
+import json
+import os
+import re
+import threading
+from oslo_log import log as logging
+from common.driver_executor import DriverExecutor
+from networking_terra.common.exceptions import BadRequestException, \
+    NotFoundException
+from networking_terra.common.retry import fatal_patterns
+
+LOG = logging.getLogger(__name__)
+
+# NeutronDriver operations changing terra dc configuration
+JOURNALED_OPERATIONS = set([
+    "create_vpc", "delete_vpc", "provision_vpc",
+    "create_vxnet", "delete_vxnet",
+    "join_vpc", "leave_vpc",
+    "add_subintf", "delete_subintf",
+    "add_node", "remove_node", "add_nodes", "remove_nodes",
+    "add_route", "delete_routes",
+    "create_host", "delete_host",
+])
+
+# operations removing resources, NotFound on replay means already removed
+REMOVING_OPERATIONS = set([
+    "delete_vpc", "delete_vxnet", "leave_vpc", "delete_subintf",
+    "remove_node", "remove_nodes", "delete_routes", "delete_host",
+])
+
+# BadRequest of an operation applied before the crash, eg: a create
+# replayed after its resource was created
+ALREADY_APPLIED_PATTERNS = (r"\bexists\b",)
+
+
+class OperationJournal(object):
+    '''
+    append only log of operations, one json record per line:
+        {"seq": 1, "op": "create_vxnet", "args": [...], "kwargs": {...}}
+    when an operation starts and
+        {"seq": 1, "done": true, "error": null}
+    when it ends. An operation without end record is pending.
+    '''
+
+    def __init__(self, path, fsync=True, compact_threshold=1000):
+        self.path = path
+        self.fsync = fsync
+        self.compact_threshold = compact_threshold
+        self._lock = threading.Lock()
+        self._pending = collections.OrderedDict()
+        self._finished = 0
+        self._seq = 0
+        self._load()
+        self._file = open(self.path, "a")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # last record may be cut by a crash
+                    LOG.warn("skip broken journal record: %r" % line)
+                    continue
+                self._seq = max(self._seq, record["seq"])
+                if "op" in record:
+                    self._pending[record["seq"]] = record
+                else:
+                    self._pending.pop(record["seq"], None)
+                    self._finished += 1
+
+    def _write(self, record):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def begin(self, operation, args=(), kwargs=None):
+        '''
+        @param args: positional arguments, must be json serializable
+        @param kwargs: keyword arguments, the ones which are not, eg:
+            progress callbacks, are left out of the journal and of replays
+        '''
+        args = list(args)
+        try:
+            json.dumps(args)
+        except (TypeError, ValueError) as e:
+            raise ValueError("can't journal arguments of %s: %s"
+                             % (operation, e))
+        journaled = {}
+        for key, value in (kwargs or {}).items():
+            try:
+                json.dumps(value)
+            except (TypeError, ValueError):
+                LOG.debug("argument %s of %s is not journaled"
+                          % (key, operation))
+                continue
+            journaled[key] = value
+
+        with self._lock:
+            self._seq += 1
+            record = {"seq": self._seq, "op": operation,
+                      "args": args, "kwargs": journaled}
+            self._write(record)
+            self._pending[self._seq] = record
+            return self._seq
+
+    def finish(self, seq, error=None):
+        with self._lock:
+            self._write({"seq": seq, "done": True,
+                         "error": "%s" % error if error else None})
+            self._pending.pop(seq, None)
+            self._finished += 1
+            if self.compact_threshold and \
+                    self._finished >= self.compact_threshold:
+                self._compact()
+
+    def pending(self):
+        with self._lock:
+            return list(self._pending.values())
+
+    def compact(self):
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        '''
+        rewrite the journal with pending operations only
+        '''
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for record in self._pending.values():
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._file.close()
+        os.rename(tmp_path, self.path)
+        self._file = open(self.path, "a")
+        LOG.debug("compacted journal %s, %d pending"
+                  % (self.path, len(self._pending)))
+        self._finished = 0
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class JournaledDriver(object):
+    '''
+    NeutronDriver recording each operation changing terra dc in a journal
+    before running it, so operations interrupted by a crash are run again
+    by recover() on startup.
+
+    With write_behind, operations return a Future as soon as they are
+    journaled and run on a DriverExecutor, which keeps operations on the
+    same resources in order.
+
+    While recover() runs, new operations wait until the replayed ones are
+    done, or with write_behind queued before them, so a replayed delete
+    never runs after a new create of the same resource.
+    '''
+
+    def __init__(self, driver, journal, write_behind=False, max_workers=None):
+        self.driver = driver
+        self.journal = journal
+        self.write_behind = write_behind
+        self.executor = None
+        if write_behind:
+            self.executor = DriverExecutor(driver, max_workers)
+        # cleared while journaled operations are being replayed
+        self._replayed = threading.Event()
+        self._replayed.set()
+
+    def __getattr__(self, name):
+        attr = getattr(self.driver, name)
+        if name not in JOURNALED_OPERATIONS:
+            return attr
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            return self.call(name, *args, **kwargs)
+
+        return call
+
+    def call(self, operation, *args, **kwargs):
+        self._replayed.wait()
+        seq = self.journal.begin(operation, args, kwargs)
+        return self._run(seq, operation, args, kwargs)
+
+    def _run(self, seq, operation, args, kwargs, replay=False):
+        method = getattr(self.driver, operation)
+        if replay:
+            method = functools.partial(self._replay, operation)
+        if not self.write_behind:
+            try:
+                ret = method(*args, **kwargs)
+            except Exception as e:
+                self.journal.finish(seq, e)
+                raise
+            self.journal.finish(seq)
+            return ret
+
+        try:
+            keys, shared_keys = self.executor.get_keys(operation, *args,
+                                                       **kwargs)
+            future = self.executor.submit_with_keys(keys, method, args,
+                                                    kwargs, shared_keys)
+        except Exception as e:
+            # never submitted, it would be replayed on every startup
+            self.journal.finish(seq, e)
+            raise
+        future.add_done_callback(
+            lambda f: self.journal.finish(seq, f.exception()))
+        return future
+
+    def _replay(self, operation, *args, **kwargs):
+        '''
+        run a journaled operation again, errors telling it was applied
+        before the crash are not retried and taken as success
+        '''
+        with fatal_patterns(*ALREADY_APPLIED_PATTERNS):
+            try:
+                return getattr(self.driver, operation)(*args, **kwargs)
+            except NotFoundException as e:
+                if operation not in REMOVING_OPERATIONS:
+                    raise
+                LOG.info("%s already applied: %s" % (operation, e))
+            except BadRequestException as e:
+                if not any(re.search(p, "%s" % e)
+                           for p in ALREADY_APPLIED_PATTERNS):
+                    raise
+                LOG.info("%s already applied: %s" % (operation, e))
+
+    def recover(self, background=False):
+        '''
+        run again the operations left pending in journal, in their order
+        @param background: replay in a thread, so startup is not delayed,
+            new operations still wait for the replay
+        @return: {seq: None if succeeded, else the exception}, the
+            replaying thread if background
+        '''
+        self._replayed.clear()
+        if background:
+            thread = threading.Thread(target=self.recover,
+                                      name="terra-journal-recover")
+            thread.daemon = True
+            thread.start()
+            return thread
+
+        results = {}
+        futures = {}
+        try:
+            for record in self.journal.pending():
+                seq = record["seq"]
+                LOG.info("replay journaled operation %s: %s %s %s"
+                         % (seq, record["op"], record["args"],
+                            record["kwargs"]))
+                try:
+                    ret = self._run(seq, record["op"], record["args"],
+                                    record["kwargs"], replay=True)
+                    if self.write_behind:
+                        futures[seq] = ret
+                    results[seq] = None
+                except Exception as e:
+                    LOG.error("failed to replay operation %s: %s" % (seq, e))
+                    results[seq] = e
+        finally:
+            # replayed operations are done, or queued first on the
+            # resources they use
+            self._replayed.set()
+        for seq, future in futures.items():
+            results[seq] = future.exception()
+        return results
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown()
+        self.journal.close()
@@ -14,17 +14,30 @@
 # limitations under the License.
 # =========================================================================
 
+import collections
+import copy
+import threading
+import time
 from oslo_config import cfg
 from neutron.plugins.ml2.driver_context import PluginContext, NetworkContext, \
     SubnetContext, PortContext, PortBinding
 from neutron.callbacks.resources import ROUTER_INTERFACE
 from oslo_utils.importutils import import_class
-from networking_terra.common.exceptions import ServerErrorException
+from networking_terra.common.exceptions import NotFoundException, \
+    ServerErrorException, TeardownException
+from networking_terra.common.executor import BoundedExecutor, Future, \
+    wait_all
+from networking_terra.common.instrument import counted
+from networking_terra.common.retry import cooperative_sleep
+from networking_terra.common.utils import call_client
 from oslo_log import log as logging
+from common.journal import JournaledDriver, OperationJournal
+from common.provision import TaskGraph
 
 NETWORK_TYPE_VXLAN = 'vxlan'
 NETWORK_TYPE_SUBINTERFACE = 'local'
 LOG = logging.getLogger(__name__)
+cfg.CONF.import_group("ml2_terra", "networking_terra.common.config")
 
 
 def get_driver(ml2_name, l3_name, qcext_name, config_file):
@@ -43,7 +56,20 @@ def get_driver(ml2_name, l3_name, qcext_name, config_file):
 
     ml2.initialize()
 
-    return NeutronDriver(l3, ml2, qcext)
+    driver = NeutronDriver(l3, ml2, qcext)
+    if not cfg.CONF.ml2_terra.journal_path:
+        return driver
+
+    journal = OperationJournal(
+        cfg.CONF.ml2_terra.journal_path,
+        fsync=cfg.CONF.ml2_terra.journal_fsync,
+        compact_threshold=cfg.CONF.ml2_terra.journal_compact_threshold)
+    driver = JournaledDriver(driver, journal,
+                             write_behind=cfg.CONF.ml2_terra.journal_write_behind)
+    LOG.info("recover %d journaled operations" % len(journal.pending()))
+    # calls made meanwhile wait until the replay is done or queued
+    driver.recover(background=True)
+    return driver
 
 
 class L3Context(object):
@@ -64,16 +90,56 @@ class L3Context(object):
         return str(self.__dict__)
 
 
+class Tombstone(object):
+    '''
+    vpc being deleted in background
+    '''
+
+    def __init__(self, vpc_id, l3vni, future):
+        self.vpc_id = vpc_id
+        self.l3vni = l3vni
+        self.future = future
+
+
 class NeutronDriver(object):
     def __init__(self, l3, ml2, qcext):
         self.l3 = l3
         self.ml2 = ml2
         self.qcext = qcext
+        # vpc_id -> Tombstone
+        self._tombstones = {}
+        self._tombstones_lock = threading.Lock()
+        self._background = None
 
+    def plan(self, operation, *args, **kwargs):
+        '''
+        run operation against a dry run client, nothing is sent to terra dc
+        @param snapshot: optional, {collection path: [items]} answering the
+            lookups, read from terra dc if not given
+        @return: CallRecorder with the calls operation would issue
+        '''
+        snapshot = kwargs.pop("snapshot", None)
+        client = self.qcext.client.plan_client(snapshot)
+        parts = []
+        for part in (self.l3, self.ml2, self.qcext):
+            part = copy.copy(part)
+            part.client = client
+            parts.append(part)
+        driver = copy.copy(self)
+        driver.l3, driver.ml2, driver.qcext = parts
+        # planning neither waits for nor adds deletes of the live driver
+        driver._tombstones = {}
+        driver._tombstones_lock = threading.Lock()
+        getattr(driver, operation)(*args, **kwargs)
+        return client.recorder
+
+    @counted
     def create_vpc(self, vpc_id, l3vni, user_id):
         '''
-        vpc is a VRF with l3vni used by evpn
+        vpc is a VRF with l3vni used by evpn, waits for the background
+        delete of a vpc with the same id or l3vni
         '''
+        self._wait_tombstones(vpc_id, l3vni)
         router = {"tenant": user_id,
                   "tenant_name": user_id,
                   "id": vpc_id,
@@ -84,13 +150,184 @@ class NeutronDriver(object):
 
         self.l3.create_router(router_context, vpc_id)
 
-    def delete_vpc(self, vpc_id, user_id):
+    @counted
+    def delete_vpc(self, vpc_id, user_id, cascade=False, max_workers=None,
+                   progress=None):
+        '''
+        @param cascade: delete routes, bgp peers and interfaces of the vpc
+            first, each kind listed once and deleted in parallel
+        @param progress: called with (step, None or exception) as each
+            step of cascade ends
+        @return: {step: None} of cascade
+        @raise TeardownException: some steps of cascade failed, the vpc
+            is kept and e.results has the result of each step
+        '''
+        results = {}
+        if cascade:
+            results = self._delete_vpc_children(vpc_id, max_workers,
+                                                progress)
+            failed = [step for step, e in results.items() if e]
+            if failed:
+                e = TeardownException(resource="vpc %s" % vpc_id,
+                                      msg="%d steps failed: %s"
+                                      % (len(failed),
+                                         ", ".join(sorted(failed))))
+                e.results = results
+                raise e
 
         router_context = L3Context({"tenant": user_id,
                                     "id": vpc_id})
 
         self.l3.delete_router(router_context, vpc_id)
+        return results
 
+    def delete_vpc_async(self, vpc_id, user_id, cascade=False, l3vni=None):
+        '''
+        tombstone the vpc and delete it in background, the caller doesn't
+        wait for terra dc to release l3vni
+        @param l3vni: l3vni of the vpc, read from terra dc if not given
+        @return: Future, done once terra dc doesn't have the vpc any more
+        '''
+        client = self.qcext.client
+        try:
+            router_id = client.get_id_by_original_id("routers", vpc_id)
+        except NotFoundException:
+            future = Future()
+            future.set_result(None)
+            return future
+        if l3vni is None:
+            l3vni = (client.get_router(router_id) or {}).get("cisco:l3_vni")
+
+        def delete():
+            self.delete_vpc(vpc_id, user_id, cascade=cascade)
+            self._wait_router_removed(vpc_id, router_id)
+
+        with self._tombstones_lock:
+            if self._background is None:
+                self._background = BoundedExecutor(
+                    cfg.CONF.ml2_terra.bulk_max_workers,
+                    name="terra-delete")
+            future = self._background.submit(delete)
+            tombstone = Tombstone(vpc_id, l3vni, future)
+            self._tombstones[vpc_id] = tombstone
+
+        def done(future):
+            with self._tombstones_lock:
+                if self._tombstones.get(vpc_id) is tombstone:
+                    del self._tombstones[vpc_id]
+            if future.exception():
+                LOG.error("failed to delete vpc [%s] in background: %s"
+                          % (vpc_id, future.exception()))
+
+        future.add_done_callback(done)
+        return future
+
+    def _wait_router_removed(self, vpc_id, router_id):
+        client = self.qcext.client
+        deadline = time.time() + cfg.CONF.ml2_terra.vpc_delete_timeout
+        while True:
+            try:
+                client.get_router(router_id)
+            except NotFoundException:
+                LOG.info("vpc [%s] is removed from terra dc" % vpc_id)
+                return
+            if time.time() >= deadline:
+                raise TeardownException(
+                    resource="vpc %s" % vpc_id,
+                    msg="still in terra dc after %ss"
+                        % cfg.CONF.ml2_terra.vpc_delete_timeout)
+            cooperative_sleep(cfg.CONF.ml2_terra.vpc_delete_poll_interval)
+
+    def _wait_tombstones(self, vpc_id, l3vni):
+        with self._tombstones_lock:
+            tombstones = [t for t in self._tombstones.values()
+                          if t.vpc_id == vpc_id or
+                          (l3vni and t.l3vni == l3vni)]
+        for tombstone in tombstones:
+            LOG.info("vpc [%s] waits for delete of vpc [%s]"
+                     % (vpc_id, tombstone.vpc_id))
+            error = tombstone.future.exception()
+            if error:
+                LOG.warn("delete of vpc [%s] failed: %s"
+                         % (tombstone.vpc_id, error))
+            # waiters may wake up before the done callback drops it
+            with self._tombstones_lock:
+                if self._tombstones.get(tombstone.vpc_id) is tombstone:
+                    del self._tombstones[tombstone.vpc_id]
+
+    def _delete_vpc_children(self, vpc_id, max_workers=None, progress=None):
+        client = self.qcext.client
+        try:
+            router_id = client.get_id_by_original_id("routers", vpc_id)
+        except NotFoundException:
+            return {}
+
+        results = {}
+
+        def run(step, func, *args):
+            try:
+                func(*args)
+                error = None
+            except NotFoundException:
+                error = None
+            except Exception as e:
+                LOG.error("failed to delete %s of vpc [%s]: %s"
+                          % (step, vpc_id, e))
+                error = e
+            results[step] = error
+            if progress:
+                progress(step, error)
+
+        # parallel deletes keep the device busy, BadRequests are retried as
+        # by the serial delete_routes and remove_router_interface
+        def delete(method, *args):
+            call_client(method, *args, retry_badreq=10)
+
+        def remove_interface(intf):
+            call_client(client.del_router_interface_by_id, router_id,
+                        intf.get("subnet_id"), intf.get("port_id"),
+                        retry_badreq=10)
+            # as remove_router_interface, the port goes with interface
+            if intf.get("port_id"):
+                try:
+                    client.delete_port_by_id(intf["port_id"])
+                except NotFoundException:
+                    pass
+
+        executor = BoundedExecutor(
+            max_workers or cfg.CONF.ml2_terra.bulk_max_workers,
+            name="terra-teardown")
+        try:
+            routes, peers, interfaces = wait_all([
+                executor.submit(client.list_router_routes, router_id),
+                executor.submit(client.get_router_bgp_peers, vpc_id),
+                executor.submit(client.get_router_interfaces, router_id)])
+            LOG.info("delete vpc [%s]: %d routes, %d bgp peers, "
+                     "%d interfaces" % (vpc_id, len(routes or []),
+                                        len(peers or []),
+                                        len(interfaces or [])))
+            # routes and peers may go through interfaces, remove them first
+            futures = []
+            for route in routes or []:
+                futures.append(executor.submit(
+                    run, "route:%s:%s" % (route.get("destination"),
+                                          route["id"]),
+                    delete, client.delete_router_route, router_id,
+                    route["id"]))
+            for peer in peers or []:
+                futures.append(executor.submit(
+                    run, "bgp_peer:%s" % peer["id"],
+                    delete, client.delete_router_bgp_peer, vpc_id,
+                    peer["id"]))
+            wait_all(futures)
+            wait_all([executor.submit(
+                run, "interface:%s" % intf.get("subnet_id"),
+                remove_interface, intf) for intf in interfaces or []])
+        finally:
+            executor.shutdown(wait=False)
+        return results
+
+    @counted
     def create_vxnet(self, vxnet_id, vni, ip_network, gateway_ip, user_id,
                      network_type=NETWORK_TYPE_VXLAN, enable_dhcp=False):
         '''
@@ -125,6 +362,90 @@ class NeutronDriver(object):
         self.ml2.create_subnet_precommit(subnet_context)
         self.ml2.create_subnet_postcommit(subnet_context)
 
+    @counted
+    def provision_vpc(self, vpc_id, l3vni, user_id, border_leaves=(),
+                      vxnets=(), max_workers=None):
+        '''
+        build a whole vpc, steps not depending on each other (eg: the
+        branches of each border leaf) run concurrently. When a step fails,
+        the completed steps are rolled back and ProvisionException raised.
+
+        @param border_leaves: eg: [
+        {
+          "switch_name": "Border-Leaf-92160.01",
+          "interface_name": "Ethernet1/48",
+          "network_id": "vxnet-ks_169.254.1.1",
+          "ip_network": "169.254.1.0/24",
+          "ip_address": "169.254.1.1",
+          "vlan_id": 2,
+          "nexthop": "169.254.1.2",
+          "routes": ["172.31.0.0/16", "0.0.0.0/0"]
+        }
+      ]
+        @param vxnets: eg: [
+        {
+          "vxnet_id": "vxnet-ks",
+          "vni": 65533,
+          "ip_network": "172.31.21.0/24",
+          "gateway_ip": "172.31.21.1",
+          "network_type": "vxlan",   # optional
+          "enable_dhcp": True        # optional
+        }
+      ]
+        @return: names of the steps in order of completion
+        '''
+        graph = TaskGraph()
+        vpc = graph.add("vpc:%s" % vpc_id, self.create_vpc,
+                        args=(vpc_id, l3vni, user_id),
+                        undo=self.delete_vpc, undo_args=(vpc_id, user_id))
+
+        for leaf in border_leaves:
+            network_id = leaf["network_id"]
+            net = graph.add("vxnet:%s" % network_id, self.create_vxnet,
+                            args=(network_id, None, leaf["ip_network"],
+                                  leaf["ip_address"], user_id),
+                            kwargs={"network_type": NETWORK_TYPE_SUBINTERFACE},
+                            undo=self.delete_vxnet,
+                            undo_args=(network_id, user_id))
+            subintf = graph.add("subintf:%s" % network_id, self.add_subintf,
+                                args=(vpc_id, network_id, leaf["ip_address"],
+                                      leaf["switch_name"],
+                                      leaf["interface_name"],
+                                      leaf["vlan_id"], user_id),
+                                requires=[vpc, net],
+                                undo=self.delete_subintf,
+                                undo_args=(vpc_id, network_id))
+            for destination in leaf.get("routes", []):
+                graph.add("route:%s:%s" % (network_id, destination),
+                          self.add_route,
+                          args=(vpc_id, destination, leaf["nexthop"],
+                                leaf["switch_name"]),
+                          requires=[subintf],
+                          undo=self.delete_routes,
+                          undo_args=(vpc_id,),
+                          undo_kwargs={"destination": destination})
+
+        for vxnet in vxnets:
+            vxnet_id = vxnet["vxnet_id"]
+            net = graph.add("vxnet:%s" % vxnet_id, self.create_vxnet,
+                            args=(vxnet_id, vxnet["vni"], vxnet["ip_network"],
+                                  vxnet["gateway_ip"], user_id),
+                            kwargs={"network_type":
+                                    vxnet.get("network_type",
+                                              NETWORK_TYPE_VXLAN),
+                                    "enable_dhcp":
+                                    vxnet.get("enable_dhcp", False)},
+                            undo=self.delete_vxnet,
+                            undo_args=(vxnet_id, user_id))
+            graph.add("join:%s" % vxnet_id, self.join_vpc,
+                      args=(vpc_id, vxnet_id, user_id),
+                      requires=[vpc, net],
+                      undo=self.leave_vpc,
+                      undo_args=(vpc_id, vxnet_id, user_id))
+
+        return graph.run(max_workers or cfg.CONF.ml2_terra.bulk_max_workers)
+
+    @counted
     def delete_vxnet(self, vxnet_id, user_id):
 
         network = {"tenant_id": user_id,
@@ -147,6 +468,7 @@ class NeutronDriver(object):
         self.ml2.delete_network_precommit(network_context)
         self.ml2.delete_network_postcommit(network_context)
 
+    @counted
     def join_vpc(self, vpc_id, subnet_id, user_id):
         '''
         add network to VRF
@@ -156,6 +478,7 @@ class NeutronDriver(object):
         self.l3.add_router_interface(interface_context, vpc_id,
                                      None)
 
+    @counted
     def leave_vpc(self, vpc_id, vxnet_id, user_id):
 
         interface_context = L3Context({'subnet_id': vxnet_id})
@@ -163,6 +486,7 @@ class NeutronDriver(object):
         self.l3.remove_router_interface(interface_context, vpc_id,
                                         None)
 
+    @counted
     def add_subintf(self, vpc_id, network_id, ip_address,
                     switch_name, interface_name, vlan_id, user_id):
 
@@ -175,6 +499,7 @@ class NeutronDriver(object):
         self.l3.add_router_interface(L3Context(interface_info), vpc_id,
                                      interface_info)
 
+    @counted
     def delete_subintf(self, vpc_id, network_id):
         interface_info = {"port_id": network_id,
                           "subnet_id": network_id}
@@ -182,11 +507,21 @@ class NeutronDriver(object):
         self.l3.remove_router_interface(L3Context(interface_info), vpc_id,
                                         interface_info)
 
+    def _get_binding_profile(self, connection):
+        if not connection:
+            return {}
+        switch_name, interface_name = connection
+        return {"local_link_information": [{"switch_info": switch_name,
+                                            "port_id": interface_name}]}
+
+    @counted
     def add_node(self, vxnet_id, vni, host, user_id, vlan_id,
-                 native_vlan=True):
+                 native_vlan=True, connection=None):
         '''
         @param native_vlan: True, for baremetal
                             False, for hypervisor
+        @param connection: (switch name, interface name) the host is
+            linked to, looked up by the mechanism driver if not given
         '''
 
         network = {"tenant_id": user_id,
@@ -201,7 +536,8 @@ class NeutronDriver(object):
                 'network_id': vxnet_id,
                 'device_owner': ROUTER_INTERFACE,
                 'device_id': vxnet_id,
-                'native_vlan': native_vlan}
+                'native_vlan': native_vlan,
+                'binding:profile': self._get_binding_profile(connection)}
 
         binding = PortBinding(host=host)
 
@@ -209,7 +545,11 @@ class NeutronDriver(object):
                                    plugin_context=PluginContext(user_id))
         self.ml2.bind_port(port_context)
 
-    def remove_node(self, vxnet_id, host, user_id):
+    @counted
+    def remove_node(self, vxnet_id, host, user_id, connection=None):
+        '''
+        @param connection: see add_node
+        '''
 
         network = {"tenant_id": user_id,
                    "id": vxnet_id,
@@ -219,26 +559,96 @@ class NeutronDriver(object):
                 "id": self._get_port_id(vxnet_id, host),
                 'network_id': vxnet_id,
                 'device_owner': ROUTER_INTERFACE,
-                'device_id': vxnet_id}
+                'device_id': vxnet_id,
+                'binding:profile': self._get_binding_profile(connection)}
         binding = PortBinding(host=host)
         port_context = PortContext(port, network, binding)
 
         self.ml2.delete_port_precommit(port_context)
         self.ml2.delete_port_postcommit(port_context)
 
+    @counted
+    def add_nodes(self, vxnet_id, vni, hosts, user_id, vlan_id,
+                  native_vlan=True, max_workers=None):
+        '''
+        add_node for many hosts, the link of each host is looked up once.
+        Up to bulk_switch_workers hosts connected to the same switch are
+        bound at a time, different switches in parallel
+        @return: {host: None if succeeded, else the exception}
+        '''
+        def add(host, connection):
+            self.add_node(vxnet_id, vni, host, user_id, vlan_id,
+                          native_vlan=native_vlan, connection=connection)
+
+        return self._run_per_switch(hosts, add, max_workers)
+
+    @counted
+    def remove_nodes(self, vxnet_id, hosts, user_id, max_workers=None):
+        '''
+        remove_node for many hosts, see add_nodes
+        @return: {host: None if succeeded, else the exception}
+        '''
+        def remove(host, connection):
+            self.remove_node(vxnet_id, host, user_id, connection=connection)
+
+        return self._run_per_switch(hosts, remove, max_workers)
+
+    def _run_per_switch(self, hosts, func, max_workers=None):
+        results = {}
+        groups = collections.OrderedDict()
+        for host in hosts:
+            try:
+                connection = self.ml2.get_host_switch_connection(host)
+            except Exception as e:
+                results[host] = e
+                continue
+            groups.setdefault(connection[0], []).append((host, connection))
+
+        # terra dc rejects concurrent changes of one device as busy, so
+        # hosts of a switch are split in at most bulk_switch_workers
+        # lanes, each run one host after another
+        per_switch = max(1, cfg.CONF.ml2_terra.bulk_switch_workers)
+        lanes = []
+        for group in groups.values():
+            lanes.extend(group[i::per_switch]
+                         for i in range(min(per_switch, len(group))))
+
+        def run_lane(lane):
+            for host, connection in lane:
+                try:
+                    func(host, connection)
+                    results[host] = None
+                except Exception as e:
+                    LOG.error("failed to %s host [%s]: %s"
+                              % (func.__name__, host, e))
+                    results[host] = e
+
+        executor = BoundedExecutor(
+            max_workers or cfg.CONF.ml2_terra.bulk_max_workers,
+            name="terra-bulk")
+        try:
+            wait_all([executor.submit(run_lane, lane) for lane in lanes])
+        finally:
+            executor.shutdown(wait=False)
+        return results
+
     def _get_port_id(self, vxnet_id, host):
         return "%s_%s" % (vxnet_id, host)
 
+    @counted
     def create_host(self, hostname, mgmt_ip, connections):
         return self.qcext.create_host(hostname, mgmt_ip,
                                       connections)
 
+    @counted
     def add_route(self, vpc_id, destination, nexthop, device_name):
         return self.qcext.add_route(vpc_id, destination, nexthop, device_name)
 
+    @counted
     def delete_routes(self, vpc_id, destination=None):
         return self.qcext.delete_routes(vpc_id, destination=destination)
 
+    @counted
     def get_host(self, hostname):
 
         try:
@@ -249,6 +659,7 @@ class NeutronDriver(object):
 
         return None
 
+    @counted
     def delete_host(self, hostname):
         return self.qcext.delete_host(hostname)
 
@@ -0,0 +1,149 @@
+# =========================================================================
+# Copyright 2012-present Yunify, Inc.
+# -------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =========================================================================
+
+import collections
+from six.moves import queue
+from oslo_log import log as logging
+from networking_terra.common.exceptions import ProvisionException
+from networking_terra.common.executor import BoundedExecutor
+
+LOG = logging.getLogger(__name__)
+
+
+class Task(object):
+    def __init__(self, name, func, args=(), kwargs=None, requires=(),
+                 undo=None, undo_args=(), undo_kwargs=None):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.requires = list(requires)
+        self.undo = undo
+        self.undo_args = undo_args
+        self.undo_kwargs = undo_kwargs or {}
+
+    def __str__(self):
+        return self.name
+
+
+class TaskGraph(object):
+    '''
+    steps with dependencies, a step starts as soon as all steps it
+    requires are done so independent steps run concurrently.
+
+    When a step fails, steps not started yet are skipped and the undo of
+    the completed steps is called in reverse order of completion.
+    '''
+
+    def __init__(self):
+        self.tasks = collections.OrderedDict()
+
+    def add(self, name, func, args=(), kwargs=None, requires=(),
+            undo=None, undo_args=(), undo_kwargs=None):
+        if name in self.tasks:
+            raise ValueError("duplicated task %s" % name)
+        self.tasks[name] = Task(name, func, args, kwargs, requires,
+                                undo, undo_args, undo_kwargs)
+        return name
+
+    def _check(self):
+        for task in self.tasks.values():
+            for name in task.requires:
+                if name not in self.tasks:
+                    raise ValueError("%s requires unknown task %s"
+                                     % (task.name, name))
+        # kahn's algorithm, a cycle leaves tasks with requirements
+        pending = dict((t.name, set(t.requires)) for t in self.tasks.values())
+        ready = [name for name, reqs in pending.items() if not reqs]
+        while ready:
+            done = ready.pop()
+            del pending[done]
+            for name, reqs in pending.items():
+                if done in reqs:
+                    reqs.discard(done)
+                    if not reqs:
+                        ready.append(name)
+        if pending:
+            raise ValueError("tasks have cyclic dependency: %s"
+                             % ", ".join(sorted(pending)))
+
+    def run(self, max_workers=8):
+        '''
+        @return: names of steps in order of completion
+        @raise ProvisionException: a step failed, completed steps are
+            rolled back
+        '''
+        self._check()
+        completed = []
+        started = set()
+        finished = queue.Queue()
+        running = 0
+        failure = None
+
+        executor = BoundedExecutor(max_workers, name="terra-provision")
+        try:
+            while True:
+                if failure is None:
+                    for task in self.tasks.values():
+                        if task.name in started or \
+                                not all(r in completed for r in task.requires):
+                            continue
+                        started.add(task.name)
+                        running += 1
+                        LOG.debug("start step %s" % task.name)
+                        future = executor.submit(task.func, *task.args,
+                                                 **task.kwargs)
+                        future.add_done_callback(
+                            lambda f, name=task.name: finished.put((name, f)))
+                if not running:
+                    break
+                name, future = finished.get()
+                running -= 1
+                error = future.exception()
+                if error is None:
+                    completed.append(name)
+                elif failure is None:
+                    LOG.error("step %s failed: %s" % (name, error))
+                    failure = (name, error)
+                else:
+                    LOG.error("step %s failed too: %s" % (name, error))
+        finally:
+            executor.shutdown(wait=False)
+
+        if failure is None:
+            return completed
+
+        name, error = failure
+        rolled_back = self.rollback(completed)
+        e = ProvisionException(task=name, msg=error)
+        e.task = name
+        e.error = error
+        e.completed = completed
+        e.rolled_back = rolled_back
+        raise e
+
+    def rollback(self, completed):
+        rolled_back = []
+        for name in reversed(completed):
+            task = self.tasks[name]
+            if not task.undo:
+                continue
+            try:
+                task.undo(*task.undo_args, **task.undo_kwargs)
+                rolled_back.append(name)
+            except Exception as e:
+                LOG.error("failed to roll back step %s: %s" % (name, e))
+        return rolled_back
@@ -0,0 +1,430 @@
+# =========================================================================
+# Copyright 2012-present Yunify, Inc.
+# -------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =========================================================================
+
+from oslo_config import cfg
+from oslo_log import log as logging
+from networking_terra.common.client import TerraRestClient
+from networking_terra.common.exceptions import SkippedException
+from networking_terra.common.executor import BoundedExecutor
+
+LOG = logging.getLogger(__name__)
+cfg.CONF.import_group("ml2_terra", "networking_terra.common.config")
+
+# steps of a phase run in parallel, phases one after another
+PHASES = [
+    ("remove_node", "delete_routes"),
+    ("delete_vxnet",),
+    ("delete_vpc", "delete_host"),
+    ("create_host", "create_vpc", "create_vxnet"),
+    ("add_node", "add_route"),
+]
+
+# fields required in the items of each section of the desired state
+REQUIRED_FIELDS = {
+    "vpcs": ("l3vni", "user_id"),
+    "vxnets": ("ip_network", "gateway_ip", "user_id"),
+    "hosts": ("mgmt_ip", "connections"),
+}
+ROUTE_FIELDS = ("destination", "nexthop", "device_name")
+
+
+class Step(object):
+    def __init__(self, operation, *args, **kwargs):
+        self.operation = operation
+        self.args = args
+        self.kwargs = kwargs
+        # steps of earlier phases which must succeed before this one
+        self.requires = []
+
+    def __str__(self):
+        args = [repr(a) for a in self.args] + \
+               ["%s=%r" % (k, v) for k, v in sorted(self.kwargs.items())]
+        return "%s(%s)" % (self.operation, ", ".join(args))
+
+    def __repr__(self):
+        return str(self)
+
+
+class Plan(object):
+    '''
+    NeutronDriver steps turning terra dc configuration into the desired
+    state, and differences which can't be repaired safely, eg: a vpc with
+    another l3vni, which are only reported
+    '''
+
+    def __init__(self):
+        self.steps = []
+        self.conflicts = []
+
+    def add(self, operation, *args, **kwargs):
+        '''
+        @return: the Step added
+        '''
+        step = Step(operation, *args, **kwargs)
+        self.steps.append(step)
+        return step
+
+    def find(self, operation, *args, **kwargs):
+        '''
+        @return: steps of operation whose arguments start with args and
+            include kwargs
+        '''
+        return [s for s in self.steps
+                if s.operation == operation and
+                s.args[:len(args)] == args and
+                all(s.kwargs.get(k) == v for k, v in kwargs.items())]
+
+    def phases(self):
+        for operations in PHASES:
+            steps = [s for s in self.steps if s.operation in operations]
+            if steps:
+                yield steps
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __str__(self):
+        return "\n".join(str(s) for phase in self.phases() for s in phase)
+
+
+class Reconciler(object):
+    '''
+    compare the desired state with what terra dc has for our origin and
+    repair the differences through NeutronDriver.
+
+    Desired state is a dict:
+        {"vpcs": {vpc_id: {"l3vni": 3001, "user_id": "usr-x"}},
+         "vxnets": {vxnet_id: {"vni": 2001, "ip_network": "10.0.0.0/24",
+                               "gateway_ip": "10.0.0.1", "user_id": "usr-x",
+                               "network_type": "vxlan", "enable_dhcp": False}},
+         "nodes": {(vxnet_id, host): {"vlan_id": 100, "native_vlan": True}},
+         "routes": {vpc_id: [{"destination": "0.0.0.0/0",
+                              "nexthop": "10.0.0.254",
+                              "device_name": "leaf1"}]},
+         "hosts": {hostname: {"mgmt_ip": "10.1.1.1",
+                              "connections": [host link, ...]}}}
+    a missing section is left as it is, except vxnets which nodes need.
+    Each collection is listed once, a page of list_page_size items per
+    request, plus the routes of each desired vpc and the tenants owning
+    what is removed, so the number of calls doesn't grow with drift.
+    '''
+
+    def __init__(self, driver, client=None, max_workers=None):
+        self.driver = driver
+        self.client = client or TerraRestClient.get_client()
+        self.max_workers = max_workers or cfg.CONF.ml2_terra.bulk_max_workers
+
+    def _list(self, resource, **filters):
+        return self.client.list_resources(resource, **filters)
+
+    def validate(self, desired):
+        '''
+        raise ValueError if desired state is incomplete, eg: nodes of
+        vxnets missing from vxnets, before anything is planned
+        '''
+        errors = []
+        for section, fields in sorted(REQUIRED_FIELDS.items()):
+            for key, item in sorted(desired.get(section, {}).items()):
+                missing = [f for f in fields if f not in item]
+                if missing:
+                    errors.append("%s %s without %s"
+                                  % (section, key, ", ".join(missing)))
+        for vpc_id, routes in sorted(desired.get("routes", {}).items()):
+            for route in routes:
+                missing = [f for f in ROUTE_FIELDS if f not in route]
+                if missing:
+                    errors.append("route %s of %s without %s"
+                                  % (route, vpc_id, ", ".join(missing)))
+        vxnets = desired.get("vxnets", {})
+        for vxnet_id, host in sorted(desired.get("nodes", {})):
+            if vxnet_id not in vxnets:
+                errors.append("node %s of vxnet %s missing from vxnets"
+                              % (host, vxnet_id))
+        if errors:
+            raise ValueError("invalid desired state: %s" % "; ".join(errors))
+
+    def _owner(self, actual, item):
+        '''
+        original id of the user owning a router or network of terra dc
+        '''
+        if "tenants" not in actual:
+            actual["tenants"] = dict(
+                (t["id"], t.get("original_id")) for t in
+                self._list("tenants", origin=self.client.origin_name))
+        return actual["tenants"].get(item.get("tenant_id"))
+
+    def _by_original_id(self, items):
+        return dict((i["original_id"], i) for i in items
+                    if i.get("original_id"))
+
+    def load_actual(self, desired):
+        origin = self.client.origin_name
+        actual = {}
+        if "vpcs" in desired or "routes" in desired:
+            actual["routers"] = self._by_original_id(
+                self._list("routers", origin=origin))
+        if "vxnets" in desired or "nodes" in desired:
+            actual["networks"] = self._by_original_id(
+                self._list("networks", origin=origin))
+            actual["subnets"] = self._by_original_id(
+                self._list("subnets", origin=origin))
+        if "nodes" in desired or "hosts" in desired:
+            actual["host_links"] = self._list("host_links")
+        if "nodes" in desired:
+            ours = set(n["id"] for n in actual["networks"].values())
+            actual["port_bindings"] = [
+                b for b in self._list("port_bindings")
+                if b.get("network_id") in ours]
+        if "hosts" in desired:
+            actual["hosts"] = dict((h.get("hostname"), h)
+                                   for h in self._list("hosts"))
+        if "routes" in desired:
+            routers = actual["routers"]
+            vpcs = [v for v in desired["routes"] if v in routers]
+            executor = BoundedExecutor(self.max_workers,
+                                       name="terra-reconcile")
+            try:
+                routes = executor.map(
+                    lambda v: self.client.list_router_routes(
+                        routers[v]["id"]), vpcs)
+            finally:
+                executor.shutdown(wait=False)
+            actual["routes"] = dict(zip(vpcs, routes))
+        return actual
+
+    def plan(self, desired, actual=None):
+        self.validate(desired)
+        if actual is None:
+            actual = self.load_actual(desired)
+        plan = Plan()
+        # vxnets and hosts whose nodes must be bound again
+        rebind_vxnets = set()
+        rebind_hosts = set()
+
+        if "hosts" in desired:
+            rebind_hosts = self._plan_hosts(plan, desired, actual)
+        if "vpcs" in desired:
+            self._plan_vpcs(plan, desired, actual)
+        if "vxnets" in desired:
+            rebind_vxnets = self._plan_vxnets(plan, desired, actual)
+        if "nodes" in desired:
+            self._plan_nodes(plan, desired, actual,
+                             rebind_vxnets, rebind_hosts)
+        if "routes" in desired:
+            self._plan_routes(plan, desired, actual)
+        return plan
+
+    def _plan_hosts(self, plan, desired, actual):
+        def link_key(link):
+            return (link.get("host_interface_name"),
+                    link.get("switch_name"),
+                    link.get("switch_interface_name"))
+
+        present = {}
+        for link in actual["host_links"]:
+            present.setdefault(link.get("host_name"), set()).add(
+                link_key(link))
+        changed = set()
+        for hostname, host in desired["hosts"].items():
+            links = set(link_key(l) for l in host["connections"])
+            if hostname not in actual["hosts"] and hostname not in present:
+                plan.add("create_host", hostname, host["mgmt_ip"],
+                         host["connections"])
+            elif present.get(hostname) != links:
+                changed.add(hostname)
+                delete = plan.add("delete_host", hostname)
+                create = plan.add("create_host", hostname, host["mgmt_ip"],
+                                  host["connections"])
+                create.requires.append(delete)
+        # host links don't carry origin, so hosts which are not desired
+        # may belong to someone else and are left as they are
+        return changed
+
+    def _plan_vpcs(self, plan, desired, actual):
+        routers = actual["routers"]
+        for vpc_id, vpc in desired["vpcs"].items():
+            router = routers.get(vpc_id)
+            if not router:
+                plan.add("create_vpc", vpc_id, vpc["l3vni"], vpc["user_id"])
+            elif router.get("cisco:l3_vni") not in (None, vpc["l3vni"]):
+                plan.conflicts.append(
+                    "vpc %s has l3vni %s instead of %s"
+                    % (vpc_id, router["cisco:l3_vni"], vpc["l3vni"]))
+        for vpc_id, router in routers.items():
+            if vpc_id not in desired["vpcs"]:
+                # routes, bgp peers and interfaces left on the vpc go with
+                # it, whether or not they are planned for removal
+                plan.add("delete_vpc", vpc_id, self._owner(actual, router),
+                         cascade=True)
+
+    def _plan_vxnets(self, plan, desired, actual):
+        networks = actual["networks"]
+        subnets = actual["subnets"]
+        recreated = set()
+        for vxnet_id, vxnet in desired["vxnets"].items():
+            network = networks.get(vxnet_id)
+            subnet = subnets.get(vxnet_id)
+            if network and subnet:
+                diff = []
+                if network.get("segment:global_id") not in \
+                        (None, vxnet.get("vni")):
+                    diff.append("vni %s" % network["segment:global_id"])
+                if subnet.get("cidr") not in (None, vxnet["ip_network"]):
+                    diff.append("cidr %s" % subnet["cidr"])
+                if diff:
+                    plan.conflicts.append("vxnet %s has %s"
+                                          % (vxnet_id, ", ".join(diff)))
+                continue
+            if network or subnet:
+                # left partial by a failed create_vxnet
+                plan.add("delete_vxnet", vxnet_id, vxnet["user_id"])
+                recreated.add(vxnet_id)
+            kwargs = dict((k, vxnet[k]) for k in ("network_type",
+                                                  "enable_dhcp")
+                          if k in vxnet)
+            create = plan.add("create_vxnet", vxnet_id, vxnet.get("vni"),
+                              vxnet["ip_network"], vxnet["gateway_ip"],
+                              vxnet["user_id"], **kwargs)
+            create.requires.extend(plan.find("delete_vxnet", vxnet_id))
+        for vxnet_id in set(networks) | set(subnets):
+            if vxnet_id not in desired["vxnets"]:
+                plan.add("delete_vxnet", vxnet_id, self._owner(
+                    actual, networks.get(vxnet_id) or subnets[vxnet_id]))
+        return recreated
+
+    def _plan_nodes(self, plan, desired, actual, rebind_vxnets,
+                    rebind_hosts):
+        vxnets = desired.get("vxnets", {})
+        by_uuid = dict((n["id"], vxnet_id)
+                       for vxnet_id, n in actual["networks"].items())
+        hosts = {}
+        for link in actual["host_links"]:
+            key = (link.get("switch_name"), link.get("switch_interface_name"))
+            hosts.setdefault(key, []).append(link.get("host_name"))
+
+        bound = {}
+        for binding in actual["port_bindings"]:
+            key = (binding.get("switch_name"), binding.get("interface_name"))
+            vxnet_id = by_uuid[binding["network_id"]]
+            for host in hosts.get(key, []):
+                bound[(vxnet_id, host)] = binding
+
+        def user_of(vxnet_id):
+            if vxnet_id in vxnets:
+                return vxnets[vxnet_id]["user_id"]
+            return self._owner(actual, actual["networks"][vxnet_id])
+
+        for (vxnet_id, host), binding in sorted(bound.items()):
+            node = desired["nodes"].get((vxnet_id, host))
+            if node is None or vxnet_id in rebind_vxnets or \
+                    host in rebind_hosts:
+                remove = plan.add("remove_node", vxnet_id, host,
+                                  user_of(vxnet_id))
+            elif binding.get("local_vlan_id") not in \
+                    (None, node.get("vlan_id")):
+                remove = plan.add("remove_node", vxnet_id, host,
+                                  user_of(vxnet_id))
+                rebind_hosts.add(host)
+            else:
+                continue
+            for delete in plan.find("delete_vxnet", vxnet_id):
+                delete.requires.append(remove)
+
+        for (vxnet_id, host), node in sorted(desired["nodes"].items()):
+            if (vxnet_id, host) in bound and vxnet_id not in rebind_vxnets \
+                    and host not in rebind_hosts:
+                continue
+            add = plan.add("add_node", vxnet_id, vxnets[vxnet_id].get("vni"),
+                           host, user_of(vxnet_id), node.get("vlan_id"),
+                           native_vlan=node.get("native_vlan", True))
+            add.requires.extend(plan.find("create_vxnet", vxnet_id) +
+                                plan.find("create_host", host) +
+                                plan.find("remove_node", vxnet_id, host))
+
+    def _plan_routes(self, plan, desired, actual):
+        devices = {}
+
+        def device_id(name):
+            if name not in devices:
+                devices[name] = self.client.get_switch(name)["id"]
+            return devices[name]
+
+        for vpc_id, routes in desired["routes"].items():
+            present = actual["routes"].get(vpc_id, [])
+            wanted = set((r["destination"], r["nexthop"],
+                          device_id(r["device_name"])) for r in routes)
+            have = set((r.get("destination"), r.get("nexthop"),
+                        r.get("device_id")) for r in present)
+            # delete_routes works on a whole destination, so routes
+            # sharing it with an extra route are added again
+            stale = set(r[0] for r in have - wanted)
+            for destination in sorted(stale):
+                plan.add("delete_routes", vpc_id, destination=destination)
+            for route in routes:
+                key = (route["destination"], route["nexthop"],
+                       device_id(route["device_name"]))
+                if key in have and route["destination"] not in stale:
+                    continue
+                add = plan.add("add_route", vpc_id, route["destination"],
+                               route["nexthop"], route["device_name"])
+                add.requires.extend(
+                    plan.find("create_vpc", vpc_id) +
+                    plan.find("delete_routes", vpc_id,
+                              destination=route["destination"]))
+
+    def apply(self, plan):
+        '''
+        run the steps of plan, phase after phase, skipping the steps
+        whose required steps failed or were skipped
+        @return: {step: None if succeeded, else the exception}
+        '''
+        results = {}
+
+        def run(step):
+            failed = [str(s) for s in step.requires
+                      if results.get(str(s)) is not None]
+            if failed:
+                LOG.warn("skip %s, %s failed" % (step, ", ".join(failed)))
+                results[str(step)] = SkippedException(
+                    step=step, msg="%s failed" % ", ".join(failed))
+                return
+            try:
+                getattr(self.driver, step.operation)(*step.args,
+                                                     **step.kwargs)
+                results[str(step)] = None
+            except Exception as e:
+                LOG.error("failed to %s: %s" % (step, e))
+                results[str(step)] = e
+
+        executor = BoundedExecutor(self.max_workers, name="terra-reconcile")
+        try:
+            for phase in plan.phases():
+                executor.map(run, phase)
+        finally:
+            executor.shutdown(wait=False)
+        return results
+
+    def reconcile(self, desired, dry_run=False):
+        '''
+        @return: (plan, results of apply, None for dry_run)
+        '''
+        plan = self.plan(desired)
+        for conflict in plan.conflicts:
+            LOG.warn("reconcile conflict: %s" % conflict)
+        LOG.info("reconcile plan of %d steps:\n%s" % (len(plan), plan))
+        if dry_run:
+            return plan, None
+        return plan, self.apply(plan)
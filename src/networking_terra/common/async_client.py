@@ -0,0 +1,59 @@
+# Copyright (c) 2017 Tethrnet Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import functools
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from networking_terra.common.client import TerraRestClient
+from networking_terra.common.executor import BoundedExecutor
+from networking_terra.common.utils import call_client
+
+LOG = logging.getLogger(__name__)
+cfg.CONF.import_group("ml2_terra", "networking_terra.common.config")
+
+
+class AsyncTerraRestClient(object):
+    '''
+    non blocking counterpart of TerraRestClient.
+
+    Every public method of TerraRestClient (create_network,
+    create_port_binding, add_router_interface, ...) is available with the
+    same arguments plus the retry_badreq/retry_policy of call_client, and
+    returns a Future instead of blocking the caller. Calls run on a
+    bounded pool of workers sharing the token, connection pool, caches
+    and error mapping of the wrapped sync client, so hundreds of
+    concurrent operations need only async_max_workers threads (green
+    threads when eventlet monkey patching is enabled).
+    '''
+
+    def __init__(self, client=None, max_workers=None):
+        self.client = client or TerraRestClient.get_client()
+        self.executor = BoundedExecutor(
+            max_workers or cfg.CONF.ml2_terra.async_max_workers,
+            name="terra-async")
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def submit(*args, **kwargs):
+            return self.executor.submit(call_client, attr, *args, **kwargs)
+
+        return submit
+
+    def close(self):
+        self.executor.shutdown()
@@ -0,0 +1,135 @@
+# Copyright (c) 2017 Tethrnet Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import collections
+import sys
+import threading
+import time
+
+import six
+
+
+class TTLCache(object):
+    '''
+    thread safe cache bounded by size (least recently used entry is
+    evicted first) and by time to live of each entry
+    '''
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None:
+                return default
+            value, expires = item
+            if self.ttl and time.time() >= expires:
+                return default
+            # move to most recently used
+            self._data[key] = item
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, time.time() + self.ttl)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+        return item[0] if item else None
+
+    def pop_value(self, value):
+        '''
+        remove the entries of value, return their keys
+        '''
+        with self._lock:
+            keys = [key for key, item in self._data.items()
+                    if item[0] == value]
+            for key in keys:
+                del self._data[key]
+        return keys
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def copy(self):
+        '''
+        return a cache with the entries of this one, expiring at the same
+        time
+        '''
+        cache = TTLCache(self.maxsize, self.ttl)
+        with self._lock:
+            cache._data = collections.OrderedDict(self._data)
+        return cache
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _Call(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.exc_info = None
+
+
+class SingleFlight(object):
+    '''
+    run a function only once for concurrent callers with the same key,
+    the callers arriving while it is in flight share its result or
+    exception
+    '''
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        '''
+        return (result, shared), shared is True when result comes from a
+        call issued by another caller
+        '''
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.event.wait()
+            if call.exc_info:
+                six.reraise(*call.exc_info)
+            return call.result, True
+
+        try:
+            call.result = func(*args, **kwargs)
+        except Exception:
+            call.exc_info = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, False
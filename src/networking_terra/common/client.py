@@ -15,23 +15,76 @@
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_utils import excutils
+import base64
+import collections
+import copy
 import json
+import logging as std_logging
 import requests
-import traceback
+import time
 import threading
+from requests import adapters
 from requests import exceptions as r_exec
 
+from networking_terra.common.cache import SingleFlight, TTLCache
+from networking_terra.common.dry_run import CallRecorder
+from networking_terra.common.executor import BoundedExecutor, wait_all
+from networking_terra.common import instrument
+from networking_terra.common.inventory import DeviceInventory, \
+    HostTopology
+from networking_terra.common.metrics import ClientMetrics, get_endpoint, \
+    get_sink
+from networking_terra.common.utils import truncate
 from networking_terra.common.exceptions import AuthenticationException, \
     InitializException, TimeoutException, ClientException, \
     ServerErrorException, BadRequestException, NotFoundException, \
     HTTPErrorException
-from contextlib import contextmanager
 
 LOG = logging.getLogger(__name__)
 cfg.CONF.import_group("ml2_terra", "networking_terra.common.config")
 
+# clients shared by ml2, l3 and qcext drivers in this process, keyed by
+# (url, auth_url, username, origin_name)
+_clients = {}
+_clients_lock = threading.Lock()
+
 
 class TerraRestClient(object):
+    @classmethod
+    def get_client(cls):
+        '''
+        return the client shared in process for current configuration,
+        so token, connection pool and caches are paid for only once.
+        The tenant cache is warmed up out of the registry lock: a caller
+        racing the one creating the client gets it before warm_tenant_cache
+        is done, its tenants not yet cached are then looked up on demand.
+        '''
+        key = (cfg.CONF.ml2_terra.url,
+               cfg.CONF.ml2_terra.auth_url,
+               cfg.CONF.ml2_terra.username,
+               cfg.CONF.ml2_terra.origin_name)
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is not None:
+                return client
+            client = cls.create_client()
+            _clients[key] = client
+            LOG.info("created terra dc client for %s", key[0])
+
+        if cfg.CONF.ml2_terra.tenant_cache_warmup:
+            try:
+                client.warm_tenant_cache()
+            except Exception as e:
+                LOG.warn("Failed to warm up tenant cache: %s" % e)
+        return client
+
+    @classmethod
+    def reset_clients(cls):
+        with _clients_lock:
+            for client in _clients.values():
+                client.close()
+            _clients.clear()
+
     @classmethod
     def create_client(cls):
         if not cfg.CONF.ml2_terra.url:
@@ -51,9 +104,33 @@ class TerraRestClient(object):
             cfg.CONF.ml2_terra.username,
             cfg.CONF.ml2_terra.password,
             cfg.CONF.ml2_terra.http_timeout,
-            cfg.CONF.ml2_terra.origin_name)
-
-    def __init__(self, url, auth_url, username, password, timeout, origin_name):
+            cfg.CONF.ml2_terra.origin_name,
+            pool_connections=cfg.CONF.ml2_terra.http_pool_connections,
+            pool_maxsize=cfg.CONF.ml2_terra.http_pool_maxsize,
+            keepalive=cfg.CONF.ml2_terra.http_keepalive,
+            max_idle=cfg.CONF.ml2_terra.http_max_idle,
+            token_lifetime=cfg.CONF.ml2_terra.token_lifetime,
+            token_refresh_margin=cfg.CONF.ml2_terra.token_refresh_margin,
+            id_cache_size=cfg.CONF.ml2_terra.id_cache_size,
+            id_cache_ttl=cfg.CONF.ml2_terra.id_cache_ttl,
+            device_poll_interval=cfg.CONF.ml2_terra.restconf_poll_interval,
+            host_link_max_age=cfg.CONF.ml2_terra.host_link_max_age,
+            lookup_concurrency=cfg.CONF.ml2_terra.lookup_concurrency,
+            coalesce_gets=cfg.CONF.ml2_terra.coalesce_gets,
+            list_page_size=cfg.CONF.ml2_terra.list_page_size,
+            metrics=ClientMetrics(
+                [get_sink(cfg.CONF.ml2_terra.metrics_sink)]
+                if cfg.CONF.ml2_terra.metrics_sink else [],
+                flush_interval=cfg.CONF.ml2_terra.metrics_flush_interval))
+
+    def __init__(self, url, auth_url, username, password, timeout, origin_name,
+                 pool_connections=4, pool_maxsize=16, keepalive=True,
+                 max_idle=60, token_lifetime=0, token_refresh_margin=60,
+                 id_cache_size=4096, id_cache_ttl=300,
+                 device_poll_interval=30, host_link_max_age=600,
+                 lookup_concurrency=4, coalesce_gets=True,
+                 list_page_size=500, recorder=None, metrics=None,
+                 token_refresh_backoff=10):
         if url.endswith("/"):
             self.url = url
         else:
@@ -63,29 +140,156 @@ class TerraRestClient(object):
         self.password = password
         self.timeout = timeout
         self.origin_name = origin_name
+        self.list_page_size = list_page_size
+        # CallRecorder of a dry run client, None to send calls
+        self.recorder = recorder
         self.token = None
+        self.token_expires = None
+        self.token_lifetime = token_lifetime
+        self.token_refresh_margin = token_refresh_margin
+        self._token_cond = threading.Condition(threading.Lock())
+        self._token_refreshing = False
+        self._token_generation = 0
+        # no background refresh before this time after one failed
+        self.token_refresh_backoff = token_refresh_backoff
+        self._token_refresh_after = 0
+        self._counters = collections.defaultdict(int)
+        self._counters_lock = threading.Lock()
+        # per endpoint latencies and counters, kept in memory without sinks
+        self.metrics = metrics or ClientMetrics()
+        # (resource, original_id) -> terra dc uuid
+        self._id_cache = TTLCache(id_cache_size, id_cache_ttl)
+        # keys of _id_cache used by each thread since its last write
+        self._resolved = threading.local()
+        # tenant original_id -> terra dc uuid, tenants are never deleted
+        # by this plugin so they are cached for the process lifetime
+        self._tenants = {}
+        self._tenant_flight = SingleFlight()
+        self.devices = DeviceInventory(self, device_poll_interval)
+        self.hosts = HostTopology(self, host_link_max_age)
+        # identical GETs in flight share one request
+        self.coalesce_gets = coalesce_gets
+        self._get_flight = SingleFlight()
+        # lookups only, never submit calls that would wait on this pool
+        self._lookup_executor = None
+        if lookup_concurrency > 1:
+            self._lookup_executor = BoundedExecutor(lookup_concurrency,
+                                                    name="terra-lookup")
         self.timeout_retry = 1
         self.token_retry = 1
-        self.lock = threading.RLock()
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.keepalive = keepalive
+        self.max_idle = max_idle
+        self._session_lock = threading.Lock()
+        self._session = self._build_session()
+        self._session_used = time.time()
+
+    def plan_client(self, snapshot=None):
+        '''
+        return a client in dry run mode with the settings of this one,
+        its calls are recorded in its recorder instead of being sent.
+        @param snapshot: {collection path: [items]} answering GETs, None
+            to read from terra dc through this client
+        '''
+        recorder = CallRecorder(self.url, snapshot,
+                                reader=self._get if snapshot is None
+                                else None)
+        client = TerraRestClient(
+            self.url, self.auth_url, self.username, self.password,
+            self.timeout, self.origin_name,
+            keepalive=False,
+            id_cache_size=self._id_cache.maxsize,
+            id_cache_ttl=self._id_cache.ttl,
+            device_poll_interval=self.devices.max_age,
+            host_link_max_age=self.hosts.max_age,
+            lookup_concurrency=0,
+            coalesce_gets=False,
+            list_page_size=self.list_page_size,
+            recorder=recorder)
+        if snapshot is None:
+            # start as warm as this client, so the plan only has the
+            # calls it would send
+            client._tenants = dict(self._tenants)
+            client._id_cache = self._id_cache.copy()
+            client.devices.copy_from(self.devices)
+            client.hosts.copy_from(self.hosts)
+        return client
+
+    def _build_session(self):
+        # urllib3 pools are thread safe, one session is shared by all
+        # the ml2, l3 and qcext threads calling terra dc controller
+        session = requests.Session()
+        adapter = adapters.HTTPAdapter(pool_connections=self.pool_connections,
+                                       pool_maxsize=self.pool_maxsize,
+                                       pool_block=False,
+                                       max_retries=0)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _get_session(self):
+        with self._session_lock:
+            now = time.time()
+            if self.max_idle and now - self._session_used > self.max_idle:
+                # connections idle for too long are likely closed by the
+                # server or a middle box, recycle the pool instead of
+                # failing on a dead socket
+                LOG.debug("http session idle for %ds, recycle",
+                          now - self._session_used)
+                self._session.close()
+                self._session = self._build_session()
+            self._session_used = now
+            return self._session
+
+    def close(self):
+        if self._lookup_executor:
+            self._lookup_executor.shutdown(wait=False)
+        with self._session_lock:
+            self._session.close()
+        self.metrics.close()
+
+    def _incr(self, name, value=1):
+        with self._counters_lock:
+            self._counters[name] += value
+
+    def get_stats(self):
+        with self._counters_lock:
+            return dict(self._counters)
 
     def _process_request(self, headers, method, url, payload_json, timeout=None):
-        LOG.debug("Sending request: %(method)s %(url)s %(body)s",
-                  {"method": method,
-                   "url": url,
-                   "body": payload_json})
+        if LOG.isEnabledFor(std_logging.DEBUG):
+            LOG.debug("Sending request: %(method)s %(url)s %(body)s",
+                      {"method": method,
+                       "url": url,
+                       "body": truncate(payload_json or "")})
+
+        if not self.keepalive:
+            headers = dict(headers, Connection="close")
 
+        endpoint = get_endpoint(url, self.url)
         timeout_retry = self.timeout_retry + 1
         while timeout_retry:
             try:
                 if not timeout:
                     timeout = self.timeout
-                resp = requests.request(method, url, data=payload_json,
-                                        headers=headers, timeout=timeout)
-                LOG.debug("Got response: %s, %s" % (resp.status_code, resp.text))
+                instrument.record("requests")
+                start = time.time()
+                resp = self._get_session().request(method, url,
+                                                   data=payload_json,
+                                                   headers=headers,
+                                                   timeout=timeout)
+                self.metrics.observe(method, endpoint, resp.status_code,
+                                     time.time() - start)
+                if LOG.isEnabledFor(std_logging.DEBUG):
+                    LOG.debug("Got response: %s, %s"
+                              % (resp.status_code, truncate(resp.text)))
                 return resp
             except (r_exec.Timeout, r_exec.ConnectionError) as e:
+                self.metrics.incr("timeouts", method, endpoint)
                 if timeout_retry > 1:
                     LOG.warn("Request timeout, retry: %s" % e)
+                    self.metrics.incr("retries", method, endpoint)
                     timeout_retry -= 1
                     continue
                 else:
@@ -122,6 +326,105 @@ class TerraRestClient(object):
         LOG.error("Terra dc authentication fail")
         raise AuthenticationException()
 
+    def _get_token_expires(self, token):
+        '''
+        return expiry time of token in epoch seconds, None if unknown
+        '''
+        if self.token_lifetime:
+            return time.time() + self.token_lifetime
+        parts = token.split(".")
+        if len(parts) != 3:
+            return None
+        try:
+            payload = parts[1] + "=" * (-len(parts[1]) % 4)
+            claims = json.loads(base64.urlsafe_b64decode(str(payload)))
+            return float(claims["exp"])
+        except (TypeError, ValueError, KeyError):
+            LOG.debug("can't decode expiry from token")
+            return None
+
+    def _refresh_token(self):
+        '''
+        issue a new token, called by the only thread which set
+        _token_refreshing
+        '''
+        token = None
+        expires = None
+        try:
+            token = self.get_token()
+            expires = self._get_token_expires(token)
+            self._incr("token_refreshes")
+            self.metrics.incr("token_refreshes", "POST",
+                              get_endpoint(self.auth_url, self.url))
+        finally:
+            with self._token_cond:
+                if token:
+                    self.token = token
+                    self.token_expires = expires
+                self._token_refreshing = False
+                self._token_generation += 1
+                self._token_cond.notify_all()
+
+    def _refresh_token_background(self):
+        try:
+            self._refresh_token()
+        except Exception as e:
+            # current token is still valid, a request after the backoff
+            # will retry
+            LOG.warn("Background token refresh failed, retry in %ds: %s"
+                     % (self.token_refresh_backoff, e))
+            with self._token_cond:
+                self._token_refresh_after = \
+                    time.time() + self.token_refresh_backoff
+
+    def _get_valid_token(self):
+        '''
+        return a usable token, only one thread authenticates at a time.
+        Others keep using the current token while it is still valid, or
+        wait for the refresh if there is no valid token.
+        '''
+        with self._token_cond:
+            generation = None
+            while True:
+                now = time.time()
+                expired = self.token_expires is not None and \
+                    now >= self.token_expires
+                if self.token and not expired:
+                    if self.token_expires is not None \
+                            and not self._token_refreshing \
+                            and now >= self._token_refresh_after \
+                            and now >= self.token_expires - \
+                            self.token_refresh_margin:
+                        LOG.info("token expires in %ds, refresh in background"
+                                 % (self.token_expires - now))
+                        self._token_refreshing = True
+                        t = threading.Thread(
+                            target=self._refresh_token_background)
+                        t.daemon = True
+                        t.start()
+                    return self.token
+                if generation is not None \
+                        and generation != self._token_generation:
+                    # the refresh we waited for failed
+                    LOG.error("fail to get token")
+                    raise AuthenticationException()
+                if not self._token_refreshing:
+                    LOG.info("no valid token, issue token")
+                    self._token_refreshing = True
+                    break
+                generation = self._token_generation
+                self._token_cond.wait()
+
+        self._refresh_token()
+        with self._token_cond:
+            return self.token
+
+    def _invalidate_token(self, token):
+        with self._token_cond:
+            if token == self.token:
+                self.token = None
+                self.token_expires = None
+
     def _decode_rensponse(self, response):
         try:
             if response.content.strip() != "":
@@ -152,18 +455,14 @@ class TerraRestClient(object):
         return False
 
     def _send(self, method, url, payload=None, decode=True, timeout=None):
+        if self.recorder is not None:
+            return self.recorder.send(method, url, payload, decode)
+        instrument.record("sends")
         payload_json = json.dumps(payload)
         token_retry = self.token_retry + 1
         while token_retry:
 
-            _token = None
-            with self._lock():
-                if not self.token:
-                    LOG.info("token is none, issue token")
-                    self.token = self.get_token()
-
-                _token = self.token
-
+            _token = self._get_valid_token()
             if not _token:
                 LOG.error("fail to get token")
                 raise AuthenticationException()
@@ -176,10 +475,11 @@ class TerraRestClient(object):
                                          timeout)
             if resp.status_code == requests.codes.unauthorized:
                 if token_retry > 1:
-                    with self._lock():
-                        LOG.error("Authentication fail, try again")
-                        if _token == self.token:
-                            self.token = None
+                    LOG.error("Authentication fail, try again")
+                    self._invalidate_token(_token)
+                    self._incr("token_401_retries")
+                    self.metrics.incr("retries", method,
+                                      get_endpoint(url, self.url))
                     token_retry -= 1
                     continue
                 else:
@@ -188,8 +488,18 @@ class TerraRestClient(object):
 
             if not self.is_response_ok(resp):
                 LOG.error("Request to %s Failed with code %d, %s" % \
-                          (resp.url, resp.status_code, resp.text))
-                self._raise_for_status(resp)
+                          (resp.url, resp.status_code, truncate(resp.text)))
+                try:
+                    self._raise_for_status(resp)
+                except Exception as e:
+                    # retries of the call are counted against its endpoint
+                    e.request = (method, get_endpoint(url, self.url))
+                    if isinstance(e, (BadRequestException,
+                                      NotFoundException)):
+                        self._evict_resolved()
+                    raise
+            if method != "GET":
+                self._resolved.keys = set()
             try:
                 if decode:
                     return self._decode_rensponse(resp)
@@ -212,7 +522,15 @@ class TerraRestClient(object):
         return self._send("PUT", url, payload, timeout=timeout)
 
     def _get(self, url, timeout=None):
-        return self._send("GET", url, timeout=timeout)
+        if not self.coalesce_gets:
+            return self._send("GET", url, timeout=timeout)
+        ret, shared = self._get_flight.do(url, self._send, "GET", url,
+                                          timeout=timeout)
+        if shared:
+            self._incr("coalesced_gets")
+            # callers may modify what they get
+            return copy.deepcopy(ret)
+        return ret
 
     def _delete(self, url, timeout=None):
         return self._send("DELETE", url, decode=False, timeout=timeout)
@@ -250,26 +568,143 @@ class TerraRestClient(object):
             }
             return self._post(tenant_url, tenant)
         except Exception as e:
-            LOG.error("create tenant error: %s" % e.msg)
-            LOG.error(traceback.format_exc())
+            with excutils.save_and_reraise_exception():
+                LOG.error("create tenant error: %s" % e)
+
+    def warm_tenant_cache(self):
+        tenants = self._get(self.url + "tenants?origin=%s" % self.origin_name)
+        for tenant in tenants or []:
+            if tenant.get("original_id") and tenant.get("id"):
+                self._tenants[tenant["original_id"]] = tenant["id"]
+        LOG.info("loaded %d tenants of %s" % (len(self._tenants),
+                                              self.origin_name))
 
     def get_or_create_tenant_by_original_id(self, tenant_id, tenant_name):
+        if not tenant_id:
+            return None
+        id = self._tenants.get(tenant_id)
+        if id:
+            return id
+        # only one thread looks up or creates a given tenant
+        id, _ = self._tenant_flight.do(tenant_id, self._get_or_create_tenant,
+                                       tenant_id, tenant_name)
+        return id
+
+    def _get_or_create_tenant(self, tenant_id, tenant_name):
         try:
-            return self.get_id_by_original_id("tenants", tenant_id)
+            id = self.get_id_by_original_id("tenants", tenant_id)
         except NotFoundException:
             LOG.info("tenant not found, create")
-            return self.create_tenant(tenant_id, tenant_name)['id']
+            try:
+                id = self.create_tenant(tenant_id, tenant_name)['id']
+            except BadRequestException:
+                # created by another process in the meantime
+                id = self.get_id_by_original_id("tenants", tenant_id)
+        self._tenants[tenant_id] = id
+        return id
 
     def get_id_by_original_id(self, resource, original_id):
         if not original_id:
             return None
+        id = self._id_cache.get((resource, original_id))
+        if id:
+            self._incr("id_cache_hits")
+            self._note_resolved((resource, original_id))
+            return id
+        self._incr("id_cache_misses")
         url = "%s%s?origin=%s&original_id=%s" % (self.url, resource, self.origin_name, original_id)
         ret = self._get(url)
         if not ret or not ret[0].get("id"):
             LOG.warn("%s %s not found" % (resource, original_id))
             raise NotFoundException(msg="%s %s" % (resource, original_id))
+        self._id_cache.set((resource, original_id), ret[0]["id"])
+        self._note_resolved((resource, original_id))
         return ret[0]["id"]
 
+    def _resolve_ids(self, lookups, tenant_id=None, tenant_name=None):
+        '''
+        resolve the tenant and the original ids at the same time, ids
+        missing in cache are looked up once each and in parallel
+        @param lookups: [(resource, original_id), ...]
+        @return: (tenant uuid, [uuid of each lookup])
+        '''
+        keys = []
+        for key in lookups:
+            if key[1] and key not in keys:
+                keys.append(key)
+        misses = [key for key in keys if self._id_cache.get(key) is None]
+        need_tenant = bool(tenant_id) and tenant_id not in self._tenants
+
+        ids = {}
+        tenant = None
+        if self._lookup_executor and len(misses) + need_tenant > 1:
+            futures = [self._lookup_executor.submit(
+                self.get_id_by_original_id, *key) for key in misses]
+            if need_tenant:
+                futures.append(self._lookup_executor.submit(
+                    self.get_or_create_tenant_by_original_id,
+                    tenant_id, tenant_name))
+            results = wait_all(futures)
+            if need_tenant:
+                tenant = results.pop()
+            ids.update(zip(misses, results))
+            # looked up by other threads, used by the call of this one
+            for key in misses:
+                self._note_resolved(key)
+        if tenant_id and tenant is None:
+            tenant = self.get_or_create_tenant_by_original_id(tenant_id,
+                                                              tenant_name)
+        for key in keys:
+            if key not in ids:
+                ids[key] = self.get_id_by_original_id(*key)
+        return tenant, [ids.get(key) for key in lookups]
+
+    def get_ids_by_original_ids(self, lookups):
+        '''
+        @param lookups: [(resource, original_id), ...]
+        @return: [uuid of each lookup], None for empty original_id
+        '''
+        return self._resolve_ids(lookups)[1]
+
+    def _cache_id(self, resource, original_id, ret):
+        '''
+        remember uuid returned by a create call, return the create result
+        '''
+        if original_id and isinstance(ret, dict) and ret.get("id"):
+            self._id_cache.set((resource, original_id), ret["id"])
+        return ret
+
+    def _evict_id(self, id):
+        '''
+        forget the original ids mapped to uuid id, for deletes by uuid
+        '''
+        if id:
+            self._id_cache.pop_value(id)
+
+    def _note_resolved(self, key):
+        keys = getattr(self._resolved, "keys", None)
+        if keys is None:
+            keys = self._resolved.keys = set()
+        keys.add(key)
+
+    def _evict_resolved(self):
+        '''
+        forget the uuids used by a call failing with 400 or 404, they may
+        be stale when the resources were deleted and created again by
+        others, the next attempt looks them up again
+        '''
+        for key in getattr(self._resolved, "keys", None) or ():
+            self._id_cache.pop(key)
+        self._resolved.keys = set()
+
+    def _delete_by_original_id(self, resource, original_id):
+        id = self.get_id_by_original_id(resource, original_id)
+        try:
+            return self._delete(self.url + "%s/%s" % (resource, id))
+        finally:
+            # evict also when delete failed, the uuid may be stale
+            self._id_cache.pop((resource, original_id))
+
     def create_network(self, name, original_id=None,
                        tenant_id=None, tenant_name=None,
                        segment_type="vxlan", segment_global_id=None, segment_local_id=None,
@@ -289,7 +724,8 @@ class TerraRestClient(object):
             network["segment:global_id"] = segment_global_id
         if segment_local_id:
             network["segment_local_id"] = segment_local_id
-        return self._post(self.url + "networks", network)
+        ret = self._post(self.url + "networks", network)
+        return self._cache_id("networks", original_id, ret)
 
     def update_network(self, id, name=None, original_id=None,
                        tenant_id=None, tenant_name=None,
@@ -313,14 +749,13 @@ class TerraRestClient(object):
         return self._put(self.url + "networks/%s" % id, network)
 
     def delete_network(self, id):
-        id = self.get_id_by_original_id("networks", id)
-        return self._delete(self.url + "networks/%s" % id)
+        return self._delete_by_original_id("networks", id)
 
     def create_subnet(self, name, original_id=None,
                       tenant_id=None, tenant_name=None, network_id=None,
                       ip_version=None, cidr=None, gateway_ip=None, enable_dhcp=True):
-        tenant_id = self.get_or_create_tenant_by_original_id(tenant_id, tenant_name)
-        network_id = self.get_id_by_original_id("networks", network_id)
+        tenant_id, (network_id,) = self._resolve_ids(
+            [("networks", network_id)], tenant_id, tenant_name)
         subnet = {
             "name": name,
             "origin": self.origin_name,
@@ -335,13 +770,14 @@ class TerraRestClient(object):
             subnet["gateway_ip"] = gateway_ip
         if cidr:
             subnet["cidr"] = cidr
-        return self._post(self.url + "subnets", subnet)
+        ret = self._post(self.url + "subnets", subnet)
+        return self._cache_id("subnets", original_id, ret)
 
     def update_subnet(self, id, name=None, original_id=None,
                       tenant_id=None, tenant_name=None, network_id=None,
                       ip_version=None, cidr=None, gateway_ip=None, enable_dhcp=True):
-        tenant_id = self.get_or_create_tenant_by_original_id(tenant_id, tenant_name)
-        network_id = self.get_id_by_original_id("networks", network_id)
+        tenant_id, (network_id,) = self._resolve_ids(
+            [("networks", network_id)], tenant_id, tenant_name)
         subnet = {
             "name": name,
             "origin": self.origin_name,
@@ -359,8 +795,7 @@ class TerraRestClient(object):
         return self._put(self.url + "subnets/%s" % id, subnet)
 
     def delete_subnet(self, id):
-        id = self.get_id_by_original_id("subnets", id)
-        return self._delete(self.url + "subnets/%s" % id)
+        return self._delete_by_original_id("subnets", id)
 
     def create_router(self, name=None, tenant_id=None,
                       tenant_name=None, original_id=None, ports=None, l3_vni=None,
@@ -376,7 +811,8 @@ class TerraRestClient(object):
         }
         if ports:
             router["ports"] = ports
-        return self._post(self.url + "routers", router)
+        ret = self._post(self.url + "routers", router)
+        return self._cache_id("routers", original_id, ret)
 
     def update_router(self, id, name=None, original_id=None,
                       tenant_id=None, tenant_name=None, ports=None, network_id=None,
@@ -400,8 +836,7 @@ class TerraRestClient(object):
         return self._put(self.url + "routers/%s" % id, payload)
 
     def delete_router(self, id):
-        id = self.get_id_by_original_id("routers", id)
-        return self._delete(self.url + "routers/%s" % id)
+        return self._delete_by_original_id("routers", id)
 
     def add_router_bgp_peer(self, router_id, as_number, ip_address, device_name,
                             advertise_host_route=False):
@@ -432,9 +867,9 @@ class TerraRestClient(object):
         return self._delete(self.url + "routers/%s/external_gateway" % router_id)
 
     def add_router_interface(self, router_id, subnet_id, port_id):
-        port_id = self.get_id_by_original_id("ports", port_id)
-        router_id = self.get_id_by_original_id("routers", router_id)
-        subnet_id = self.get_id_by_original_id("subnets", subnet_id)
+        port_id, router_id, subnet_id = self.get_ids_by_original_ids(
+            [("ports", port_id), ("routers", router_id),
+             ("subnets", subnet_id)])
         interface = {
             "subnet_id": subnet_id,
             "port_id": port_id
@@ -442,60 +877,103 @@ class TerraRestClient(object):
         return self._post(self.url + "routers/%s/add_interfaces" % router_id, interface)
 
     def del_router_interface(self, router_id, subnet_id, port_id=None):
-        port_id = self.get_id_by_original_id("ports", port_id)
-        router_id = self.get_id_by_original_id("routers", router_id)
-        subnet_id = self.get_id_by_original_id("subnets", subnet_id)
+        port_id, router_id, subnet_id = self.get_ids_by_original_ids(
+            [("ports", port_id), ("routers", router_id),
+             ("subnets", subnet_id)])
         interface = {
             "subnet_id": subnet_id,
             "port_id": port_id
         }
         return self._post(self.url + "routers/%s/remove_interfaces" % router_id, interface)
 
-    def _get_fixed_ips(self, fixed_ips):
-        for ip in fixed_ips:
-            ip["subnet_id"] = self.get_id_by_original_id("subnets", ip["subnet_id"])
-        return fixed_ips
+    def get_router(self, id):
+        '''
+        @param id: terra dc uuid of router
+        '''
+        return self._get(self.url + "routers/%s" % id)
+
+    def get_router_interfaces(self, router_id):
+        '''
+        @param router_id: terra dc uuid of router
+        @return: [{"subnet_id": uuid, "port_id": uuid}, ...]
+        '''
+        router = self.get_router(router_id) or {}
+        return router.get("interfaces") or []
+
+    def del_router_interface_by_id(self, router_id, subnet_id, port_id=None):
+        '''
+        del_router_interface with terra dc uuids
+        '''
+        interface = {
+            "subnet_id": subnet_id,
+            "port_id": port_id
+        }
+        try:
+            return self._post(self.url + "routers/%s/remove_interfaces" % router_id, interface)
+        finally:
+            # terra dc may remove the interface port with it
+            self._evict_id(port_id)
+
+    def _get_fixed_ips(self, fixed_ips, subnet_ids):
+        '''
+        return copy of fixed_ips with subnet_id replaced by subnet_ids,
+        caller's fixed_ips are kept for retries
+        '''
+        return [dict(ip, subnet_id=subnet_id)
+                for ip, subnet_id in zip(fixed_ips, subnet_ids)]
+
+    def _resolve_port_ids(self, tenant_id, tenant_name, network_id,
+                          fixed_ips):
+        '''
+        return (tenant uuid, network uuid, ips) of a port to create
+        '''
+        lookups = [("networks", network_id)] + \
+            [("subnets", ip["subnet_id"]) for ip in fixed_ips]
+        tenant_id, ids = self._resolve_ids(lookups, tenant_id, tenant_name)
+        return tenant_id, ids[0], self._get_fixed_ips(fixed_ips, ids[1:])
 
     def create_direct_port(self, name, original_id=None,
                            tenant_id=None, tenant_name=None, network_id=None,
                            fixed_ips=None, switch_interface_id=None, vlan_id=None):
-        tenant_id = self.get_or_create_tenant_by_original_id(tenant_id, tenant_name)
-        network_id = self.get_id_by_original_id("networks", network_id)
+        tenant_id, network_id, ips = self._resolve_port_ids(
+            tenant_id, tenant_name, network_id, fixed_ips or [])
         port = {
             "name": name,
             "origin": self.origin_name,
             "original_id": original_id,
             "tenant_id": tenant_id,
             "network_id": network_id,
-            "ips": self._get_fixed_ips(fixed_ips),
+            "ips": ips,
             "direct_port": {
                 "switch_interface_id": switch_interface_id,
                 "vlan_id": vlan_id
             }
         }
-        return self._post(self.url + "ports", port)
+        ret = self._post(self.url + "ports", port)
+        return self._cache_id("ports", original_id, ret)
 
     def create_port(self, name, original_id=None,
                     tenant_id=None, tenant_name=None, network_id=None,
                     fixed_ips=None):
-        tenant_id = self.get_or_create_tenant_by_original_id(tenant_id, tenant_name)
-        network_id = self.get_id_by_original_id("networks", network_id)
+        tenant_id, network_id, ips = self._resolve_port_ids(
+            tenant_id, tenant_name, network_id, fixed_ips or [])
         port = {
             "name": name,
             "origin": self.origin_name,
             "original_id": original_id,
             "tenant_id": tenant_id,
             "network_id": network_id,
-            "ips": self._get_fixed_ips(fixed_ips),
+            "ips": ips,
         }
-        return self._post(self.url + "ports", port)
+        ret = self._post(self.url + "ports", port)
+        return self._cache_id("ports", original_id, ret)
 
     def update_port(self, name, original_id=None,
                     tenant_id=None, tenant_name=None, network_id=None,
                     subnet_id=None, ip_address=None):
-        tenant_id = self.get_or_create_tenant_by_original_id(tenant_id, tenant_name)
-        network_id = self.get_id_by_original_id("networks", network_id)
-        subnet_id = self.get_id_by_original_id("subnets", subnet_id)
+        tenant_id, (network_id, subnet_id) = self._resolve_ids(
+            [("networks", network_id), ("subnets", subnet_id)],
+            tenant_id, tenant_name)
         port = {
             "name": name,
             "origin": self.origin_name,
@@ -512,8 +990,13 @@ class TerraRestClient(object):
         return self._put(self.url + "ports", port)
 
     def delete_port(self, id):
-        id = self.get_id_by_original_id("ports", id)
-        return self._delete(self.url + "ports/%s" % id)
+        return self._delete_by_original_id("ports", id)
+
+    def delete_port_by_id(self, id):
+        try:
+            return self._delete(self.url + "ports/%s" % id)
+        finally:
+            self._evict_id(id)
 
     def port_bind(self, port_id=None, switch_name=None, interface_name=None, vlan_native=False):
         port_id = self.get_id_by_original_id("ports", port_id)
@@ -565,14 +1048,51 @@ class TerraRestClient(object):
     def get_host(self, id):
         return self._get(self.url + "hosts/%s" % id)
 
-    @contextmanager
-    def _lock(self):
-        self.lock.acquire()
-        try:
-            yield
-        except Exception, e:
-            LOG.exception("yield exits with exception: %s" % e)
-        self.lock.release()
+    def list_resources(self, resource, page_size=None, **filters):
+        '''
+        get all items of a collection, page_size items per request
+        @param filters: query parameters, eg: origin=qingcloud
+        '''
+        if page_size is None:
+            page_size = self.list_page_size
+        query = ["%s=%s" % (k, v) for k, v in sorted(filters.items())]
+        items = []
+        seen = set()
+        marker = None
+        while True:
+            params = list(query)
+            if page_size:
+                params.append("limit=%d" % page_size)
+                if marker:
+                    params.append("marker=%s" % marker)
+            url = self.url + resource
+            if params:
+                url += "?" + "&".join(params)
+            page = self._get(url) or []
+            new = [item for item in page if item.get("id") not in seen]
+            items.extend(new)
+            seen.update(item.get("id") for item in new)
+            # a page longer than limit is the whole collection, server
+            # ignores paging
+            if not page_size or len(page) != page_size:
+                return items
+            if not new:
+                raise ClientException(
+                    msg="%s page after marker %s repeats items, terra dc "
+                        "ignores marker" % (resource, marker))
+            marker = page[-1].get("id")
+
+    def list_router_routes(self, router_id):
+        '''
+        @param router_id: terra dc uuid of router
+        '''
+        return self._get(self.url + "routers/%s/routes" % router_id) or []
+
+    def delete_router_route(self, router_id, route_id):
+        '''
+        @param router_id: terra dc uuid of router
+        '''
+        return self._delete(self.url + "routers/%s/routes/%s" % (router_id, route_id))
 
     def get_host_by_name(self, hostname):
         hosts = self._get(self.url + "hosts?hostname=%s" % hostname)
@@ -599,30 +1119,29 @@ class TerraRestClient(object):
                 "switch_name": link["switch_name"],
                 "switch_interface_name": link["switch_interface_name"]
             })
-        return self._post(self.url + "host_links", body)
+        ret = self._post(self.url + "host_links", body)
+        self.hosts.add_links(ret)
+        return ret
 
     def get_host_links_by_hostname(self, hostname):
-        mapping = self._get(self.url + "host_links?host_name=%s" % hostname)
-        return mapping
+        return self.hosts.get_links(hostname)
 
     def delete_host_link(self, id):
-        return self._delete(self.url + "host_links/%s" % id)
+        try:
+            return self._delete(self.url + "host_links/%s" % id)
+        finally:
+            self.hosts.remove_link(id)
 
     def get_switch_interface(self, switch_name, interface_name):
-        switches = self._get(self.url + "devices?name=%s" % switch_name)
-        if switches:
-            switch = switches[0]
-            if "interfaces" in switch:
-                for intf in switch["interfaces"]:
-                    if intf.get("name") == interface_name:
-                        return intf
+        intf = self.devices.get_interface(switch_name, interface_name)
+        if intf:
+            return intf
         msg = "can't find interface: %s %s" % (switch_name, interface_name)
         LOG.error(msg)
         raise NotFoundException(msg=msg)
 
     def get_switch(self, switch_name):
-        query_url = self.url + "devices?name=%s" % switch_name
-        switches = self._get(query_url)
-        if not switches:
+        switch = self.devices.get_device(switch_name)
+        if not switch:
             raise NotFoundException(msg="switch %s not found" % switch_name)
-        return switches[0]
+        return switch
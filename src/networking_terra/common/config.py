@@ -29,6 +29,138 @@ odl_opts = [
     cfg.IntOpt('http_timeout',
                default=10,
                help="HTTP timeout in seconds."),
+    cfg.IntOpt('http_pool_connections',
+               default=4,
+               help="Number of per-host connection pools cached by the "
+                    "HTTP session."),
+    cfg.IntOpt('http_pool_maxsize',
+               default=16,
+               help="Maximum number of connections kept open in each "
+                    "pool, should be no less than the number of threads "
+                    "calling terra dc controller concurrently."),
+    cfg.BoolOpt('http_keepalive',
+                default=True,
+                help="Whether to reuse HTTP connections between requests."),
+    cfg.IntOpt('http_max_idle',
+               default=60,
+               help="Seconds a pooled connection may stay idle before the "
+                    "pool is recycled, 0 to never recycle."),
+    cfg.IntOpt('token_lifetime',
+               default=0,
+               help="Lifetime in seconds of a token issued by terra dc "
+                    "controller, 0 to decode it from the token (JWT exp) "
+                    "and only refresh on 401 if it can't be decoded."),
+    cfg.IntOpt('token_refresh_margin',
+               default=60,
+               help="Seconds before token expiry to refresh it in "
+                    "background."),
+    cfg.IntOpt('id_cache_size',
+               default=4096,
+               help="Maximum number of original id to terra dc uuid "
+                    "mappings cached, 0 to disable the cache."),
+    cfg.IntOpt('id_cache_ttl',
+               default=300,
+               help="Seconds an original id to terra dc uuid mapping is "
+                    "cached."),
+    cfg.BoolOpt('tenant_cache_warmup',
+                default=False,
+                help="Whether to load all tenants of origin_name from terra "
+                     "dc controller when the client is created."),
+    cfg.FloatOpt('retry_initial_delay',
+                 default=5,
+                 help="Seconds to wait before the first retry of a call "
+                      "rejected by terra dc controller, eg: device busy."),
+    cfg.FloatOpt('retry_max_delay',
+                 default=60,
+                 help="Maximum seconds to wait between two retries, delay "
+                      "doubles after each retry until this value."),
+    cfg.FloatOpt('retry_jitter',
+                 default=0.5,
+                 help="Fraction of the retry delay removed at random, from "
+                      "0 to 1."),
+    cfg.IntOpt('retry_deadline',
+               default=600,
+               help="Seconds after the first attempt of a call when it is "
+                    "no longer retried, 0 for no deadline."),
+    cfg.ListOpt('retry_fatal_patterns',
+                default=[],
+                help="Regular expressions, a BadRequest whose message "
+                     "matches any of them is not retried."),
+    cfg.IntOpt('list_page_size',
+               default=500,
+               help="Number of items requested per page when listing a "
+                    "whole terra dc collection, 0 to get it at once."),
+    cfg.BoolOpt('coalesce_gets',
+                default=True,
+                help="Whether concurrent identical GET requests to terra dc "
+                     "controller share one HTTP call."),
+    cfg.IntOpt('lookup_concurrency',
+               default=4,
+               help="Maximum number of id lookups a client call issues in "
+                    "parallel, 1 to look ids up one after another."),
+    cfg.IntOpt('async_max_workers',
+               default=32,
+               help="Maximum number of concurrent calls issued by the "
+                    "asynchronous terra dc client, http_pool_maxsize should "
+                    "be no less than it."),
+    cfg.IntOpt('bulk_max_workers',
+               default=8,
+               help="Maximum number of NeutronDriver operations run in "
+                    "parallel by bulk operations, vpc provisioning and "
+                    "the driver executor."),
+    cfg.IntOpt('bulk_switch_workers',
+               default=1,
+               help="Maximum number of hosts linked to the same switch "
+                    "bound or unbound in parallel by bulk operations. "
+                    "terra dc rejects concurrent changes of a device as "
+                    "busy, so more than 1 mostly adds retries."),
+    cfg.FloatOpt('coalesce_window',
+                 default=2,
+                 help="Seconds add_node, remove_node and add_route are held "
+                      "by the coalescing queue, so duplicated calls are "
+                      "merged and add_node/remove_node pairs cancelled. 0 "
+                      "to send them at once."),
+    cfg.FloatOpt('vpc_delete_poll_interval',
+                 default=2,
+                 help="Seconds between two checks whether terra dc has "
+                      "removed a vpc deleted in background."),
+    cfg.IntOpt('vpc_delete_timeout',
+               default=120,
+               help="Seconds to wait for terra dc to remove a vpc deleted "
+                    "in background before giving up."),
+    cfg.StrOpt('metrics_sink',
+               default='',
+               help="Where per endpoint metrics of terra dc requests are "
+                    "sent: prometheus:<path> writes a node_exporter "
+                    "textfile, statsd:<host>:<port> sends to statsd over "
+                    "udp, <module.Class>:<argument> loads another "
+                    "MetricsSink. Empty to keep metrics in memory only."),
+    cfg.FloatOpt('metrics_flush_interval',
+                 default=15,
+                 help="Seconds between two writes of the metrics textfile."),
+    cfg.FloatOpt('log_sample_rate',
+                 default=1,
+                 help="Fraction of calls of the terra drivers logged with "
+                      "their arguments, from 0 to 1."),
+    cfg.IntOpt('log_payload_max_length',
+               default=2048,
+               help="Characters of arguments, contexts and response bodies "
+                    "kept in logs, 0 for no limit."),
+    cfg.StrOpt('journal_path',
+               help="File journaling NeutronDriver operations, operations "
+                    "interrupted by a crash are run again on startup. "
+                    "Journal is disabled if not set."),
+    cfg.BoolOpt('journal_fsync',
+                default=True,
+                help="Whether to fsync the journal after each record."),
+    cfg.BoolOpt('journal_write_behind',
+                default=False,
+                help="Whether journaled operations return a future once "
+                     "journaled instead of waiting for terra dc."),
+    cfg.IntOpt('journal_compact_threshold',
+               default=1000,
+               help="Number of finished operations after which the journal "
+                    "is rewritten with pending operations only."),
     cfg.StrOpt('physical_network',
                help="physical network used for ovs vlan type."),
     cfg.BoolOpt('complete_binding',
@@ -39,7 +171,14 @@ odl_opts = [
                help="Port binding level that Terra mech driver work on."),
     cfg.IntOpt('restconf_poll_interval',
                default=30,
-               help="Poll interval in seconds for getting ODL hostconfig"),
+               help="Poll interval in seconds for reloading the switch "
+                    "inventory of terra dc controller, 0 to query switches "
+                    "on every lookup."),
+    cfg.IntOpt('host_link_max_age',
+               default=600,
+               help="Seconds the host to switch links loaded from terra dc "
+                    "controller are trusted before reloading them, 0 to "
+                    "query links on every port binding."),
     cfg.IntOpt('report_interval',
                default=10,
                help="report interval for topology discovery agent"),
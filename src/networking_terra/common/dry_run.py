@@ -0,0 +1,158 @@
+# Copyright (c) 2017 Tethrnet Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import collections
+import copy
+import itertools
+import json
+import threading
+
+from six.moves.urllib import parse
+from oslo_log import log as logging
+
+from networking_terra.common.exceptions import NotFoundException
+
+LOG = logging.getLogger(__name__)
+
+# query parameters of paging, not filters
+PAGING_PARAMS = ("limit", "marker")
+
+Call = collections.namedtuple("Call", ["method", "url", "payload"])
+
+
+class CallRecorder(object):
+    '''
+    transport of a TerraRestClient in dry run mode: records every call
+    instead of sending it.
+
+    GETs are answered from snapshot, {collection path: [items]}, eg:
+        {"networks": [{"id": "n1", "origin": "qingcloud", ...}],
+         "routers/r1/routes": [...]}
+    filtered by the query parameters, or by the reader, eg: the _get of
+    a live client, when there is no snapshot. Items created or deleted
+    by recorded calls are seen by later GETs, created items get ids like
+    "dry-run-1".
+    '''
+
+    def __init__(self, base_url, snapshot=None, reader=None):
+        self.base_url = base_url
+        self.snapshot = copy.deepcopy(snapshot) if snapshot is not None \
+            else None
+        self.reader = reader
+        self.calls = []
+        self._created = {}
+        self._deleted = set()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _split(self, url):
+        url = url[len(self.base_url):] if url.startswith(self.base_url) \
+            else url
+        path, _, query = url.partition("?")
+        return path.strip("/"), parse.parse_qsl(query)
+
+    def send(self, method, url, payload=None, decode=True):
+        with self._lock:
+            self.calls.append(Call(method, url, copy.deepcopy(payload)))
+        LOG.debug("dry run: %s %s %s" % (method, url, json.dumps(payload)))
+        if method == "GET":
+            ret = self._read(url)
+        elif method == "POST":
+            ret = self._create(url, payload)
+        elif method == "DELETE":
+            ret = self._remove(url)
+        else:
+            ret = copy.deepcopy(payload)
+        if not decode:
+            return "" if ret is None else json.dumps(ret)
+        return {} if ret is None else ret
+
+    def _merge(self, path, items, filters, created=True):
+        with self._lock:
+            items = [i for i in items if i.get("id") not in self._deleted]
+            if created:
+                items += self._created.get(path, [])
+            return [copy.deepcopy(i) for i in items
+                    if all("%s" % i.get(k) == v for k, v in filters)]
+
+    def _read(self, url):
+        path, query = self._split(url)
+        filters = [(k, v) for k, v in query if k not in PAGING_PARAMS]
+        parent, _, id = path.rpartition("/")
+        with self._lock:
+            for item in self._created.get(parent, []):
+                if item["id"] == id:
+                    return copy.deepcopy(item)
+            deleted = id in self._deleted
+        if deleted:
+            raise NotFoundException(msg="%s %s" % (parent, id))
+
+        if self.snapshot is None:
+            ret = self.reader(url) if self.reader else []
+            if isinstance(ret, list):
+                # created items are added to the first page only
+                ret = self._merge(path, ret, filters,
+                                  created="marker" not in dict(query))
+            return ret
+        if path in self.snapshot or path in self._created:
+            items = self._merge(path, self.snapshot.get(path, []), filters)
+            return self._page(items, dict(query))
+        for item in self.snapshot.get(parent, []):
+            if item.get("id") == id:
+                return copy.deepcopy(item)
+        if parent in self.snapshot:
+            raise NotFoundException(msg="%s %s" % (parent, id))
+        return []
+
+    def _page(self, items, query):
+        if "marker" in query:
+            ids = [i.get("id") for i in items]
+            if query["marker"] in ids:
+                items = items[ids.index(query["marker"]) + 1:]
+        if "limit" in query:
+            items = items[:int(query["limit"])]
+        return items
+
+    def _create(self, url, payload):
+        path, _ = self._split(url)
+        if isinstance(payload, list):
+            return [self._create(url, p) for p in payload]
+        if not isinstance(payload, dict):
+            return {}
+        item = dict(payload, id="dry-run-%d" % next(self._ids))
+        with self._lock:
+            self._created.setdefault(path, []).append(item)
+        return copy.deepcopy(item)
+
+    def _remove(self, url):
+        path, _ = self._split(url)
+        id = path.rpartition("/")[2]
+        with self._lock:
+            self._deleted.add(id)
+            for items in self._created.values():
+                items[:] = [i for i in items if i["id"] != id]
+        return None
+
+    def count(self, method=None):
+        return len([c for c in self.calls
+                    if method is None or c.method == method])
+
+    def writes(self):
+        return [c for c in self.calls if c.method != "GET"]
+
+    def __str__(self):
+        return "\n".join("%s %s %s" % (c.method, c.url,
+                                       json.dumps(c.payload)
+                                       if c.payload is not None else "")
+                         for c in self.calls)
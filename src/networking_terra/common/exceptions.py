@@ -48,3 +48,15 @@ class ClientException(exc.NeutronException):
 
 class InitializException(exc.NeutronException):
     message = "%(msg)s"
+
+
+class ProvisionException(exc.NeutronException):
+    message = "Provision failed at step %(task)s: %(msg)s"
+
+
+class TeardownException(exc.NeutronException):
+    message = "Failed to delete %(resource)s: %(msg)s"
+
+
+class SkippedException(exc.NeutronException):
+    message = "Skipped %(step)s: %(msg)s"
@@ -0,0 +1,256 @@
+# Copyright (c) 2017 Tethrnet Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import sys
+import threading
+
+import six
+from six.moves import queue
+from oslo_log import log as logging
+from networking_terra.common.instrument import bind_scope
+
+LOG = logging.getLogger(__name__)
+
+
+class Future(object):
+    '''
+    result of a call running in an executor, a subset of
+    concurrent.futures.Future which is not available in python 2
+    '''
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise queue.Empty("future not done in %ss" % timeout)
+        if self._exc_info:
+            six.reraise(*self._exc_info)
+        return self._result
+
+    def exception(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise queue.Empty("future not done in %ss" % timeout)
+        return self._exc_info[1] if self._exc_info else None
+
+    def add_done_callback(self, fn):
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def _finish(self):
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn(self)
+            except Exception:
+                LOG.exception("future callback failed")
+
+    def set_result(self, result):
+        self._result = result
+        self._finish()
+
+    def set_exception(self, exc_info):
+        '''
+        @param exc_info: sys.exc_info() of the failure
+        '''
+        self._exc_info = exc_info
+        self._finish()
+
+
+def wait_all(futures):
+    '''
+    wait for all futures and return their results in order, raise the
+    first failure after all are done
+    '''
+    results = []
+    first_error = None
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception:
+            results.append(None)
+            if first_error is None:
+                first_error = sys.exc_info()
+    if first_error:
+        six.reraise(*first_error)
+    return results
+
+
+class BoundedExecutor(object):
+    '''
+    run calls on at most max_workers threads, threads are started on
+    demand and live as long as the executor
+    '''
+
+    def __init__(self, max_workers, name="terra-worker"):
+        self.max_workers = max_workers
+        self.name = name
+        self._queue = queue.Queue()
+        self._threads = []
+        self._idle = 0
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        # calls made by fn count in the operation submitting it
+        fn = bind_scope(fn)
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("executor %s is shut down" % self.name)
+            self._queue.put((future, fn, args, kwargs))
+            if self._queue.qsize() > self._idle and \
+                    len(self._threads) < self.max_workers:
+                t = threading.Thread(target=self._work,
+                                     name="%s-%d" % (self.name,
+                                                     len(self._threads)))
+                t.daemon = True
+                self._threads.append(t)
+                t.start()
+        return future
+
+    def map(self, fn, *iterables):
+        '''
+        run fn on items in parallel, return results in order
+        '''
+        return wait_all([self.submit(fn, *args)
+                         for args in six.moves.zip(*iterables)])
+
+    def _work(self):
+        while True:
+            with self._lock:
+                self._idle += 1
+            item = self._queue.get()
+            with self._lock:
+                self._idle -= 1
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception:
+                future.set_exception(sys.exc_info())
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            self._shutdown = True
+            threads = list(self._threads)
+        for _ in threads:
+            self._queue.put(None)
+        if wait:
+            for t in threads:
+                t.join()
+
+
+class _KeyState(object):
+    def __init__(self):
+        # last exclusive submission and shared submissions after it
+        self.exclusive = None
+        self.shared = []
+
+
+class KeyedExecutor(object):
+    '''
+    run calls concurrently on a BoundedExecutor, except calls sharing a
+    key which run in order of submission.
+
+    A call holds its keys exclusively, and optionally other keys in
+    shared mode: calls sharing a key in shared mode may run concurrently
+    but not with the exclusive holders submitted before or after them.
+    A call starts after its predecessors are done, whether they
+    succeeded or not.
+    '''
+
+    def __init__(self, max_workers, name="terra-keyed"):
+        self._executor = BoundedExecutor(max_workers, name=name)
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def submit(self, keys, fn, args=(), kwargs=None, shared_keys=()):
+        future = Future()
+        fn = bind_scope(fn)
+        deps = set()
+        with self._lock:
+            for key in keys:
+                state = self._keys.setdefault(key, _KeyState())
+                if state.exclusive:
+                    deps.add(state.exclusive)
+                deps.update(state.shared)
+                state.exclusive = future
+                state.shared = []
+            for key in shared_keys:
+                if key in keys:
+                    continue
+                state = self._keys.setdefault(key, _KeyState())
+                if state.exclusive:
+                    deps.add(state.exclusive)
+                state.shared.append(future)
+        deps = [dep for dep in deps if not dep.done()]
+
+        def start():
+            inner = self._executor.submit(fn, *args, **(kwargs or {}))
+            inner.add_done_callback(done)
+
+        def done(inner):
+            self._release(future, list(keys) + list(shared_keys))
+            if inner._exc_info:
+                future.set_exception(inner._exc_info)
+            else:
+                future.set_result(inner._result)
+
+        if not deps:
+            start()
+            return future
+
+        waiting = [len(deps)]
+        waiting_lock = threading.Lock()
+
+        def dep_done(dep):
+            with waiting_lock:
+                waiting[0] -= 1
+                ready = waiting[0] == 0
+            if ready:
+                start()
+
+        for dep in deps:
+            dep.add_done_callback(dep_done)
+        return future
+
+    def _release(self, future, keys):
+        with self._lock:
+            for key in keys:
+                state = self._keys.get(key)
+                if state is None:
+                    continue
+                if state.exclusive is future:
+                    state.exclusive = None
+                if future in state.shared:
+                    state.shared.remove(future)
+                if state.exclusive is None and not state.shared:
+                    del self._keys[key]
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait)
@@ -0,0 +1,144 @@
+# Copyright (c) 2017 Tethrnet Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import contextlib
+import functools
+import inspect
+import threading
+
+_local = threading.local()
+
+# operation -> [calls, sends, requests, max requests of a call]
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+class CallCount(object):
+    '''
+    controller calls made within an operation: sends are calls of
+    TerraRestClient._send, requests are http round trips including token
+    requests and retries
+    '''
+
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.parent = parent
+        self.sends = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def add(self, kind):
+        scope = self
+        while scope is not None:
+            with scope._lock:
+                setattr(scope, kind, getattr(scope, kind) + 1)
+            scope = scope.parent
+
+
+def current_scope():
+    return getattr(_local, "scope", None)
+
+
+@contextlib.contextmanager
+def count_calls(name):
+    '''
+    count the controller calls made in the block, including those of
+    nested operations and of work submitted to executors
+    '''
+    parent = current_scope()
+    scope = CallCount(name, parent)
+    _local.scope = scope
+    try:
+        yield scope
+    finally:
+        _local.scope = parent
+        with _stats_lock:
+            stats = _stats.setdefault(name, [0, 0, 0, 0])
+            stats[0] += 1
+            stats[1] += scope.sends
+            stats[2] += scope.requests
+            stats[3] = max(stats[3], scope.requests)
+
+
+def record(kind):
+    '''
+    @param kind: "sends" or "requests"
+    '''
+    scope = current_scope()
+    if scope is not None:
+        scope.add(kind)
+
+
+def bind_scope(fn):
+    '''
+    return fn counting its calls in the current scope, whatever thread
+    runs it
+    '''
+    scope = current_scope()
+    if scope is None:
+        return fn
+
+    def bound(*args, **kwargs):
+        previous = current_scope()
+        _local.scope = scope
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.scope = previous
+
+    return bound
+
+
+def counted(func):
+    '''
+    decorator counting the controller calls of each call of func
+    '''
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with count_calls(func.__name__):
+            return func(*args, **kwargs)
+
+    wrapper.__wrapped__ = func
+    return wrapper
+
+
+def get_call_args(method, *args, **kwargs):
+    '''
+    inspect.getcallargs seeing through counted, self is left out
+    '''
+    func = getattr(method, "__wrapped__", None)
+    if func is None:
+        call_args = inspect.getcallargs(method, *args, **kwargs)
+    elif getattr(method, "__self__", None) is not None:
+        call_args = inspect.getcallargs(func, method.__self__,
+                                        *args, **kwargs)
+    else:
+        call_args = inspect.getcallargs(func, *args, **kwargs)
+    call_args.pop("self", None)
+    return call_args
+
+
+def get_operation_stats():
+    '''
+    @return: {operation: {"calls", "sends", "requests", "max_requests"}}
+    '''
+    with _stats_lock:
+        return dict((name, {"calls": s[0], "sends": s[1],
+                            "requests": s[2], "max_requests": s[3]})
+                    for name, s in _stats.items())
+
+
+def reset_operation_stats():
+    with _stats_lock:
+        _stats.clear()
@@ -0,0 +1,193 @@
+# Copyright (c) 2017 Tethrnet Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import copy
+import threading
+import time
+from oslo_log import log as logging
+
+from networking_terra.common.cache import SingleFlight
+
+LOG = logging.getLogger(__name__)
+
+
+class _BulkIndex(object):
+    '''
+    indexes built from a whole terra dc collection loaded at once and
+    reloaded when older than max_age. A key missing from an index loaded
+    more than miss_interval ago triggers a reload, keys still missing are
+    then cached as missing until the next load.
+    '''
+
+    # names of the index attributes
+    _indexes = ()
+
+    def __init__(self, client, max_age, miss_interval=5):
+        self.client = client
+        self.max_age = max_age
+        self.miss_interval = miss_interval
+        self._loaded_at = None
+        self._missing = set()
+        self._flight = SingleFlight()
+
+    def _load(self):
+        raise NotImplementedError()
+
+    def copy_from(self, other):
+        '''
+        take the indexes loaded by other, so lookups don't load them again
+        '''
+        for name in self._indexes:
+            index = getattr(other, name)
+            setattr(self, name, dict((k, copy.copy(v))
+                                     for k, v in list(index.items())))
+        self._missing = set(other._missing)
+        self._loaded_at = other._loaded_at
+
+    def _load_all(self):
+        self._load()
+        self._missing = set()
+
+    def refresh(self):
+        self._flight.do("load", self._load_all)
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None or \
+                time.time() - self._loaded_at >= self.max_age:
+            self.refresh()
+
+    def _lookup(self, index, key):
+        self._ensure_loaded()
+        value = index().get(key)
+        if value is None and key not in self._missing:
+            if time.time() - self._loaded_at >= self.miss_interval:
+                # object may be added by others after last load
+                self.refresh()
+                value = index().get(key)
+            if value is None:
+                self._missing.add(key)
+        return value
+
+
+class DeviceInventory(_BulkIndex):
+    '''
+    switches known by terra dc controller, indexed by name and by
+    (name, interface name). The whole inventory is loaded at once and
+    reloaded when it is older than poll_interval, 0 to query the
+    controller on every lookup.
+    '''
+
+    _indexes = ("_devices", "_interfaces")
+
+    def __init__(self, client, poll_interval):
+        super(DeviceInventory, self).__init__(client, poll_interval)
+        self._devices = {}
+        self._interfaces = {}
+
+    def _load(self):
+        devices = self.client._get(self.client.url + "devices") or []
+        by_name = {}
+        by_interface = {}
+        for device in devices:
+            name = device.get("name")
+            by_name[name] = device
+            for intf in device.get("interfaces") or []:
+                by_interface[(name, intf.get("name"))] = intf
+        # swap whole indexes so readers never see a partial load
+        self._devices = by_name
+        self._interfaces = by_interface
+        self._loaded_at = time.time()
+        LOG.debug("loaded %d devices from terra dc" % len(by_name))
+
+    def get_device(self, name):
+        if self.max_age <= 0:
+            devices = self.client._get(self.client.url +
+                                       "devices?name=%s" % name)
+            return devices[0] if devices else None
+        return self._lookup(lambda: self._devices, name)
+
+    def get_interface(self, name, interface_name):
+        if self.max_age <= 0:
+            device = self.get_device(name) or {}
+            for intf in device.get("interfaces") or []:
+                if intf.get("name") == interface_name:
+                    return intf
+            return None
+        return self._lookup(lambda: self._interfaces, (name, interface_name))
+
+
+class HostTopology(_BulkIndex):
+    '''
+    links between hosts and switches indexed by host name. Cabling
+    rarely changes, so all links are loaded at once, kept up to date by
+    add_links/remove_link and reloaded when older than max_age, 0 to
+    query the controller on every lookup.
+    '''
+
+    _indexes = ("_links",)
+
+    def __init__(self, client, max_age):
+        super(HostTopology, self).__init__(client, max_age)
+        self._links = {}
+        self._lock = threading.Lock()
+
+    def _load(self):
+        links = self.client._get(self.client.url + "host_links") or []
+        by_host = {}
+        for link in links:
+            by_host.setdefault(link.get("host_name"), []).append(link)
+        with self._lock:
+            self._links = by_host
+            self._loaded_at = time.time()
+        LOG.debug("loaded links of %d hosts from terra dc" % len(by_host))
+
+    def get_links(self, host_name):
+        if self.max_age <= 0:
+            return self.client._get(self.client.url +
+                                    "host_links?host_name=%s" % host_name)
+        links = self._lookup(lambda: self._links, host_name)
+        return list(links) if links else []
+
+    def add_links(self, links):
+        '''
+        @param links: links created in terra dc, with their ids
+        '''
+        if not isinstance(links, list) or \
+                not all(isinstance(l, dict) and l.get("id") for l in links):
+            # can't tell what is created, load again on next lookup
+            self.invalidate()
+            return
+        with self._lock:
+            for link in links:
+                self._missing.discard(link.get("host_name"))
+                host_links = self._links.setdefault(link.get("host_name"), [])
+                host_links[:] = [l for l in host_links
+                                 if l.get("id") != link["id"]] + [link]
+
+    def remove_link(self, link_id):
+        with self._lock:
+            for host_name, host_links in self._links.items():
+                left = [l for l in host_links if l.get("id") != link_id]
+                if len(left) == len(host_links):
+                    continue
+                if left:
+                    self._links[host_name] = left
+                else:
+                    # known to have no link, no reload on next lookup
+                    del self._links[host_name]
+                    self._missing.add(host_name)
+                return
@@ -0,0 +1,261 @@
+# Copyright (c) 2017 Tethrnet Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import bisect
+import collections
+import os
+import socket
+import threading
+
+from six.moves.urllib import parse
+from oslo_log import log as logging
+from oslo_utils.importutils import import_class
+from networking_terra.common.exceptions import InitializException
+
+LOG = logging.getLogger(__name__)
+
+# collections of terra dc api, path segments which are not one of these
+# are ids
+COLLECTIONS = set([
+    "tenants", "networks", "subnets", "routers", "ports", "port_bindings",
+    "hosts", "host_links", "devices", "routes", "bgp_neighbors",
+    "vni_pools", "global_vni", "external_gateway", "add_interfaces",
+    "remove_interfaces", "bind", "unbind",
+])
+
+# upper bounds of request latency buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# counters kept per endpoint besides status codes
+EVENTS = ("timeouts", "retries", "token_refreshes")
+
+
+def get_template(path):
+    '''
+    return path with ids replaced, eg: routers/{id}/add_interfaces
+    '''
+    return "/".join(s if s in COLLECTIONS else "{id}"
+                    for s in path.strip("/").split("/") if s)
+
+
+def get_endpoint(url, base_url):
+    '''
+    template of url relative to base_url without query string, urls out of
+    base_url (auth) are kept as their path
+    '''
+    path = url.split("?", 1)[0]
+    if path.startswith(base_url):
+        return get_template(path[len(base_url):])
+    return parse.urlparse(path).path.strip("/")
+
+
+class MetricsSink(object):
+    '''
+    sinks are told of each request and event, and get a snapshot of all
+    metrics every flush interval, they implement what they need
+    '''
+
+    def observe(self, method, endpoint, status, seconds):
+        pass
+
+    def incr(self, name, method, endpoint):
+        pass
+
+    def flush(self, snapshot):
+        pass
+
+    def close(self):
+        pass
+
+
+class PrometheusTextfileSink(MetricsSink):
+    '''
+    write metrics to a file read by node_exporter's textfile collector
+    '''
+
+    def __init__(self, path, prefix="terra_client"):
+        self.path = path
+        self.prefix = prefix
+
+    def format(self, snapshot):
+        lines = []
+        name = "%s_request_duration_seconds" % self.prefix
+        lines.append("# HELP %s Latency of terra dc requests." % name)
+        lines.append("# TYPE %s histogram" % name)
+        for (method, endpoint), h in sorted(snapshot["latency"].items()):
+            labels = 'method="%s",endpoint="%s"' % (method, endpoint)
+            count = 0
+            for bound, n in zip(snapshot["buckets"] + ("+Inf",),
+                                h["buckets"]):
+                count += n
+                lines.append('%s_bucket{%s,le="%s"} %d'
+                             % (name, labels, bound, count))
+            lines.append("%s_sum{%s} %f" % (name, labels, h["sum"]))
+            lines.append("%s_count{%s} %d" % (name, labels, count))
+
+        by_name = collections.defaultdict(list)
+        for key, value in snapshot["counters"].items():
+            by_name[key[0]].append((key[1:], value))
+        for counter in ("requests",) + EVENTS:
+            name = "%s_%s_total" % (self.prefix, counter)
+            lines.append("# TYPE %s counter" % name)
+            for (method, endpoint, status), value in \
+                    sorted(by_name.get(counter, [])):
+                labels = 'method="%s",endpoint="%s"' % (method, endpoint)
+                if status is not None:
+                    labels += ',code="%s"' % status
+                lines.append("%s{%s} %d" % (name, labels, value))
+        return "\n".join(lines) + "\n"
+
+    def flush(self, snapshot):
+        # rename so the collector never reads a partial file
+        tmp = "%s.%d.tmp" % (self.path, os.getpid())
+        with open(tmp, "w") as f:
+            f.write(self.format(snapshot))
+        os.rename(tmp, self.path)
+
+
+class StatsdSink(MetricsSink):
+    '''
+    send request timings and counters to statsd over udp
+    '''
+
+    def __init__(self, address="127.0.0.1:8125", prefix="terra.client"):
+        host, _, port = address.rpartition(":")
+        self.address = (host or "127.0.0.1", int(port))
+        self.prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def _name(self, method, endpoint):
+        return "%s.%s.%s" % (self.prefix,
+                             endpoint.replace("{id}", "id").replace("/", "."),
+                             method)
+
+    def _send(self, *stats):
+        try:
+            self._socket.sendto("\n".join(stats).encode("utf-8"),
+                                self.address)
+        except socket.error as e:
+            # metrics are best effort
+            LOG.debug("fail to send metrics to statsd: %s" % e)
+
+    def observe(self, method, endpoint, status, seconds):
+        name = self._name(method, endpoint)
+        self._send("%s.time:%.3f|ms" % (name, seconds * 1000),
+                   "%s.status.%s:1|c" % (name, status))
+
+    def incr(self, name, method, endpoint):
+        self._send("%s.%s:1|c" % (self._name(method, endpoint), name))
+
+    def close(self):
+        self._socket.close()
+
+
+SINKS = {
+    "prometheus": PrometheusTextfileSink,
+    "statsd": StatsdSink,
+}
+
+
+def get_sink(spec):
+    '''
+    @param spec: "prometheus:<textfile path>", "statsd:<host>:<port>" or
+        "<module.Class>:<argument>" of a MetricsSink
+    '''
+    name, _, arg = spec.partition(":")
+    try:
+        cls = SINKS.get(name) or import_class(name)
+    except (ImportError, ValueError):
+        raise InitializException(msg="Unknown metrics sink %s" % name)
+    return cls(arg) if arg else cls()
+
+
+class ClientMetrics(object):
+    '''
+    per endpoint metrics of a TerraRestClient: latency histograms and
+    counters of status codes, timeouts, retries and token refreshes, keyed
+    by method and url template, eg: POST routers/{id}/add_interfaces
+    '''
+
+    def __init__(self, sinks=(), flush_interval=0, buckets=LATENCY_BUCKETS):
+        self.sinks = list(sinks)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # (method, endpoint) -> [counts per bucket and +Inf, sum]
+        self._latency = {}
+        # (name, method, endpoint, status) -> count
+        self._counters = collections.defaultdict(int)
+        self._stop = threading.Event()
+        self._flusher = None
+        if self.sinks and flush_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_loop,
+                                             args=(flush_interval,),
+                                             name="terra-metrics")
+            self._flusher.daemon = True
+            self._flusher.start()
+
+    def observe(self, method, endpoint, status, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            h = self._latency.get((method, endpoint))
+            if h is None:
+                h = self._latency[(method, endpoint)] = \
+                    [[0] * (len(self.buckets) + 1), 0.0]
+            h[0][index] += 1
+            h[1] += seconds
+            self._counters[("requests", method, endpoint, status)] += 1
+        for sink in self.sinks:
+            sink.observe(method, endpoint, status, seconds)
+
+    def incr(self, name, method, endpoint):
+        with self._lock:
+            self._counters[(name, method, endpoint, None)] += 1
+        for sink in self.sinks:
+            sink.incr(name, method, endpoint)
+
+    def snapshot(self):
+        '''
+        @return: {"buckets": upper bounds,
+                  "latency": {(method, endpoint): {"buckets", "sum"}},
+                  "counters": {(name, method, endpoint, status): count}}
+            status is None for counters other than requests
+        '''
+        with self._lock:
+            return {"buckets": self.buckets,
+                    "latency": dict((key, {"buckets": list(h[0]),
+                                           "sum": h[1]})
+                                    for key, h in self._latency.items()),
+                    "counters": dict(self._counters)}
+
+    def flush(self):
+        snapshot = self.snapshot()
+        for sink in self.sinks:
+            try:
+                sink.flush(snapshot)
+            except Exception as e:
+                LOG.warn("fail to flush metrics to %s: %s"
+                         % (type(sink).__name__, e))
+
+    def _flush_loop(self, interval):
+        while not self._stop.wait(interval):
+            self.flush()
+
+    def close(self):
+        self._stop.set()
+        if self._flusher:
+            self._flusher.join()
+        if self.sinks:
+            self.flush()
+        for sink in self.sinks:
+            sink.close()
@@ -0,0 +1,179 @@
+# Copyright (c) 2017 Tethrnet Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import contextlib
+import copy
+import random
+import re
+import sys
+import threading
+import time
+import six
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from networking_terra.common.exceptions import BadRequestException
+
+LOG = logging.getLogger(__name__)
+cfg.CONF.import_group("ml2_terra", "networking_terra.common.config")
+
+# operation name -> RetryPolicy, overrides policy built from config
+_policies = {}
+# fatal_patterns added to the policies of the calls of a thread
+_local = threading.local()
+
+
+class RetryPolicy(object):
+    '''
+    decide whether a failed controller call is retried and how long to
+    wait before the next attempt.
+
+    Delay grows exponentially from initial_delay up to max_delay, with up
+    to jitter * delay removed at random so that workers blocked by the
+    same busy device don't retry in lockstep. A call is not retried any
+    more once max_retries or the deadline (in seconds since the first
+    attempt, 0 for no deadline) is reached.
+    '''
+
+    def __init__(self, max_retries=0, initial_delay=5, max_delay=60,
+                 multiplier=2, jitter=0.5, deadline=600,
+                 retryable=(BadRequestException,), fatal_patterns=()):
+        self.max_retries = max_retries
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.deadline = deadline
+        self.retryable = tuple(retryable)
+        self.fatal_patterns = [re.compile(p) for p in fatal_patterns]
+
+    @classmethod
+    def from_config(cls, max_retries=0):
+        conf = cfg.CONF.ml2_terra
+        return cls(max_retries=max_retries,
+                   initial_delay=conf.retry_initial_delay,
+                   max_delay=conf.retry_max_delay,
+                   jitter=conf.retry_jitter,
+                   deadline=conf.retry_deadline,
+                   fatal_patterns=conf.retry_fatal_patterns)
+
+    def is_retryable(self, exc):
+        if not isinstance(exc, self.retryable):
+            return False
+        msg = "%s" % exc
+        for pattern in self.fatal_patterns:
+            if pattern.search(msg):
+                return False
+        return True
+
+    def get_delay(self, attempt):
+        '''
+        @param attempt: number of failed attempts so far, from 1
+        '''
+        delay = min(self.max_delay,
+                    self.initial_delay * self.multiplier ** (attempt - 1))
+        return delay * (1 - self.jitter * random.random())
+
+
+def set_retry_policy(operation, policy):
+    '''
+    @param operation: name of client method, eg: create_port_binding
+    @param policy: RetryPolicy used for it, None to use config
+    '''
+    if policy is None:
+        _policies.pop(operation, None)
+    else:
+        _policies[operation] = policy
+
+
+def get_retry_policy(operation, max_retries=0):
+    policy = _policies.get(operation)
+    if policy is None:
+        policy = RetryPolicy.from_config(max_retries)
+    patterns = getattr(_local, "fatal_patterns", ())
+    if patterns:
+        policy = copy.copy(policy)
+        policy.fatal_patterns = policy.fatal_patterns + \
+            [re.compile(p) for p in patterns]
+    return policy
+
+
+@contextlib.contextmanager
+def fatal_patterns(*patterns):
+    '''
+    BadRequests matching any of patterns are not retried by the calls
+    this thread makes in the block, eg: already exists when replaying
+    journaled creates
+    '''
+    previous = getattr(_local, "fatal_patterns", ())
+    _local.fatal_patterns = previous + patterns
+    try:
+        yield
+    finally:
+        _local.fatal_patterns = previous
+
+
+def record_retry(client, operation, exc):
+    '''
+    count a retry in the stats of the client the operation is called on,
+    eg: create_port_binding_retries, and in its metrics against the
+    endpoint of the failed request
+
+    @param client: TerraRestClient, or None if operation is no client method
+    @param exc: exception of the failed attempt, exc.request is the
+        (method, endpoint) of the request when raised by the client
+    '''
+    if client is None:
+        return
+    if hasattr(client, "_incr"):
+        client._incr("%s_retries" % operation)
+    request = getattr(exc, "request", None)
+    if request and getattr(client, "metrics", None) is not None:
+        method, endpoint = request
+        client.metrics.incr("retries", method, endpoint)
+
+
+def cooperative_sleep(seconds):
+    '''
+    sleep without blocking other green threads when running in eventlet
+    '''
+    eventlet = sys.modules.get("eventlet")
+    if eventlet is not None:
+        eventlet.sleep(seconds)
+    else:
+        time.sleep(seconds)
+
+
+def call_with_retry(policy, operation, method, *args, **kwargs):
+    client = getattr(method, "__self__", None)
+    start = time.time()
+    attempt = 0
+    while True:
+        try:
+            return method(*args, **kwargs)
+        except Exception as e:
+            exc_info = sys.exc_info()
+            attempt += 1
+            if not policy.is_retryable(e) or attempt > policy.max_retries:
+                six.reraise(*exc_info)
+            delay = policy.get_delay(attempt)
+            elapsed = time.time() - start
+            if policy.deadline and elapsed + delay > policy.deadline:
+                LOG.error("%s failed after %d attempts in %ds, give up: %s"
+                          % (operation, attempt, elapsed, e))
+                six.reraise(*exc_info)
+            record_retry(client, operation, e)
+            LOG.warn("%s failed, retry %d/%d in %.1fs: %s"
+                     % (operation, attempt, policy.max_retries, delay, e))
+            cooperative_sleep(delay)
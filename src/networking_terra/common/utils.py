@@ -13,16 +13,20 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 import functools
+import logging as std_logging
+from oslo_config import cfg
 from oslo_log import log as logging
 
 #from oslo_concurrency import lockutils
 import json
 import os
-import pprint
+import random
+import time
 from networking_terra.common.exceptions import BadRequestException
-from time import sleep
+from networking_terra.common.retry import call_with_retry, get_retry_policy
 
 LOG = logging.getLogger(__name__)
+cfg.CONF.import_group("ml2_terra", "networking_terra.common.config")
 
 
 def is_primitive(obj):
@@ -41,22 +45,63 @@ def obj_to_dict(obj, depth=1):
     return ret
 
 
+def truncate(text, max_length=None):
+    '''
+    cut text logged to max_length characters, log_payload_max_length if
+    not given, 0 for no limit
+    '''
+    if max_length is None:
+        max_length = cfg.CONF.ml2_terra.log_payload_max_length
+    if max_length and len(text) > max_length:
+        return "%s...(%d more)" % (text[:max_length], len(text) - max_length)
+    return text
+
+
+def _should_log_call():
+    if not LOG.isEnabledFor(std_logging.INFO):
+        return False
+    rate = cfg.CONF.ml2_terra.log_sample_rate
+    return rate >= 1 or random.random() < rate
+
+
+def _format_args(args, kwargs):
+    params = ["%s" % (arg,) for arg in args]
+    params.extend("%s=%s" % (key, kwargs[key]) for key in sorted(kwargs))
+    return truncate(", ".join(params))
+
+
+def _log_call(name, args, kwargs, func, context=None):
+    '''
+    run func and log it in one record, the fields are also set on the
+    record for structured handlers: operation, call_args (truncated),
+    duration in seconds and call_context if context is given
+    '''
+    fields = {"operation": name, "call_args": _format_args(args, kwargs)}
+    msg = "called %(operation)s(%(call_args)s) in %(duration).3fs"
+    if context is not None:
+        fields["call_context"] = truncate("%s" % obj_to_dict(context))
+        msg += " context: %(call_context)s"
+    start = time.time()
+    try:
+        return func()
+    finally:
+        fields["duration"] = time.time() - start
+        LOG.info(msg, fields, extra=fields)
+
+
 def log_context(log=False):
+    '''
+    log each sampled call with its arguments in one record, and the
+    context if log is True. Nothing is formatted if the call isn't logged.
+    '''
     def wrapper(func):
         @functools.wraps(func)
         def f(self, context, *args, **kwargs):
-            LOG.info("calling %s" % func.func_name)
-            if args:
-                arg_num = 0
-                for arg in args:
-                    arg_num = arg_num + 1
-                    LOG.info("argument %s: %s" % (arg_num, arg))
-            if kwargs:
-                for key in kwargs.keys():
-                    LOG.info("%s: %s" % (key, kwargs.get(key)))
-            obj = obj_to_dict(context)
-            if log:
-                LOG.info("\n%s" % pprint.pformat(obj))
+            if _should_log_call():
+                return _log_call(
+                    func.func_name, args, kwargs,
+                    lambda: func(self, context, *args, **kwargs),
+                    context if log else None)
             return func(self, context, *args, **kwargs)
 
         return f
@@ -67,15 +112,9 @@ def log_context(log=False):
 def log_parameter(func):
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        LOG.info("calling %s" % func.func_name)
-        if args:
-            arg_num = 0
-            for arg in args:
-                arg_num = arg_num + 1
-                LOG.info("argument %s: %s" % (arg_num, arg))
-        if kwargs:
-            for key in kwargs.keys():
-                LOG.info("%s: %s" % (key, kwargs.get(key)))
+        if _should_log_call():
+            return _log_call(func.func_name, args, kwargs,
+                             lambda: func(*args, **kwargs))
         return func(*args, **kwargs)
 
     return wrapper
@@ -97,25 +136,21 @@ def dict_compare(origin, current):
 
 
 def call_client(method, *args, **kwargs):
-
-    retry_badreq = kwargs.get("retry_badreq", None)
-    if retry_badreq is not None:
-        del kwargs["retry_badreq"]
-    else:
-        retry_badreq = 0
-
-    while True:
-        ret = None
-        try:
-            ret = method(*args, **kwargs)
-        except BadRequestException as e:
-            if retry_badreq <= 0:
-                raise e
-            retry_badreq -= 1
-            sleep(60)
-            continue
-        except Exception as e:
-            LOG.exception("Failed to call method %s: %s"
-                          % (method.func_name, e))
-            raise e
-        return ret
+    '''
+    call a client method, retrying it as decided by retry_policy or, if
+    not given, by the policy of the method built with retry_badreq retries
+    '''
+    retry_badreq = kwargs.pop("retry_badreq", None) or 0
+    policy = kwargs.pop("retry_policy", None)
+    operation = method.__name__
+    if policy is None:
+        policy = get_retry_policy(operation, retry_badreq)
+
+    try:
+        return call_with_retry(policy, operation, method, *args, **kwargs)
+    except BadRequestException:
+        raise
+    except Exception as e:
+        LOG.exception("Failed to call method %s: %s"
+                      % (operation, e))
+        raise
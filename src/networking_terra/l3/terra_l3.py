@@ -28,7 +28,7 @@ class TerraL3RouterPlugin(RouterPluginBase):
     def __init__(self):
         LOG.info("initializing Terra L3 driver")
         super(TerraL3RouterPlugin, self).__init__()
-        self.client = TerraRestClient.create_client()
+        self.client = TerraRestClient.get_client()
         self.l3_vni_pool = cfg.CONF.ml2_terra.l3_vni_pool_name
         self._call_client = call_client
         LOG.info("Terra L3 driver initialized")
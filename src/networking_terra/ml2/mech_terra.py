@@ -36,7 +36,7 @@ cfg.CONF.import_group('ml2_terra', 'networking_terra.common.config')
 class TerraMechanismDriver(api.MechanismDriver):
     def initialize(self):
         LOG.info("initializing TerraMechanismDriver")
-        self.client = TerraRestClient.create_client()
+        self.client = TerraRestClient.get_client()
         self._vif_details = {
             portbindings.CAP_PORT_FILTER: securitygroups_rpc.is_firewall_enabled(),
         }
@@ -45,6 +45,12 @@ class TerraMechanismDriver(api.MechanismDriver):
         self.binding_level = cfg.CONF.ml2_terra.binding_level
         self.l2_vni_pool = cfg.CONF.ml2_terra.l2_vni_pool_name
         self._call_client = call_client
+        if cfg.CONF.ml2_terra.host_link_max_age:
+            # load host topology in bulk, instead of one query per binding
+            try:
+                self.client.hosts.refresh()
+            except Exception as e:
+                LOG.warn("failed to load host links: %s" % e)
         LOG.info("TerraMechanismDriver initialized")
 
     @log_context()
@@ -61,6 +67,17 @@ class TerraMechanismDriver(api.MechanismDriver):
         switch_interface_name = link["switch_interface_name"]
         return switch_name, switch_interface_name
 
+    def _get_port_connection(self, context):
+        '''
+        switch and interface of the host of a port, taken from the
+        local_link_information of its binding profile when given
+        '''
+        profile = context.current.get('binding:profile') or {}
+        links = profile.get('local_link_information')
+        if links:
+            return links[0]['switch_info'], links[0]['port_id']
+        return self.get_host_switch_connection(context.host)
+
     @log_context(True)
     def create_network_postcommit(self, context):
         if context.current['provider:network_type'] not in supported_network_types:
@@ -167,8 +184,8 @@ class TerraMechanismDriver(api.MechanismDriver):
                 LOG.info("Terra driver don't support network_type: %s"
                          % segment['network_type'])
                 continue
-            host = context.host
-            switch_name, interface_name = self.get_host_switch_connection(host)
+            switch_name, interface_name = \
+                self._get_port_connection(context)
             vlan_native = context.current.get('native_vlan')
             arg = {
                 'network_id': network['id'],
@@ -244,7 +261,7 @@ class TerraMechanismDriver(api.MechanismDriver):
         if context.host and context.current['device_id']:
             try:
                 switch_name, interface_name = \
-                    self.get_host_switch_connection(context.host)
+                    self._get_port_connection(context)
                 network_id = context.network.current['id']
                 args = {
                     'network_id': network_id,
@@ -12,7 +12,7 @@ LOG = logging.getLogger(__name__)
 class TerraQcExtDriver(QcExtBaseDriver):
     def __init__(self):
         LOG.info("initializing TerraQcExtDriver")
-        self.client = TerraRestClient.create_client()
+        self.client = TerraRestClient.get_client()
         self._call_client = call_client
 
     def get_host(self, host):
@@ -0,0 +1,447 @@
+# Copyright (c) 2017 Tethrnet Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import base64
+import collections
+import itertools
+import json
+import math
+import random
+import socket
+import threading
+import time
+
+from six.moves import BaseHTTPServer
+from six.moves import socketserver
+from six.moves.urllib import parse
+from oslo_config import cfg
+from oslo_log import log as logging
+from networking_terra.common.client import TerraRestClient
+from networking_terra.common.metrics import get_template
+
+LOG = logging.getLogger(__name__)
+
+# calls changing switch configuration, may be rejected as device busy
+DEVICE_CALLS = set([
+    "POST port_bindings", "DELETE port_bindings/{id}",
+    "POST routers/{id}/add_interfaces", "POST routers/{id}/remove_interfaces",
+    "POST routers/{id}/routes", "DELETE routers/{id}/routes/{id}",
+    "POST routers/{id}/bgp_neighbors",
+    "DELETE routers/{id}/bgp_neighbors/{id}",
+    "POST routers", "DELETE routers/{id}",
+])
+
+
+def constant(seconds):
+    return lambda: seconds
+
+
+def uniform(low, high, rand=random):
+    return lambda: rand.uniform(low, high)
+
+
+def lognormal(median, sigma, rand=random):
+    '''
+    latency of most calls close to median with a long tail
+    '''
+    mu = math.log(median)
+    return lambda: rand.lognormvariate(mu, sigma)
+
+
+class _Reply(Exception):
+    def __init__(self, status, body=None):
+        super(_Reply, self).__init__(status)
+        self.status = status
+        self.body = body
+
+
+class FakeTerraController(object):
+    '''
+    terra dc controller in memory, serving the api used by
+    TerraRestClient on a local http server, eg:
+
+        controller = FakeTerraController(
+            latency={"*": lognormal(0.02, 0.5),
+                     "POST port_bindings": uniform(0.5, 2)},
+            errors={"DELETE routers/{id}": (0.01, 500)},
+            busy_rate=0.05)
+        controller.add_device("leaf1", ["Ethernet1/1", "Ethernet1/2"])
+        controller.start()
+        client = TerraRestClient(controller.url, controller.auth_url, ...)
+
+    latency and errors are keyed by "METHOD template", method or "*",
+    see get_template, token requests by "POST auth". busy_rate is the
+    probability a call changing switch configuration is rejected with
+    BadRequest "device busy". Tokens are JWTs with an exp claim if
+    token_lifetime is set. peak_in_flight is the most requests served at
+    once since the last reset_stats.
+    '''
+
+    def __init__(self, latency=None, errors=None, busy_rate=0,
+                 token_lifetime=0, seed=None, host="127.0.0.1", port=0):
+        self.latency = latency or {}
+        self.errors = errors or {}
+        self.busy_rate = busy_rate
+        self.token_lifetime = token_lifetime
+        self.random = random.Random(seed)
+        self.host = host
+        self.port = port
+        self._data = collections.defaultdict(collections.OrderedDict)
+        self._tokens = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self._stats = collections.defaultdict(int)
+        self._in_flight = 0
+        self.peak_in_flight = 0
+        self._server = None
+        self._thread = None
+        self._overrides = {}
+
+    @property
+    def url(self):
+        return "http://%s:%d/api/" % (self.host, self.port)
+
+    @property
+    def auth_url(self):
+        return "http://%s:%d/auth" % (self.host, self.port)
+
+    def start(self):
+        controller = self
+
+        class Handler(_Handler):
+            pass
+
+        Handler.controller = controller
+        self._server = _Server((self.host, self.port), Handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        kwargs={"poll_interval": 0.05},
+                                        name="fake-terra")
+        self._thread.daemon = True
+        self._thread.start()
+        LOG.info("fake terra dc controller listening on %s" % self.url)
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.close_connections()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def configure(self, username="admin", password="pass",
+                  origin_name="qingcloud"):
+        '''
+        point the ml2_terra options, and so the shared clients, to this
+        controller until unconfigure
+        '''
+        self._overrides = {"url": self.url,
+                           "auth_url": self.auth_url,
+                           "username": username,
+                           "password": password,
+                           "origin_name": origin_name}
+        for opt, value in self._overrides.items():
+            cfg.CONF.set_override(opt, value, "ml2_terra")
+        TerraRestClient.reset_clients()
+
+    def unconfigure(self):
+        TerraRestClient.reset_clients()
+        for opt in self._overrides:
+            cfg.CONF.clear_override(opt, "ml2_terra")
+        self._overrides = {}
+
+    def _new_id(self, prefix):
+        return "%s-%d" % (prefix, next(self._ids))
+
+    def add_device(self, name, interfaces=()):
+        with self._lock:
+            device = {"id": self._new_id("dev"), "name": name,
+                      "interfaces": [{"id": self._new_id("intf"),
+                                      "name": intf}
+                                     for intf in interfaces]}
+            self._data["devices"][device["id"]] = device
+            return device
+
+    def get_items(self, path):
+        with self._lock:
+            return list(self._data[path].values())
+
+    def get_stats(self):
+        '''
+        @return: {"METHOD template": number of requests}
+        '''
+        with self._lock:
+            return dict(self._stats)
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
+            self.peak_in_flight = 0
+
+    def _lookup(self, table, method, template):
+        for key in ("%s %s" % (method, template), method, "*"):
+            if key in table:
+                return table[key]
+        return None
+
+    def handle(self, method, path, headers, body):
+        '''
+        @return: (status, response object)
+        '''
+        with self._lock:
+            self._in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self._in_flight)
+        try:
+            return self._serve(method, path, headers, body)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _serve(self, method, path, headers, body):
+        url = parse.urlsplit(path)
+        path = url.path.strip("/")
+        query = parse.parse_qsl(url.query)
+        if path == "auth":
+            template = "auth"
+        elif path.startswith("api/"):
+            path = path[len("api/"):]
+            template = get_template(path)
+        else:
+            return 404, {"error": "unknown path %s" % path}
+        call = "%s %s" % (method, template)
+        with self._lock:
+            self._stats[call] += 1
+
+        sampler = self._lookup(self.latency, method, template)
+        if sampler:
+            time.sleep(max(0, sampler()))
+        if template != "auth" and \
+                not self._check_token(headers.get("Authorization", "")):
+            return 401, {"error": "invalid token"}
+        error = self._lookup(self.errors, method, template)
+        if error and self.random.random() < error[0]:
+            return error[1], {"error": "injected error"}
+        if template == "auth":
+            return self._auth(body)
+        if call in DEVICE_CALLS and self.random.random() < self.busy_rate:
+            return 400, {"error": "device busy, try again later"}
+
+        try:
+            payload = json.loads(body) if body else None
+            with self._lock:
+                return self._dispatch(method, path, query, payload)
+        except _Reply as r:
+            return r.status, r.body
+
+    def _auth(self, body):
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return 400, {"error": "invalid body"}
+        if not payload.get("userName") or not payload.get("password"):
+            return 401, {"error": "bad credentials"}
+        token = "fake-token-%d" % next(self._ids)
+        expires = None
+        if self.token_lifetime:
+            expires = time.time() + self.token_lifetime
+            claims = json.dumps({"exp": expires, "jti": token})
+            token = "e30.%s.fake" % base64.urlsafe_b64encode(
+                claims.encode("utf-8")).decode("ascii").rstrip("=")
+        with self._lock:
+            self._tokens[token] = expires
+        return 200, {"token": token}
+
+    def _check_token(self, authorization):
+        token = authorization.split(" ", 1)[-1]
+        with self._lock:
+            if token not in self._tokens:
+                return False
+            expires = self._tokens[token]
+        return expires is None or time.time() < expires
+
+    def _get_item(self, collection, id):
+        item = self._data[collection].get(id)
+        if item is None:
+            raise _Reply(404, {"error": "%s %s not found" % (collection, id)})
+        return item
+
+    def _create(self, collection, payload):
+        if isinstance(payload, list):
+            return [self._create(collection, p) for p in payload]
+        if not isinstance(payload, dict):
+            raise _Reply(400, {"error": "invalid body"})
+        items = self._data[collection]
+        if payload.get("original_id"):
+            for item in items.values():
+                if item.get("origin") == payload.get("origin") and \
+                        item.get("original_id") == payload["original_id"]:
+                    raise _Reply(400, {"error": "%s %s already exists"
+                                                % (collection,
+                                                   payload["original_id"])})
+        item = dict(payload, id=self._new_id(collection.split("/")[-1]))
+        items[item["id"]] = item
+        return item
+
+    def _list(self, collection, query):
+        filters = [(k, v) for k, v in query if k not in ("limit", "marker")]
+        items = [i for i in self._data[collection].values()
+                 if all("%s" % i.get(k) == v for k, v in filters)]
+        query = dict(query)
+        if "marker" in query:
+            ids = [i["id"] for i in items]
+            if query["marker"] in ids:
+                items = items[ids.index(query["marker"]) + 1:]
+        if "limit" in query:
+            items = items[:int(query["limit"])]
+        return items
+
+    def _dispatch(self, method, path, query, payload):
+        segments = path.split("/")
+        if path == "global_vni" and method == "POST":
+            pools = [self._create("vni_pools", pool)
+                     for pool in payload.get("vni_pool", [])]
+            return 200, pools
+        if len(segments) == 3 and segments[0] == "routers" and \
+                segments[2] in ("add_interfaces", "remove_interfaces"):
+            return self._router_interface(segments[1], segments[2], payload)
+        if len(segments) == 3 and segments[0] == "ports" and \
+                segments[2] in ("bind", "unbind"):
+            self._get_item("ports", segments[1])
+            return 200, {}
+        if len(segments) == 3 and segments[0] == "routers" and \
+                segments[2] == "external_gateway":
+            router = self._get_item("routers", segments[1])
+            router["external_gateways"] = payload.get(
+                "external_gateways") if payload else None
+            return 200, router
+        if len(segments) % 2 == 1:
+            collection = path
+            if len(segments) > 1:
+                self._get_item(segments[-3], segments[-2])
+            if method == "GET":
+                return 200, self._list(collection, query)
+            if method == "POST":
+                return 201, self._create(collection, payload)
+            raise _Reply(405, {"error": "%s not allowed" % method})
+
+        collection, id = "/".join(segments[:-1]), segments[-1]
+        item = self._get_item(collection, id)
+        if method == "GET":
+            return 200, item
+        if method == "PUT":
+            if collection == "routers" and payload and "router" in payload:
+                payload = payload["router"][0]
+            item.update(payload or {})
+            return 200, item
+        if method == "DELETE":
+            del self._data[collection][id]
+            prefix = "%s/%s/" % (collection, id)
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+            return 204, None
+        raise _Reply(405, {"error": "%s not allowed" % method})
+
+    def _router_interface(self, router_id, action, payload):
+        router = self._get_item("routers", router_id)
+        interfaces = router.setdefault("interfaces", [])
+        interface = {"subnet_id": payload.get("subnet_id"),
+                     "port_id": payload.get("port_id")}
+        if interface["subnet_id"]:
+            self._get_item("subnets", interface["subnet_id"])
+        if action == "add_interfaces":
+            if interface in interfaces:
+                raise _Reply(400, {"error": "interface exists"})
+            interfaces.append(interface)
+        else:
+            if interface not in interfaces:
+                raise _Reply(404, {"error": "interface not found"})
+            interfaces.remove(interface)
+        return 200, interface
+
+
+class _Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, *args, **kwargs):
+        BaseHTTPServer.HTTPServer.__init__(self, *args, **kwargs)
+        self.connections = set()
+        self.connections_lock = threading.Lock()
+        # connections accepted since start
+        self.accepted = 0
+
+    def process_request(self, request, client_address):
+        with self.connections_lock:
+            self.connections.add(request)
+            self.accepted += 1
+        socketserver.ThreadingMixIn.process_request(self, request,
+                                                    client_address)
+
+    def shutdown_request(self, request):
+        with self.connections_lock:
+            self.connections.discard(request)
+        BaseHTTPServer.HTTPServer.shutdown_request(self, request)
+
+    def close_connections(self):
+        '''
+        end keep alive connections so their handler threads exit
+        '''
+        with self.connections_lock:
+            connections = list(self.connections)
+        for request in connections:
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers are written one by one, don't wait for acks between them
+    disable_nagle_algorithm = True
+    wbufsize = -1
+    controller = None
+
+    def _handle(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else ""
+        try:
+            status, ret = self.controller.handle(method, self.path,
+                                                 self.headers, body)
+        except Exception as e:
+            LOG.exception("fake terra dc failed on %s %s"
+                          % (method, self.path))
+            status, ret = 500, {"error": "%s" % e}
+        data = json.dumps(ret) if ret is not None else ""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data.encode("utf-8"))
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+    def log_message(self, format, *args):
+        LOG.debug("fake terra dc: " + format % args)
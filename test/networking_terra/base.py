@@ -0,0 +1,31 @@
+#!/usr/bin/evn python
+# -*- coding: utf-8 -*-
+import unittest
+from networking_terra.l3.terra_l3 import TerraL3RouterPlugin
+from networking_terra.ml2.mech_terra import TerraMechanismDriver
+from networking_terra.qcext.qcext_terra import TerraQcExtDriver
+from networking_terra.testing.fake_controller import FakeTerraController
+from common.neutron_driver import NeutronDriver
+
+
+class ControllerTestCase(unittest.TestCase):
+    '''
+    fake controller started for each test, ml2_terra configured for it
+    '''
+
+    def setUp(self):
+        super(ControllerTestCase, self).setUp()
+        self.controller = FakeTerraController(seed=1)
+        self.controller.add_device("leaf1", ["Ethernet1/1", "Ethernet1/2"])
+        self.controller.start()
+        self.controller.configure()
+
+    def tearDown(self):
+        self.controller.unconfigure()
+        self.controller.stop()
+        super(ControllerTestCase, self).tearDown()
+
+    def _driver(self):
+        ml2 = TerraMechanismDriver()
+        ml2.initialize()
+        return NeutronDriver(TerraL3RouterPlugin(), ml2, TerraQcExtDriver())
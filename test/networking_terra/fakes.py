@@ -0,0 +1,138 @@
+#!/usr/bin/evn python
+# -*- coding: utf-8 -*-
+import threading
+
+from common.neutron_driver import NeutronDriver
+from networking_terra.common.client import TerraRestClient
+from networking_terra.common.exceptions import BadRequestException, \
+    NotFoundException
+
+
+class RecordingDriver(NeutronDriver):
+    '''
+    NeutronDriver recording the operations called on it instead of
+    sending them to terra dc, eg: ("create_vxnet", "vxnet-1"). Bulk
+    operations, provisioning and teardown run as usual on top of them.
+
+    @param fail: call raising BadRequestException, eg:
+        ("join_vpc", "vxnet-1")
+    @param fail_operations: names of operations always raising it
+    '''
+
+    def __init__(self, fail=None, fail_operations=()):
+        super(RecordingDriver, self).__init__(None, None, None)
+        self.calls = []
+        self.fail = fail
+        self.fail_operations = fail_operations
+        self.lock = threading.Lock()
+
+    def _record(self, *call):
+        with self.lock:
+            self.calls.append(call)
+        if call == self.fail or call[0] in self.fail_operations:
+            raise BadRequestException(msg="fail %s" % (call,))
+        return call
+
+    def create_vpc(self, vpc_id, l3vni, user_id):
+        return self._record("create_vpc", vpc_id)
+
+    def delete_vpc(self, vpc_id, user_id, **kwargs):
+        return self._record("delete_vpc", vpc_id)
+
+    def create_vxnet(self, vxnet_id, vni, ip_network, gateway_ip, user_id,
+                     network_type=None, enable_dhcp=False):
+        return self._record("create_vxnet", vxnet_id)
+
+    def delete_vxnet(self, vxnet_id, user_id):
+        return self._record("delete_vxnet", vxnet_id)
+
+    def join_vpc(self, vpc_id, subnet_id, user_id):
+        return self._record("join_vpc", subnet_id)
+
+    def leave_vpc(self, vpc_id, vxnet_id, user_id):
+        return self._record("leave_vpc", vxnet_id)
+
+    def add_subintf(self, vpc_id, network_id, ip_address,
+                    switch_name, interface_name, vlan_id, user_id):
+        return self._record("add_subintf", network_id)
+
+    def delete_subintf(self, vpc_id, network_id):
+        return self._record("delete_subintf", network_id)
+
+    def add_node(self, vxnet_id, vni, host, user_id, vlan_id,
+                 native_vlan=True, connection=None):
+        return self._record("add_node", vxnet_id, host, vlan_id)
+
+    def remove_node(self, vxnet_id, host, user_id, connection=None):
+        return self._record("remove_node", vxnet_id, host)
+
+    def add_route(self, vpc_id, destination, nexthop, device_name):
+        return self._record("add_route", device_name, destination)
+
+    def delete_routes(self, vpc_id, destination=None):
+        return self._record("delete_routes", destination)
+
+
+class FakeClient(object):
+    '''
+    TerraRestClient answering from in memory collections, eg:
+    {"devices": [...]}, and recording the urls and resources requested
+    '''
+    url = "http://terra/"
+    origin_name = "qingcloud"
+
+    def __init__(self, collections=None, routes=None):
+        self.collections = collections or {}
+        self.routes = routes or {}
+        self.urls = []
+        self.listed = []
+
+    def _get(self, url):
+        self.urls.append(url)
+        return self.collections.get(url[len(self.url):].split("?")[0], [])
+
+    def list_resources(self, resource, **filters):
+        self.listed.append(resource)
+        return self.collections.get(resource, [])
+
+    def list_router_routes(self, router_id):
+        self.listed.append("routes:%s" % router_id)
+        return self.routes.get(router_id, [])
+
+    def get_switch(self, name):
+        return {"id": "dev-" + name}
+
+    def get_id_by_original_id(self, resource, original_id):
+        for item in self.collections.get(resource, []):
+            if item.get("original_id") == original_id:
+                return item["id"]
+        raise NotFoundException(msg="%s %s" % (resource, original_id))
+
+
+class PagedClient(FakeClient):
+    '''
+    FakeClient listing collections page by page with the
+    list_resources of TerraRestClient
+
+    @param ignore_paging: return whole collections, ignoring limit
+    @param ignore_marker: return the first page, ignoring marker
+    '''
+    list_page_size = 2
+
+    def __init__(self, collections=None, ignore_paging=False,
+                 ignore_marker=False):
+        super(PagedClient, self).__init__(collections)
+        self.ignore_paging = ignore_paging
+        self.ignore_marker = ignore_marker
+
+    def _get(self, url):
+        items = super(PagedClient, self)._get(url)
+        if self.ignore_paging:
+            return items
+        query = dict(p.split("=") for p in url.split("?")[1].split("&"))
+        start = 0
+        if "marker" in query and not self.ignore_marker:
+            start = [i["id"] for i in items].index(query["marker"]) + 1
+        return items[start:start + int(query["limit"])]
+
+    list_resources = TerraRestClient.__dict__["list_resources"]
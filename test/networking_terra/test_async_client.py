@@ -0,0 +1,64 @@
+#!/usr/bin/evn python
+# -*- coding: utf-8 -*-
+import unittest
+from networking_terra.common.async_client import AsyncTerraRestClient
+from networking_terra.common.client import TerraRestClient
+from networking_terra.common.exceptions import BadRequestException, \
+    NotFoundException, ServerErrorException
+from networking_terra.common.executor import wait_all
+from networking_terra.common.retry import RetryPolicy
+from networking_terra.testing.fake_controller import FakeTerraController
+
+
+class AsyncClientTestCases(unittest.TestCase):
+
+    def setUp(self):
+        super(AsyncClientTestCases, self).setUp()
+        self.controller = FakeTerraController(seed=1).start()
+        self.client = AsyncTerraRestClient(
+            TerraRestClient(self.controller.url, self.controller.auth_url,
+                            "admin", "pass", 5, "qingcloud",
+                            lookup_concurrency=0),
+            max_workers=4)
+
+    def tearDown(self):
+        self.client.close()
+        self.client.client.close()
+        self.controller.stop()
+
+    def _create_router(self, name, **kwargs):
+        return self.client.create_router(name=name, tenant_id="usr-1",
+                                         tenant_name="usr-1",
+                                         original_id=name, **kwargs)
+
+    def test_result(self):
+        router = self._create_router("vpc-1").result(5)
+        self.assertEqual(router["id"], self.client.get_id_by_original_id(
+            "routers", "vpc-1").result(5))
+
+    def test_failure(self):
+        self._create_router("vpc-1").result(5)
+        self.controller.errors = {"DELETE routers/{id}": (1, 500)}
+        future = self.client.delete_router("vpc-1")
+        self.assertRaises(ServerErrorException, future.result, 5)
+        self.assertTrue(isinstance(future.exception(), ServerErrorException))
+
+        # BadRequest is raised once retries are exhausted
+        self.controller.errors = {"POST routers": (1, 400)}
+        future = self._create_router("vpc-2",
+                                     retry_policy=RetryPolicy(max_retries=0))
+        self.assertRaises(BadRequestException, future.result, 5)
+
+    def test_wait_all(self):
+        futures = [self._create_router("vpc-1"),
+                   self.client.delete_router("vpc-0"),
+                   self._create_router("vpc-2")]
+        self.assertRaises(NotFoundException, wait_all, futures)
+        # other calls are done before the failure is raised
+        self.assertTrue(all(f.done() for f in futures))
+        self.assertEqual(["vpc-1", "vpc-2"], sorted(
+            r["original_id"] for r in self.controller.get_items("routers")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+#!/usr/bin/evn python
+# -*- coding: utf-8 -*-
+import unittest
+from common.benchmark import Benchmark, SETUP, TEARDOWN, percentile
+
+
+class BenchmarkTestCases(unittest.TestCase):
+
+    def test_percentile(self):
+        values = range(1, 101)
+        self.assertEqual(50, percentile(values, 50))
+        self.assertEqual(99, percentile(values, 99))
+        self.assertEqual(100, percentile(values, 100))
+        self.assertEqual(7, percentile([7], 95))
+        self.assertEqual(0, percentile([], 50))
+
+    def test_run(self):
+        benchmark = Benchmark(tenants=2, vxnets=1, nodes=2, concurrency=2,
+                              latency_ms=0, seed=1)
+        report = benchmark.run()
+        self.assertEqual(set(SETUP + TEARDOWN), set(report))
+        self.assertEqual(4, report["add_node"]["count"])
+        for operation in report.values():
+            self.assertEqual(0, operation["errors"])
+            self.assertTrue(operation["calls"] >= 1)
+        self.assertTrue("tenants/s" in benchmark.format_report(report))
+
+
+if __name__ == '__main__':
+    unittest.main()
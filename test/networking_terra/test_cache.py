@@ -0,0 +1,84 @@
+#!/usr/bin/evn python
+# -*- coding: utf-8 -*-
+import threading
+import time
+import unittest
+from networking_terra.common.cache import SingleFlight, TTLCache
+
+
+class TTLCacheTestCases(unittest.TestCase):
+
+    def test_lru(self):
+        cache = TTLCache(2, 60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+
+        # b is least recently used
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_ttl(self):
+        cache = TTLCache(2, 0.1)
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        time.sleep(0.2)
+        self.assertIsNone(cache.get("a"))
+
+    def test_pop(self):
+        cache = TTLCache(2, 60)
+        cache.set("a", 1)
+        self.assertEqual(cache.pop("a"), 1)
+        self.assertIsNone(cache.pop("a"))
+        self.assertEqual(len(cache), 0)
+
+    def test_pop_value(self):
+        cache = TTLCache(4, 60)
+        cache.set(("ports", "a"), "uuid-1")
+        cache.set(("ports", "b"), "uuid-2")
+        self.assertEqual([("ports", "a")], cache.pop_value("uuid-1"))
+        self.assertIsNone(cache.get(("ports", "a")))
+        self.assertEqual("uuid-2", cache.get(("ports", "b")))
+
+    def test_disabled(self):
+        cache = TTLCache(0, 60)
+        cache.set("a", 1)
+        self.assertIsNone(cache.get("a"))
+
+
+class SingleFlightTestCases(unittest.TestCase):
+
+    def test_shared_call(self):
+        flight = SingleFlight()
+        calls = []
+        results = []
+
+        def func():
+            calls.append(1)
+            time.sleep(0.2)
+            return "id"
+
+        def worker():
+            results.append(flight.do("key", func))
+
+        threads = [threading.Thread(target=worker) for i in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results),
+                         [("id", False)] + [("id", True)] * 4)
+
+    def test_exception(self):
+        flight = SingleFlight()
+
+        def func():
+            raise ValueError("fail")
+
+        self.assertRaises(ValueError, flight.do, "key", func)
+        # key is released after failure
+        self.assertEqual(flight.do("key", lambda: 1), (1, False))
@@ -0,0 +1,139 @@
+#!/usr/bin/evn python
+# -*- coding: utf-8 -*-
+import unittest
+from oslo_config import cfg
+from networking_terra.common import instrument
+from networking_terra.common.executor import BoundedExecutor
+from base import ControllerTestCase
+
+cfg.CONF.import_group("ml2_terra", "networking_terra.common.config")
+
+# most http requests of an operation once tenants, devices, hosts and the
+# ids of resources created by the driver are cached
+WARM_BUDGETS = {
+    "create_vpc": 1,
+    "create_vxnet": 2,
+    "join_vpc": 1,
+    "add_node": 1,
+    "add_nodes": 1,
+    "add_route": 1,
+    "delete_routes": 2,
+    "remove_node": 2,
+    "remove_nodes": 2,
+    "leave_vpc": 1,
+    "delete_vxnet": 2,
+    "delete_vpc": 1,
+}
+
+
+class InstrumentTestCases(unittest.TestCase):
+
+    def test_nested_scopes(self):
+        with instrument.count_calls("outer") as outer:
+            instrument.record("requests")
+            with instrument.count_calls("inner") as inner:
+                instrument.record("requests")
+                instrument.record("sends")
+        self.assertEqual((2, 1), (outer.requests, outer.sends))
+        self.assertEqual((1, 1), (inner.requests, inner.sends))
+        instrument.record("requests")
+        self.assertEqual(2, outer.requests)
+
+    def test_executor_threads(self):
+        executor = BoundedExecutor(2, name="test-instrument")
+        with instrument.count_calls("parallel") as scope:
+            executor.map(lambda _: instrument.record("requests"), range(4))
+        executor.shutdown()
+        self.assertEqual(4, scope.requests)
+
+    def test_call_args(self):
+        class Driver(object):
+            @instrument.counted
+            def add_node(self, vxnet_id, host, vlan_id=1):
+                pass
+
+        self.assertEqual({"vxnet_id": "vxnet-1", "host": "hyper1",
+                          "vlan_id": 1},
+                         instrument.get_call_args(Driver().add_node,
+                                                  "vxnet-1", "hyper1"))
+        self.assertEqual("add_node", Driver.add_node.__name__)
+
+
+class CallBudgetTestCases(ControllerTestCase):
+
+    def setUp(self):
+        super(CallBudgetTestCases, self).setUp()
+        self.driver = self._driver()
+        for i, host in enumerate(("hyper1", "hyper2")):
+            self.driver.create_host(host, "10.255.0.%d" % (i + 1), [{
+                "host_name": host,
+                "host_interface_name": "eth0",
+                "switch_name": "leaf1",
+                "switch_interface_name": "Ethernet1/%d" % (i + 1)}])
+        # warm the tenant and device caches
+        self._setup(0)
+        self._teardown(0)
+        instrument.reset_operation_stats()
+        self.controller.reset_stats()
+
+    def _setup(self, i):
+        vpc_id, vxnet_id = "vpc-%d" % i, "vxnet-%d" % i
+        self.driver.create_vpc(vpc_id, 3000 + i, "usr-1")
+        self.driver.create_vxnet(vxnet_id, 2000 + i, "10.0.%d.0/24" % i,
+                                 "10.0.%d.1" % i, "usr-1")
+        self.driver.join_vpc(vpc_id, vxnet_id, "usr-1")
+        self.driver.add_node(vxnet_id, 2000 + i, "hyper1", "usr-1", 10,
+                             False)
+        self.driver.add_nodes(vxnet_id, 2000 + i, ["hyper2"], "usr-1", 10,
+                              False)
+        self.driver.add_route(vpc_id, "0.0.0.0/0", "10.0.%d.254" % i,
+                              "leaf1")
+
+    def _teardown(self, i):
+        vpc_id, vxnet_id = "vpc-%d" % i, "vxnet-%d" % i
+        self.driver.delete_routes(vpc_id)
+        self.driver.remove_node(vxnet_id, "hyper1", "usr-1")
+        self.driver.remove_nodes(vxnet_id, ["hyper2"], "usr-1")
+        self.driver.leave_vpc(vpc_id, vxnet_id, "usr-1")
+        self.driver.delete_vxnet(vxnet_id, "usr-1")
+        self.driver.delete_vpc(vpc_id, "usr-1")
+
+    def _assert_budgets(self, operations):
+        stats = instrument.get_operation_stats()
+        for operation in operations:
+            self.assertTrue(
+                stats[operation]["max_requests"] <=
+                WARM_BUDGETS[operation],
+                "%s sent %d requests, budget is %d"
+                % (operation, stats[operation]["max_requests"],
+                   WARM_BUDGETS[operation]))
+
+    def test_setup_budget(self):
+        self._setup(1)
+        self._assert_budgets(("create_vpc", "create_vxnet", "join_vpc",
+                              "add_node", "add_nodes", "add_route"))
+        self._teardown(1)
+
+    def test_teardown_budget(self):
+        self._setup(1)
+        instrument.reset_operation_stats()
+        self._teardown(1)
+        self._assert_budgets(("delete_routes", "remove_node",
+                              "remove_nodes", "leave_vpc", "delete_vxnet",
+                              "delete_vpc"))
+
+    def test_nested_operations(self):
+        with instrument.count_calls("flow") as flow:
+            self._setup(1)
+        stats = instrument.get_operation_stats()
+        # add_node run by add_nodes on the bulk pool counts in both
+        self.assertEqual(2, stats["add_node"]["calls"])
+        self.assertEqual(stats["add_nodes"]["requests"],
+                         stats["add_node"]["max_requests"])
+        self.assertEqual(sum(self.controller.get_stats().values()),
+                         flow.requests)
+        self._teardown(1)
+
+
+if __name__ == '__main__':
+    unittest.main()
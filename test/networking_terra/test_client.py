@@ -0,0 +1,399 @@
+#!/usr/bin/evn python
+# -*- coding: utf-8 -*-
+import base64
+import threading
+import time
+import unittest
+from oslo_config import cfg
+from networking_terra.common.client import TerraRestClient
+from networking_terra.common.exceptions import NotFoundException
+from networking_terra.l3.terra_l3 import TerraL3RouterPlugin
+from networking_terra.qcext.qcext_terra import TerraQcExtDriver
+from networking_terra.testing.fake_controller import constant
+from common.neutron_driver import NeutronDriver
+from base import ControllerTestCase
+
+
+def get_pools(session):
+    pools = session.get_adapter("http://").poolmanager.pools
+    return [pools[key] for key in pools.keys()]
+
+
+class ClientTestCase(ControllerTestCase):
+    '''
+    client of a fake controller started for each test
+    '''
+
+    def setUp(self):
+        super(ClientTestCase, self).setUp()
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+        super(ClientTestCase, self).tearDown()
+
+    def _client(self, **kwargs):
+        kwargs.setdefault("lookup_concurrency", 0)
+        client = TerraRestClient(self.controller.url,
+                                 self.controller.auth_url, "admin", "pass",
+                                 5, "qingcloud", **kwargs)
+        self.clients.append(client)
+        return client
+
+    def _create_vxnet(self, client):
+        client.create_network("vxnet-1", original_id="vxnet-1",
+                              tenant_id="usr-1", segment_global_id=2001)
+        client.create_subnet("vxnet-1", original_id="vxnet-1",
+                             tenant_id="usr-1", network_id="vxnet-1",
+                             cidr="10.0.1.0/24", gateway_ip="10.0.1.1")
+        return client.create_port("port-1", original_id="port-1",
+                                  tenant_id="usr-1", network_id="vxnet-1",
+                                  fixed_ips=[{"subnet_id": "vxnet-1",
+                                              "ip_address": "10.0.1.2"}])
+
+
+class SessionTestCases(ClientTestCase):
+
+    def test_reuse(self):
+        client = self._client()
+        session = client._get_session()
+        for _ in range(3):
+            client.get_vni_pools()
+        self.assertTrue(session is client._get_session())
+        self.assertEqual(1, len(get_pools(session)))
+        # token and vni pool requests share one keep alive connection
+        self.assertEqual(1, self.controller._server.accepted)
+
+    def test_no_keepalive(self):
+        client = self._client(keepalive=False)
+        for _ in range(3):
+            client.get_vni_pools()
+        # token request and each call open their own connection
+        self.assertEqual(4, self.controller._server.accepted)
+
+    def test_recycle_idle(self):
+        client = self._client(max_idle=0.05)
+        client.get_vni_pools()
+        session = client._session
+        time.sleep(0.1)
+        client.get_vni_pools()
+        self.assertFalse(session is client._session)
+        self.assertEqual([], get_pools(session))
+        self.assertEqual(2, self.controller._server.accepted)
+
+    def test_close(self):
+        client = self._client()
+        client.get_vni_pools()
+        session = client._session
+        client.close()
+        self.assertEqual([], get_pools(session))
+
+
+class RegistryTestCases(ClientTestCase):
+
+    def test_same_config(self):
+        client = TerraRestClient.get_client()
+        self.assertTrue(client is TerraRestClient.get_client())
+
+    def test_other_config(self):
+        client = TerraRestClient.get_client()
+        cfg.CONF.set_override("username", "other", "ml2_terra")
+        other = TerraRestClient.get_client()
+        self.assertFalse(client is other)
+        self.assertEqual("other", other.username)
+        cfg.CONF.set_override("url", self.controller.url + "v2/",
+                              "ml2_terra")
+        self.assertFalse(other is TerraRestClient.get_client())
+        cfg.CONF.set_override("username", "admin", "ml2_terra")
+        cfg.CONF.set_override("url", self.controller.url, "ml2_terra")
+        self.assertTrue(client is TerraRestClient.get_client())
+
+    def test_reset(self):
+        client = TerraRestClient.get_client()
+        client.get_vni_pools()
+        session = client._session
+        TerraRestClient.reset_clients()
+        self.assertEqual([], get_pools(session))
+        self.assertFalse(client is TerraRestClient.get_client())
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+class TokenTestCases(ClientTestCase):
+
+    def test_jwt_expiry(self):
+        client = self._client()
+        claims = base64.urlsafe_b64encode(b'{"exp": 1500000000}')
+        self.assertEqual(1500000000, client._get_token_expires(
+            "e30.%s.sig" % claims.decode("ascii").rstrip("=")))
+        self.assertEqual(None, client._get_token_expires("opaque-token"))
+        self.assertEqual(None, client._get_token_expires("a.b!.c"))
+        self.assertEqual(None, client._get_token_expires(
+            "e30.%s.sig" % base64.urlsafe_b64encode(b'{}').decode("ascii")))
+
+        # expiry decoded from the tokens of terra dc
+        self.controller.token_lifetime = 300
+        client.get_vni_pools()
+        self.assertTrue(290 < client.token_expires - time.time() <= 300)
+
+    def test_concurrent_refresh(self):
+        self.controller.latency = {"POST auth": constant(0.1)}
+        client = self._client(coalesce_gets=False)
+        threads = [threading.Thread(target=client.get_vni_pools)
+                   for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(1, self.controller.get_stats()["POST auth"])
+        self.assertEqual(8, self.controller.get_stats()["GET vni_pools"])
+        self.assertEqual(1, client.get_stats()["token_refreshes"])
+
+    def test_background_refresh(self):
+        self.controller.token_lifetime = 300
+        client = self._client(token_refresh_margin=60)
+        client.get_vni_pools()
+        token = client.token
+        # token enters the refresh margin
+        client.token_expires = time.time() + 30
+        client.get_vni_pools()
+        wait_for(lambda: client.token != token)
+        self.assertEqual(2, self.controller.get_stats()["POST auth"])
+        self.assertTrue(client.token_expires - time.time() > 60)
+
+    def test_background_refresh_backoff(self):
+        self.controller.token_lifetime = 300
+        client = self._client(token_refresh_margin=60,
+                              token_refresh_backoff=60)
+        client.get_vni_pools()
+        token = client.token
+        client.token_expires = time.time() + 30
+        self.controller.errors = {"POST auth": (1, 500)}
+        client.get_vni_pools()
+        wait_for(lambda: not client._token_refreshing)
+        for _ in range(5):
+            client.get_vni_pools()
+        # the valid token is kept, no refresh before the backoff ends
+        self.assertEqual(token, client.token)
+        self.assertEqual(2, self.controller.get_stats()["POST auth"])
+        self.assertEqual(7, self.controller.get_stats()["GET vni_pools"])
+
+
+class IdCacheTestCases(ClientTestCase):
+
+    def test_write_through(self):
+        client = self._client()
+        router = client.create_router(name="vpc-1", tenant_id="usr-1",
+                                      tenant_name="usr-1",
+                                      original_id="vpc-1", l3_vni=3001)
+        self._create_vxnet(client)
+        self.controller.reset_stats()
+        self.assertEqual(router["id"],
+                         client.get_id_by_original_id("routers", "vpc-1"))
+        client.add_router_interface("vpc-1", "vxnet-1", "port-1")
+        # created ids are cached, no lookup is sent
+        self.assertEqual({"POST routers/{id}/add_interfaces": 1},
+                         self.controller.get_stats())
+
+    def test_delete_evicts(self):
+        client = self._client()
+        client.create_router(name="vpc-1", tenant_id="usr-1",
+                             tenant_name="usr-1", original_id="vpc-1")
+        client.delete_router("vpc-1")
+        self.assertRaises(NotFoundException, client.get_id_by_original_id,
+                          "routers", "vpc-1")
+
+    def test_delete_by_id_evicts(self):
+        client = self._client()
+        port = self._create_vxnet(client)
+        client.delete_port_by_id(port["id"])
+        self.assertRaises(NotFoundException, client.get_id_by_original_id,
+                          "ports", "port-1")
+
+    def test_remove_interface_by_id_evicts(self):
+        client = self._client()
+        router = client.create_router(name="vpc-1", tenant_id="usr-1",
+                                      tenant_name="usr-1",
+                                      original_id="vpc-1")
+        port = self._create_vxnet(client)
+        client.add_router_interface("vpc-1", "vxnet-1", "port-1")
+        subnet_id = client.get_id_by_original_id("subnets", "vxnet-1")
+        client.del_router_interface_by_id(router["id"], subnet_id,
+                                          port["id"])
+        self.assertEqual(None, client._id_cache.get(("ports", "port-1")))
+        self.assertEqual(subnet_id, client._id_cache.get(("subnets",
+                                                          "vxnet-1")))
+
+    def test_stale_evicts(self):
+        client = self._client()
+        client.create_router(name="vpc-1", tenant_id="usr-1",
+                             tenant_name="usr-1", original_id="vpc-1")
+        self._create_vxnet(client)
+        # router deleted and created again by another process
+        other = self._client()
+        other.delete_router("vpc-1")
+        router = other.create_router(name="vpc-1", tenant_id="usr-1",
+                                     tenant_name="usr-1",
+                                     original_id="vpc-1")
+        self.assertRaises(NotFoundException, client.add_router_interface,
+                          "vpc-1", "vxnet-1", "port-1")
+        self.assertEqual(None, client._id_cache.get(("routers", "vpc-1")))
+        client.add_router_interface("vpc-1", "vxnet-1", "port-1")
+        self.assertEqual(router["id"],
+                         client._id_cache.get(("routers", "vpc-1")))
+
+
+class LookupTestCases(ClientTestCase):
+    '''
+    ids looked up by a client with an empty id cache
+    '''
+
+    def setUp(self):
+        super(LookupTestCases, self).setUp()
+        self._create_vxnet(self._client())
+        self.controller.reset_stats()
+        self.controller.latency = {"GET": constant(0.2)}
+        self.lookups = [("networks", "vxnet-1"), ("subnets", "vxnet-1"),
+                        ("ports", "port-1")]
+        # one lookup of each id, and the token of the new client
+        self.requests = {"POST auth": 1, "GET tenants": 1, "GET networks": 1,
+                         "GET subnets": 1, "GET ports": 1}
+
+    def _resolve(self, client, lookups):
+        tenant, ids = client._resolve_ids(lookups, "usr-1")
+        self.assertEqual(client._tenants["usr-1"], tenant)
+        self.assertEqual(ids, [client._id_cache.get(key) if key[1] else None
+                               for key in lookups])
+
+    def test_parallel(self):
+        client = self._client(lookup_concurrency=4)
+        client._get_valid_token()
+        self.controller.reset_stats()
+        self._resolve(client, self.lookups)
+        # lookups are served at the same time
+        self.assertTrue(self.controller.peak_in_flight > 1)
+        self.requests.pop("POST auth")
+        self.assertEqual(self.requests, self.controller.get_stats())
+
+        # cached ids are not looked up again
+        self.controller.reset_stats()
+        self._resolve(client, self.lookups)
+        self.assertEqual({}, self.controller.get_stats())
+
+    def test_duplicate_keys(self):
+        client = self._client(lookup_concurrency=4)
+        self._resolve(client, self.lookups + [("ports", None)] +
+                      self.lookups)
+        self.assertEqual(self.requests, self.controller.get_stats())
+
+    def test_sequential(self):
+        client = self._client(lookup_concurrency=0)
+        self.assertTrue(client._lookup_executor is None)
+        self._resolve(client, self.lookups)
+        self.assertEqual(1, self.controller.peak_in_flight)
+        self.assertEqual(self.requests, self.controller.get_stats())
+
+    def test_not_found(self):
+        client = self._client(lookup_concurrency=4)
+        self.assertRaises(NotFoundException, client.get_ids_by_original_ids,
+                          self.lookups + [("routers", "vpc-1")])
+        self.assertEqual(1, self.controller.get_stats()["GET routers"])
+
+
+class CoalesceTestCases(ClientTestCase):
+
+    def setUp(self):
+        super(CoalesceTestCases, self).setUp()
+        self.controller.latency = {"GET vni_pools": constant(0.2)}
+        self.results = []
+
+    def _get_concurrently(self, client, n=8):
+        def get():
+            self.results.append(client.get_vni_pools())
+
+        threads = [threading.Thread(target=get) for _ in range(n)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def test_coalesce(self):
+        client = self._client()
+        client._get_valid_token()
+        self._get_concurrently(client)
+        self.assertEqual(1, self.controller.get_stats()["GET vni_pools"])
+        self.assertEqual(7, client.get_stats()["coalesced_gets"])
+        self.assertEqual(8, len(self.results))
+
+        # a GET after the shared one is done is sent again
+        client.get_vni_pools()
+        self.assertEqual(2, self.controller.get_stats()["GET vni_pools"])
+        self.assertEqual(7, client.get_stats()["coalesced_gets"])
+
+    def test_isolation(self):
+        client = self._client()
+        client._get_valid_token()
+        self._get_concurrently(client, 4)
+        self.assertEqual(4, len(set(id(r) for r in self.results)))
+        # a caller changing what it got does not change what others got
+        self.results[0].append({"name": "changed"})
+        for result in self.results[1:]:
+            self.assertFalse({"name": "changed"} in result)
+
+    def test_disabled(self):
+        client = self._client(coalesce_gets=False)
+        client._get_valid_token()
+        self._get_concurrently(client)
+        self.assertEqual(8, self.controller.get_stats()["GET vni_pools"])
+        self.assertFalse("coalesced_gets" in client.get_stats())
+
+
+class TenantTestCases(ClientTestCase):
+
+    def test_concurrent_create_vpc(self):
+        self.controller.latency = {"GET tenants": constant(0.05)}
+        driver = NeutronDriver(TerraL3RouterPlugin(), None,
+                               TerraQcExtDriver())
+        threads = [threading.Thread(target=driver.create_vpc,
+                                    args=("vpc-%d" % i, 3000 + i, "usr-1"))
+                   for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        stats = self.controller.get_stats()
+        self.assertEqual(1, stats["POST tenants"])
+        self.assertEqual(8, stats["POST routers"])
+        self.assertEqual(1, len(self.controller.get_items("tenants")))
+
+    def test_create_raced(self):
+        client = self._client()
+        other = self._client()
+        lookup = client.get_id_by_original_id
+        lookups = []
+
+        def racing_lookup(resource, original_id):
+            if not lookups:
+                # another process creates the tenant after our lookup
+                lookups.append(original_id)
+                other.create_tenant(original_id, original_id)
+                raise NotFoundException(msg="tenants %s" % original_id)
+            return lookup(resource, original_id)
+
+        client.get_id_by_original_id = racing_lookup
+        id = client.get_or_create_tenant_by_original_id("usr-1", "usr-1")
+        tenants = self.controller.get_items("tenants")
+        self.assertEqual([id], [t["id"] for t in tenants])
+        self.assertEqual(2, self.controller.get_stats()["POST tenants"])
+        self.assertEqual(id, client._tenants["usr-1"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/evn python
+# -*- coding: utf-8 -*-
+import unittest
+from common.coalescer import CoalescingQueue
+from fakes import RecordingDriver
+
+
+class CoalescingQueueTestCases(unittest.TestCase):
+
+    def setUp(self):
+        super(CoalescingQueueTestCases, self).setUp()
+        self.driver = RecordingDriver()
+        # long window, tests flush explicitly
+        self.queue = CoalescingQueue(self.driver, window=60, max_workers=2)
+
+    def tearDown(self):
+        self.queue.close()
+
+    def test_cancel_pair(self):
+        add = self.queue.submit("add_node", "vxnet-1", 2001, "hyper1",
+                                "usr-1", 10)
+        remove = self.queue.submit("remove_node", "vxnet-1", "hyper1",
+                                   "usr-1")
+        self.queue.flush()
+        self.assertEqual(None, add.result(5))
+        # node may be bound before the add, the remove is kept
+        self.assertEqual(("remove_node", "vxnet-1", "hyper1"),
+                         remove.result(5))
+        self.assertEqual([("remove_node", "vxnet-1", "hyper1")],
+                         self.driver.calls)
+        self.assertEqual(1, self.queue.get_stats()["cancelled"])
+
+        # node unbound by the remove sent, the next pair cancels both
+        add = self.queue.submit("add_node", "vxnet-1", 2001, "hyper1",
+                                "usr-1", 10)
+        remove = self.queue.submit("remove_node", "vxnet-1", "hyper1",
+                                   "usr-1")
+        self.queue.flush()
+        self.assertEqual(None, add.result(5))
+        self.assertEqual(None, remove.result(5))
+        self.assertEqual(1, len(self.driver.calls))
+        self.assertEqual(3, self.queue.get_stats()["cancelled"])
+
+    def test_cancel_bound(self):
+        add = self.queue.submit("add_node", "vxnet-1", 2001, "hyper1",
+                                "usr-1", 10)
+        self.queue.flush()
+        add.result(5)
+        self.queue.submit("add_node", "vxnet-1", 2001, "hyper1", "usr-1",
+                          20)
+        remove = self.queue.submit("remove_node", "vxnet-1", "hyper1",
+                                   "usr-1")
+        self.queue.flush()
+        remove.result(5)
+        self.assertEqual([("add_node", "vxnet-1", "hyper1", 10),
+                          ("remove_node", "vxnet-1", "hyper1")],
+                         self.driver.calls)
+
+    def test_merge_duplicates(self):
+        futures = [self.queue.submit("add_route", "vpc-1", "0.0.0.0/0",
+                                     "10.0.0.254", "leaf1")
+                   for _ in range(3)]
+        self.queue.flush()
+        results = [f.result(5) for f in futures]
+        self.assertEqual([("add_route", "leaf1", "0.0.0.0/0")] * 3, results)
+        self.assertEqual(1, len(self.driver.calls))
+        self.assertEqual(2, self.queue.get_stats()["merged"])
+
+    def test_latest_wins(self):
+        self.queue.submit("add_node", "vxnet-1", 2001, "hyper1", "usr-1", 10)
+        last = self.queue.submit("add_node", "vxnet-1", 2001, "hyper1",
+                                 "usr-1", vlan_id=20)
+        self.queue.flush()
+        last.result(5)
+        self.assertEqual([("add_node", "vxnet-1", "hyper1", 20)],
+                         self.driver.calls)
+
+    def test_remove_then_add_kept(self):
+        self.queue.submit("remove_node", "vxnet-1", "hyper1", "usr-1")
+        add = self.queue.submit("add_node", "vxnet-1", 2001, "hyper1",
+                                "usr-1", 10)
+        self.queue.flush()
+        add.result(5)
+        self.assertEqual([("remove_node", "vxnet-1", "hyper1"),
+                          ("add_node", "vxnet-1", "hyper1", 10)],
+                         self.driver.calls)
+
+    def test_other_operation_flushes(self):
+        self.queue.submit("add_node", "vxnet-1", 2001, "hyper1", "usr-1", 10)
+        self.queue.submit("delete_vxnet", "vxnet-1", "usr-1").result(5)
+        self.assertEqual([("add_node", "vxnet-1", "hyper1", 10),
+                          ("delete_vxnet", "vxnet-1")], self.driver.calls)
+
+    def test_window(self):
+        queue = CoalescingQueue(self.driver, window=0.05)
+        add = queue.submit("add_node", "vxnet-1", 2001, "hyper1", "usr-1", 10)
+        self.assertEqual(("add_node", "vxnet-1", "hyper1", 10),
+                         add.result(5))
+        queue.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
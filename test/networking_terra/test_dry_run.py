@@ -0,0 +1,107 @@
+#!/usr/bin/evn python
+# -*- coding: utf-8 -*-
+import unittest
+from networking_terra.common.client import TerraRestClient
+from networking_terra.common.dry_run import CallRecorder
+from networking_terra.common.exceptions import NotFoundException
+
+URL = "http://terra/api/"
+
+
+class DryRunTestCases(unittest.TestCase):
+
+    def setUp(self):
+        super(DryRunTestCases, self).setUp()
+        client = TerraRestClient(URL, "http://terra/auth", "admin", "pass",
+                                 10, "qingcloud")
+        self.snapshot = {
+            "tenants": [{"id": "t1", "origin": "qingcloud",
+                         "original_id": "usr-1"}],
+            "networks": [{"id": "n1", "origin": "qingcloud",
+                          "original_id": "vxnet-1"},
+                         {"id": "n2", "origin": "qingcloud",
+                          "original_id": "vxnet-2"}],
+            "hosts": [{"id": "h1", "hostname": "hyper1"}],
+        }
+        self.client = client.plan_client(self.snapshot)
+
+    def test_record(self):
+        self.client.create_network("vxnet-3", original_id="vxnet-3",
+                                   tenant_id="usr-1",
+                                   segment_global_id=2003)
+        self.client.delete_network("vxnet-1")
+        recorder = self.client.recorder
+        self.assertEqual(["GET", "POST", "GET", "DELETE"],
+                         [c.method for c in recorder.calls])
+        self.assertEqual(URL + "networks", recorder.calls[1].url)
+        self.assertEqual("t1", recorder.calls[1].payload["tenant_id"])
+        self.assertEqual(URL + "networks/n1", recorder.calls[3].url)
+        self.assertEqual(2, len(recorder.writes()))
+        # snapshot given is left as it is
+        self.assertEqual(2, len(self.snapshot["networks"]))
+
+    def test_created_and_deleted_seen(self):
+        ret = self.client.create_network("vxnet-3", original_id="vxnet-3",
+                                         tenant_id="usr-1")
+        self.assertTrue(ret["id"].startswith("dry-run-"))
+        self.client.delete_network("vxnet-2")
+        networks = self.client.list_resources("networks", origin="qingcloud")
+        self.assertEqual(["n1", ret["id"]], [n["id"] for n in networks])
+        self.assertEqual(ret["id"], self.client.get_id_by_original_id(
+            "networks", "vxnet-3"))
+
+    def test_lookups(self):
+        self.assertEqual("h1", self.client.get_host_by_name("hyper1")["id"])
+        self.assertEqual(None, self.client.get_host_by_name("hyper2"))
+        self.assertEqual("hyper1", self.client.get_host("h1")["hostname"])
+        self.assertRaises(NotFoundException, self.client.get_host, "h2")
+        self.assertEqual(0, len(self.client.recorder.writes()))
+
+    def test_warm_caches(self):
+        live = TerraRestClient(URL, "http://terra/auth", "admin", "pass",
+                               10, "qingcloud")
+        collections = {
+            URL + "devices": [{"id": "d1", "name": "leaf1"}],
+            URL + "host_links": [{"id": "l1", "host_name": "hyper1"}]}
+        urls = []
+
+        def get(url):
+            urls.append(url)
+            return collections[url]
+
+        live._get = get
+        live._id_cache.set(("networks", "vxnet-1"), "n1")
+        live.devices.get_device("leaf1")
+        live.hosts.get_links("hyper1")
+        del urls[:]
+
+        plan = live.plan_client()
+        self.assertEqual("n1", plan.get_id_by_original_id("networks",
+                                                          "vxnet-1"))
+        self.assertEqual("d1", plan.devices.get_device("leaf1")["id"])
+        self.assertEqual(["l1"], [l["id"] for l in
+                                  plan.hosts.get_links("hyper1")])
+        self.assertEqual([], urls)
+        self.assertEqual([], plan.recorder.calls)
+        # the plan doesn't change the caches of the live client
+        plan.hosts.remove_link("l1")
+        plan._id_cache.pop(("networks", "vxnet-1"))
+        self.assertEqual(1, len(live.hosts.get_links("hyper1")))
+        self.assertEqual("n1", live._id_cache.get(("networks", "vxnet-1")))
+
+    def test_live_reader(self):
+        urls = []
+
+        def reader(url):
+            urls.append(url)
+            return [{"id": "n1", "original_id": "vxnet-1"}]
+
+        recorder = CallRecorder(URL, reader=reader)
+        recorder.send("POST", URL + "networks", {"original_id": "vxnet-3"})
+        networks = recorder.send("GET", URL + "networks?original_id=vxnet-3")
+        self.assertEqual(["vxnet-3"], [n["original_id"] for n in networks])
+        self.assertEqual([URL + "networks?original_id=vxnet-3"], urls)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+#!/usr/bin/evn python
+# -*- coding: utf-8 -*-
+import threading
+import time
+import unittest
+from networking_terra.common.async_client import AsyncTerraRestClient
+from networking_terra.common.exceptions import NotFoundException
+from networking_terra.common.executor import BoundedExecutor, \
+    KeyedExecutor, wait_all
+from fakes import FakeClient
+
+
+class BoundedExecutorTestCases(unittest.TestCase):
+
+    def test_bounded(self):
+        executor = BoundedExecutor(3)
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def work(i):
+            with lock:
+                running.append(i)
+                peak.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(i)
+            return i * 2
+
+        self.assertEqual(executor.map(work, range(10)),
+                         [i * 2 for i in range(10)])
+        self.assertEqual(max(peak), 3)
+        executor.shutdown()
+
+    def test_exception(self):
+        executor = BoundedExecutor(2)
+
+        def fail():
+            raise ValueError("fail")
+
+        futures = [executor.submit(fail), executor.submit(lambda: 1)]
+        self.assertRaises(ValueError, wait_all, futures)
+        self.assertIsInstance(futures[0].exception(), ValueError)
+        self.assertEqual(futures[1].result(), 1)
+
+        done = []
+        futures[1].add_done_callback(done.append)
+        self.assertEqual(done, [futures[1]])
+        executor.shutdown()
+
+
+class AsyncClientTestCases(unittest.TestCase):
+
+    def test_future(self):
+        client = AsyncTerraRestClient(FakeClient({"networks": [
+            {"id": "networks-vxnet-1", "original_id": "vxnet-1"}]}),
+            max_workers=2)
+        future = client.get_id_by_original_id("networks", "vxnet-1")
+        self.assertEqual(future.result(), "networks-vxnet-1")
+        future = client.get_id_by_original_id("networks", "missing")
+        self.assertRaises(NotFoundException, future.result)
+        client.close()
+
+
+class KeyedExecutorTestCases(unittest.TestCase):
+
+    def setUp(self):
+        super(KeyedExecutorTestCases, self).setUp()
+        self.executor = KeyedExecutor(8)
+        self.events = []
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def work(self, name, delay=0.05):
+        with self.lock:
+            self.events.append(("start", name))
+        time.sleep(delay)
+        with self.lock:
+            self.events.append(("end", name))
+        return name
+
+    def test_same_key_in_order(self):
+        futures = [self.executor.submit(["vxnet:1"], self.work, (i, 0.02))
+                   for i in range(5)]
+        self.assertEqual(wait_all(futures), list(range(5)))
+        expected = []
+        for i in range(5):
+            expected += [("start", i), ("end", i)]
+        self.assertEqual(self.events, expected)
+
+    def test_unrelated_concurrent(self):
+        start = time.time()
+        futures = [self.executor.submit(["vxnet:%d" % i], self.work, (i,))
+                   for i in range(5)]
+        wait_all(futures)
+        self.assertTrue(time.time() - start < 0.2)
+
+    def test_shared_keys(self):
+        create = self.executor.submit(["vpc"], self.work, ("create",))
+        joins = [self.executor.submit(["vxnet:%d" % i], self.work,
+                                      ("join%d" % i,), shared_keys=["vpc"])
+                 for i in range(3)]
+        delete = self.executor.submit(["vpc"], self.work, ("delete",))
+        wait_all([create, delete] + joins)
+        index = self.events.index
+        for i in range(3):
+            self.assertTrue(index(("end", "create")) <
+                            index(("start", "join%d" % i)))
+            self.assertTrue(index(("end", "join%d" % i)) <
+                            index(("start", "delete")))
+        # joins run concurrently
+        self.assertTrue(index(("start", "join2")) < index(("end", "join0")))
+
+    def test_failure_does_not_block(self):
+        def fail():
+            raise ValueError("fail")
+
+        first = self.executor.submit(["key"], fail)
+        second = self.executor.submit(["key"], self.work, ("second",))
+        self.assertRaises(ValueError, first.result)
+        self.assertEqual(second.result(), "second")
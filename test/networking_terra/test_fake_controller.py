@@ -0,0 +1,102 @@
+#!/usr/bin/evn python
+# -*- coding: utf-8 -*-
+import unittest
+from networking_terra.common.client import TerraRestClient
+from networking_terra.common.exceptions import BadRequestException, \
+    NotFoundException, ServerErrorException
+from networking_terra.testing.fake_controller import FakeTerraController, \
+    constant, get_template
+
+
+class FakeControllerTestCases(unittest.TestCase):
+
+    def setUp(self):
+        super(FakeControllerTestCases, self).setUp()
+        self.controller = FakeTerraController(seed=1)
+        self.controller.add_device("leaf1", ["Ethernet1/1", "Ethernet1/2"])
+        self.controller.start()
+        self.client = self._client()
+
+    def tearDown(self):
+        self.client.close()
+        self.controller.stop()
+
+    def _client(self, **kwargs):
+        return TerraRestClient(self.controller.url, self.controller.auth_url,
+                               "admin", "pass", 5, "qingcloud",
+                               lookup_concurrency=0, **kwargs)
+
+    def test_template(self):
+        self.assertEqual("routers/{id}/add_interfaces",
+                         get_template("routers/r-1/add_interfaces"))
+        self.assertEqual("routers/{id}/routes/{id}",
+                         get_template("/routers/r-1/routes/rt-2"))
+
+    def test_vpc(self):
+        client = self.client
+        client.create_router(name="vpc-1", tenant_id="usr-1",
+                             tenant_name="usr-1", original_id="vpc-1",
+                             l3_vni=3001)
+        client.create_network("vxnet-1", original_id="vxnet-1",
+                              tenant_id="usr-1", segment_global_id=2001)
+        client.create_subnet("vxnet-1", original_id="vxnet-1",
+                             tenant_id="usr-1", network_id="vxnet-1",
+                             cidr="10.0.1.0/24", gateway_ip="10.0.1.1")
+        client.add_router_interface("vpc-1", "vxnet-1", None)
+        router_id = client.get_id_by_original_id("routers", "vpc-1")
+        self.assertEqual(1, len(client.get_router_interfaces(router_id)))
+        self.assertRaises(BadRequestException, client.add_router_interface,
+                          "vpc-1", "vxnet-1", None)
+
+        client.create_port_binding(network_id="vxnet-1", switch_name="leaf1",
+                                   interface_name="Ethernet1/1")
+        binding = client.get_port_binding("vxnet-1", "leaf1", "Ethernet1/1")
+        self.assertEqual("Ethernet1/1", binding["interface_name"])
+        client.delete_port_binding("vxnet-1", "leaf1", "Ethernet1/1")
+
+        client.del_router_interface("vpc-1", "vxnet-1", None)
+        client.delete_subnet("vxnet-1")
+        client.delete_network("vxnet-1")
+        client.delete_router("vpc-1")
+        self.assertRaises(NotFoundException, client.get_router, router_id)
+        self.assertEqual(1, len(self.controller.get_items("tenants")))
+
+    def test_lookups(self):
+        self.assertEqual("leaf1", self.client.get_switch("leaf1")["name"])
+        self.client.create_host("hyper1", "10.1.1.1")
+        self.client.add_host_links([{
+            "host_name": "hyper1", "host_interface_name": "eth0",
+            "switch_name": "leaf1", "switch_interface_name": "Ethernet1/1"}])
+        self.assertEqual(1, len(
+            self.client.get_host_links_by_hostname("hyper1")))
+        self.assertEqual("10.1.1.1",
+                         self.client.get_host_by_name("hyper1")["host_ip"])
+        for i in range(5):
+            self.client.create_tenant("usr-%d" % i)
+        self.assertEqual(5, len(self.client.list_resources(
+            "tenants", page_size=2, origin="qingcloud")))
+        stats = self.controller.get_stats()
+        self.assertEqual(3, stats["GET tenants"])
+
+    def test_errors(self):
+        self.controller.busy_rate = 1
+        self.assertRaises(BadRequestException, self.client.create_router,
+                          name="vpc-1", tenant_id="usr-1",
+                          original_id="vpc-1")
+        self.controller.busy_rate = 0
+        self.controller.errors = {"GET devices": (1, 500)}
+        self.assertRaises(ServerErrorException, self.client._get,
+                          self.client.url + "devices")
+
+    def test_latency_and_token(self):
+        self.controller.latency = {"GET": constant(0.05)}
+        self.controller.token_lifetime = 0.1
+        client = self._client(token_lifetime=0.1, token_refresh_margin=0)
+        client.get_vni_pools()
+        client.get_vni_pools()
+        self.assertTrue(client.get_stats()["token_refreshes"] >= 2)
+        client.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
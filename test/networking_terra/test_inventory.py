@@ -0,0 +1,106 @@
+#!/usr/bin/evn python
+# -*- coding: utf-8 -*-
+import unittest
+from networking_terra.common.inventory import DeviceInventory, HostTopology
+from fakes import FakeClient
+
+
+class DeviceInventoryTestCases(unittest.TestCase):
+
+    def setUp(self):
+        super(DeviceInventoryTestCases, self).setUp()
+        self.client = FakeClient({"devices": [
+            {"id": "d1", "name": "leaf1",
+             "interfaces": [{"id": "i1", "name": "Ethernet1/1"},
+                            {"id": "i2", "name": "Ethernet1/2"}]},
+            {"id": "d2", "name": "leaf2"}]})
+
+    def test_lookup_once(self):
+        inventory = DeviceInventory(self.client, 30)
+        self.assertEqual(inventory.get_device("leaf1")["id"], "d1")
+        self.assertEqual(inventory.get_device("leaf2")["id"], "d2")
+        self.assertEqual(
+            inventory.get_interface("leaf1", "Ethernet1/2")["id"], "i2")
+        self.assertEqual(self.client.urls, ["http://terra/devices"])
+
+    def test_reload_on_miss(self):
+        inventory = DeviceInventory(self.client, 30)
+        inventory.get_device("leaf1")
+        self.client.collections["devices"].append({"id": "d3",
+                                                   "name": "leaf3"})
+        # index loaded more than miss_interval ago
+        inventory._loaded_at -= inventory.miss_interval
+        self.assertEqual(inventory.get_device("leaf3")["id"], "d3")
+        self.assertIsNone(inventory.get_interface("leaf2", "Ethernet1/1"))
+
+    def test_repeated_misses(self):
+        inventory = DeviceInventory(self.client, 30)
+        for _ in range(3):
+            self.assertIsNone(inventory.get_device("spine1"))
+            self.assertIsNone(inventory.get_interface("leaf1", "po9"))
+        self.assertEqual(self.client.urls, ["http://terra/devices"])
+
+        # one reload per miss_interval, misses are then cached
+        inventory._loaded_at -= inventory.miss_interval
+        for _ in range(3):
+            self.assertIsNone(inventory.get_device("spine1"))
+            self.assertIsNone(inventory.get_device("spine2"))
+        self.assertEqual(self.client.urls, ["http://terra/devices"] * 2)
+
+    def test_no_cache(self):
+        inventory = DeviceInventory(self.client, 0)
+        inventory.get_device("leaf1")
+        inventory.get_device("leaf1")
+        self.assertEqual(self.client.urls,
+                         ["http://terra/devices?name=leaf1"] * 2)
+
+
+class HostTopologyTestCases(unittest.TestCase):
+
+    def setUp(self):
+        super(HostTopologyTestCases, self).setUp()
+        self.client = FakeClient({"host_links": [
+            {"id": "l1", "host_name": "host1",
+             "switch_name": "leaf1", "switch_interface_name": "po1"},
+            {"id": "l2", "host_name": "host2",
+             "switch_name": "leaf2", "switch_interface_name": "po2"}]})
+
+    def test_bulk_load(self):
+        topology = HostTopology(self.client, 600)
+        self.assertEqual(topology.get_links("host1")[0]["id"], "l1")
+        self.assertEqual(topology.get_links("host2")[0]["id"], "l2")
+        self.assertEqual(self.client.urls, ["http://terra/host_links"])
+
+    def test_update(self):
+        topology = HostTopology(self.client, 600)
+        topology.refresh()
+        topology.add_links([{"id": "l3", "host_name": "host3",
+                             "switch_name": "leaf1",
+                             "switch_interface_name": "po3"}])
+        self.assertEqual(topology.get_links("host3")[0]["id"], "l3")
+
+        topology.remove_link("l1")
+        self.client.collections["host_links"] = []
+        topology._loaded_at -= topology.miss_interval
+        self.assertEqual(topology.get_links("host1"), [])
+        # host known to have no link left, no reload
+        self.assertEqual(len(self.client.urls), 1)
+
+    def test_unlinked_hosts(self):
+        topology = HostTopology(self.client, 600)
+        topology.refresh()
+        topology._loaded_at -= topology.miss_interval
+        # binding and unbinding hosts without links, as add_nodes does
+        for _ in range(3):
+            for i in range(3, 8):
+                self.assertEqual(topology.get_links("host%d" % i), [])
+        self.assertEqual(len(self.client.urls), 2)
+
+        topology.add_links([{"id": "l3", "host_name": "host3",
+                             "switch_name": "leaf1",
+                             "switch_interface_name": "po3"}])
+        self.assertEqual(topology.get_links("host3")[0]["id"], "l3")
+        topology.remove_link("l3")
+        self.assertEqual(topology.get_links("host3"), [])
+        self.assertEqual(len(self.client.urls), 2)
+
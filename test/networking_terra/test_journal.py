@@ -0,0 +1,218 @@
+#!/usr/bin/evn python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from common.journal import JournaledDriver, OperationJournal
+from networking_terra.common import retry
+from networking_terra.common.exceptions import BadRequestException
+from base import ControllerTestCase
+from fakes import RecordingDriver
+
+
+class BlockingDriver(RecordingDriver):
+    '''
+    RecordingDriver holding delete_vpc until released
+    '''
+
+    def __init__(self):
+        super(BlockingDriver, self).__init__()
+        self.release = threading.Event()
+
+    def delete_vpc(self, vpc_id, user_id, **kwargs):
+        ret = super(BlockingDriver, self).delete_vpc(vpc_id, user_id,
+                                                     **kwargs)
+        self.release.wait(5)
+        return ret
+
+
+class JournalTestCases(unittest.TestCase):
+
+    def setUp(self):
+        super(JournalTestCases, self).setUp()
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "journal")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_pending_after_crash(self):
+        journal = OperationJournal(self.path)
+        done = journal.begin("create_vpc", ["vpc-1", 1000, "usr-1"])
+        journal.begin("create_vxnet", ["vxnet-1", 1001, "10.0.0.0/24",
+                                       "10.0.0.1", "usr-1"],
+                      {"enable_dhcp": True})
+        journal.finish(done)
+        # crash in the middle of a record
+        with open(self.path, "a") as f:
+            f.write('{"seq": 3, "op": "join')
+        journal.close()
+
+        journal = OperationJournal(self.path)
+        pending = journal.pending()
+        self.assertEqual([r["op"] for r in pending], ["create_vxnet"])
+        self.assertEqual(pending[0]["kwargs"], {"enable_dhcp": True})
+        self.assertEqual(journal.begin("join_vpc"), 3)
+        journal.close()
+
+    def test_compact(self):
+        journal = OperationJournal(self.path, compact_threshold=3)
+        seqs = [journal.begin("add_node", ["vxnet-1", 1001, "host%d" % i])
+                for i in range(4)]
+        for seq in seqs[:3]:
+            journal.finish(seq)
+        with open(self.path) as f:
+            self.assertEqual(len(f.readlines()), 1)
+        journal.close()
+        journal = OperationJournal(self.path)
+        self.assertEqual([r["seq"] for r in journal.pending()], [4])
+        journal.close()
+
+    def test_recover(self):
+        journal = OperationJournal(self.path)
+        journal.begin("create_vxnet", ["vxnet-1", 1001, "10.0.0.0/24",
+                                       "10.0.0.1", "usr-1"])
+        journal.begin("join_vpc", ["vpc-1", "vxnet-1", "usr-1"])
+        journal.close()
+
+        driver = RecordingDriver(fail=("join_vpc", "vxnet-1"))
+        journaled = JournaledDriver(driver, OperationJournal(self.path))
+        results = journaled.recover()
+        self.assertIsNone(results[1])
+        self.assertIsInstance(results[2], BadRequestException)
+        self.assertEqual(driver.calls, [("create_vxnet", "vxnet-1"),
+                                        ("join_vpc", "vxnet-1")])
+        self.assertEqual(journaled.journal.pending(), [])
+        journaled.close()
+
+    def test_write_behind(self):
+        driver = RecordingDriver()
+        journaled = JournaledDriver(driver, OperationJournal(self.path),
+                                    write_behind=True)
+        create = journaled.create_vxnet("vxnet-1", 1001, "10.0.0.0/24",
+                                        "10.0.0.1", "usr-1")
+        join = journaled.join_vpc("vpc-1", "vxnet-1", "usr-1")
+        create.result()
+        join.result()
+        self.assertEqual(driver.calls, [("create_vxnet", "vxnet-1"),
+                                        ("join_vpc", "vxnet-1")])
+        journaled.close()
+        self.assertEqual(OperationJournal(self.path).pending(), [])
+
+    def _replay_then_create(self, write_behind):
+        journal = OperationJournal(self.path)
+        journal.begin("delete_vpc", ["vpc-1", "usr-1"])
+        journal.close()
+        driver = BlockingDriver()
+        journaled = JournaledDriver(driver, OperationJournal(self.path),
+                                    write_behind=write_behind)
+        pending = journaled.journal.pending
+        # new call made before the replay is queued
+        journaled.journal.pending = lambda: time.sleep(0.02) or pending()
+        recovering = journaled.recover(background=True)
+        created = []
+        create = threading.Thread(target=lambda: created.append(
+            journaled.create_vpc("vpc-1", 3001, "usr-1")))
+        create.start()
+        time.sleep(0.05)
+        self.assertEqual([("delete_vpc", "vpc-1")], driver.calls)
+        driver.release.set()
+        recovering.join(5)
+        create.join(5)
+        if write_behind:
+            created[0].result(5)
+        journaled.close()
+        self.assertEqual([("delete_vpc", "vpc-1"), ("create_vpc", "vpc-1")],
+                         driver.calls)
+
+    def test_calls_wait_for_replay(self):
+        self._replay_then_create(False)
+
+    def test_write_behind_calls_wait_for_replay(self):
+        self._replay_then_create(True)
+
+    def test_not_serializable(self):
+        journal = OperationJournal(self.path)
+        journal.begin("delete_vpc", ["vpc-1", "usr-1"],
+                      {"cascade": True, "progress": lambda *args: None})
+        self.assertEqual({"cascade": True}, journal.pending()[0]["kwargs"])
+
+        # callbacks are passed to the operation, not journaled
+        driver = RecordingDriver()
+        journaled = JournaledDriver(driver, journal)
+        progress = []
+        journaled.delete_vpc("vpc-2", "usr-1", progress=progress.append)
+        self.assertEqual([("delete_vpc", "vpc-2")], driver.calls)
+
+        self.assertRaises(ValueError, journaled.create_vpc, object(), 3001,
+                          "usr-1")
+        self.assertEqual(1, len(driver.calls))
+        self.assertEqual(["vpc-1"],
+                         [r["args"][0] for r in journal.pending()])
+        journaled.close()
+
+    def test_write_behind_not_submitted(self):
+        journaled = JournaledDriver(RecordingDriver(),
+                                    OperationJournal(self.path),
+                                    write_behind=True)
+        self.assertRaises(TypeError, journaled.create_vpc, "vpc-1")
+        journaled.executor.shutdown()
+        self.assertRaises(RuntimeError, journaled.create_vpc, "vpc-1", 3001,
+                          "usr-1")
+        self.assertEqual([], journaled.journal.pending())
+        journaled.journal.close()
+
+
+class ReplayTestCases(ControllerTestCase):
+    '''
+    journaled operations replayed against a fake controller
+    '''
+
+    def setUp(self):
+        super(ReplayTestCases, self).setUp()
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "journal")
+        self.sleeps = []
+        self._sleep = retry.cooperative_sleep
+        retry.cooperative_sleep = self.sleeps.append
+        self.driver = self._driver()
+
+    def tearDown(self):
+        retry.cooperative_sleep = self._sleep
+        shutil.rmtree(self.dir)
+        super(ReplayTestCases, self).tearDown()
+
+    def test_already_applied(self):
+        self.driver.create_vpc("vpc-1", 3001, "usr-1")
+        self.driver.create_vxnet("vxnet-1", 2001, "10.0.1.0/24",
+                                 "10.0.1.1", "usr-1")
+        self.driver.join_vpc("vpc-1", "vxnet-1", "usr-1")
+        # crash after terra dc applied them, before they were finished
+        journal = OperationJournal(self.path)
+        journal.begin("create_vpc", ["vpc-1", 3001, "usr-1"])
+        journal.begin("join_vpc", ["vpc-1", "vxnet-1", "usr-1"])
+        journal.close()
+
+        self.controller.reset_stats()
+        journaled = JournaledDriver(self.driver, OperationJournal(self.path))
+        self.assertEqual({1: None, 2: None}, journaled.recover())
+        # rejected at once, not retried
+        self.assertEqual([], self.sleeps)
+        stats = self.controller.get_stats()
+        self.assertEqual(1, stats["POST routers"])
+        self.assertEqual(1, stats["POST routers/{id}/add_interfaces"])
+        self.assertEqual([], journaled.journal.pending())
+        journaled.close()
+
+    def test_background(self):
+        journal = OperationJournal(self.path)
+        journal.begin("create_vpc", ["vpc-1", 3001, "usr-1"])
+        journal.close()
+        journaled = JournaledDriver(self.driver, OperationJournal(self.path))
+        journaled.recover(background=True).join(5)
+        self.assertEqual([], journaled.journal.pending())
+        self.assertEqual(1, len(self.controller.get_items("routers")))
+        journaled.close()
@@ -0,0 +1,140 @@
+#!/usr/bin/evn python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+from networking_terra.common.client import TerraRestClient
+from networking_terra.common.exceptions import InitializException, \
+    NotFoundException, TimeoutException
+from networking_terra.common.metrics import ClientMetrics, MetricsSink, \
+    PrometheusTextfileSink, StatsdSink, get_endpoint, get_sink
+from networking_terra.testing.fake_controller import FakeTerraController, \
+    constant
+
+BASE = "http://127.0.0.1:8080/api/"
+
+
+class EndpointTestCases(unittest.TestCase):
+
+    def test_endpoint(self):
+        self.assertEqual("routers/{id}/add_interfaces",
+                         get_endpoint(BASE + "routers/r-1/add_interfaces",
+                                      BASE))
+        self.assertEqual("tenants",
+                         get_endpoint(BASE + "tenants?origin=qingcloud",
+                                      BASE))
+        self.assertEqual("port_bindings", get_endpoint(
+            BASE + "port_bindings?switch_name=leaf1&interface_name=e1",
+            BASE))
+        self.assertEqual("auth", get_endpoint("http://127.0.0.1:8080/auth",
+                                              BASE))
+
+
+class ClientMetricsTestCases(unittest.TestCase):
+
+    def setUp(self):
+        super(ClientMetricsTestCases, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_histogram(self):
+        metrics = ClientMetrics(buckets=(0.01, 0.1))
+        metrics.observe("GET", "routers/{id}", 200, 0.005)
+        metrics.observe("GET", "routers/{id}", 200, 0.1)
+        metrics.observe("GET", "routers/{id}", 404, 1)
+        metrics.incr("timeouts", "GET", "routers/{id}")
+        snapshot = metrics.snapshot()
+        self.assertEqual([1, 1, 1],
+                         snapshot["latency"][("GET", "routers/{id}")]
+                         ["buckets"])
+        counters = snapshot["counters"]
+        self.assertEqual(2, counters[("requests", "GET", "routers/{id}",
+                                      200)])
+        self.assertEqual(1, counters[("requests", "GET", "routers/{id}",
+                                      404)])
+        self.assertEqual(1, counters[("timeouts", "GET", "routers/{id}",
+                                      None)])
+
+    def test_prometheus(self):
+        path = os.path.join(self.tmp, "terra.prom")
+        metrics = ClientMetrics([PrometheusTextfileSink(path)],
+                                buckets=(0.01, 0.1))
+        metrics.observe("POST", "routers/{id}/add_interfaces", 201, 0.05)
+        metrics.incr("retries", "POST", "routers/{id}/add_interfaces")
+        metrics.close()
+        with open(path) as f:
+            text = f.read()
+        labels = 'method="POST",endpoint="routers/{id}/add_interfaces"'
+        self.assertTrue('terra_client_request_duration_seconds_bucket'
+                        '{%s,le="0.01"} 0' % labels in text)
+        self.assertTrue('terra_client_request_duration_seconds_bucket'
+                        '{%s,le="+Inf"} 1' % labels in text)
+        self.assertTrue('terra_client_requests_total{%s,code="201"} 1'
+                        % labels in text)
+        self.assertTrue('terra_client_retries_total{%s} 1' % labels in text)
+        self.assertEqual(["terra.prom"], os.listdir(self.tmp))
+
+    def test_statsd(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(("127.0.0.1", 0))
+        server.settimeout(5)
+        sink = get_sink("statsd:127.0.0.1:%d" % server.getsockname()[1])
+        self.assertTrue(isinstance(sink, StatsdSink))
+        metrics = ClientMetrics([sink])
+        metrics.observe("GET", "routers/{id}", 200, 0.0125)
+        self.assertEqual(b"terra.client.routers.id.GET.time:12.500|ms\n"
+                         b"terra.client.routers.id.GET.status.200:1|c",
+                         server.recv(4096))
+        metrics.incr("token_refreshes", "POST", "auth")
+        self.assertEqual(b"terra.client.auth.POST.token_refreshes:1|c",
+                         server.recv(4096))
+        metrics.close()
+        server.close()
+
+    def test_get_sink(self):
+        self.assertTrue(isinstance(get_sink("prometheus:/tmp/t.prom"),
+                                   PrometheusTextfileSink))
+        self.assertTrue(isinstance(
+            get_sink("networking_terra.common.metrics.MetricsSink"),
+            MetricsSink))
+        self.assertRaises(InitializException, get_sink, "graphite:x")
+
+
+class ClientEndpointMetricsTestCases(unittest.TestCase):
+
+    def setUp(self):
+        super(ClientEndpointMetricsTestCases, self).setUp()
+        self.controller = FakeTerraController(seed=1)
+        self.controller.start()
+        self.client = TerraRestClient(
+            self.controller.url, self.controller.auth_url, "admin", "pass",
+            0.2, "qingcloud", lookup_concurrency=0)
+
+    def tearDown(self):
+        self.client.close()
+        self.controller.stop()
+
+    def test_client(self):
+        self.client.get_vni_pools()
+        self.assertRaises(NotFoundException, self.client.get_router, "r-1")
+        self.controller.latency = {"GET routers/{id}": constant(0.5)}
+        self.assertRaises(TimeoutException, self.client.get_router, "r-2")
+        counters = self.client.metrics.snapshot()["counters"]
+        self.assertEqual(1, counters[("requests", "GET", "vni_pools", 200)])
+        self.assertEqual(1, counters[("requests", "GET", "routers/{id}",
+                                      404)])
+        self.assertEqual(2, counters[("timeouts", "GET", "routers/{id}",
+                                      None)])
+        self.assertEqual(1, counters[("retries", "GET", "routers/{id}",
+                                      None)])
+        self.assertEqual(1, counters[("token_refreshes", "POST", "auth",
+                                      None)])
+        self.assertEqual(1, counters[("requests", "POST", "auth", 200)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,407 @@
+#!/usr/bin/evn python
+# -*- coding: utf-8 -*-
+import collections
+import threading
+import time
+import unittest
+from oslo_config import cfg
+from common.driver_executor import DriverExecutor
+from common.neutron_driver import NeutronDriver, Tombstone
+from networking_terra.common import retry
+from networking_terra.common.executor import Future, wait_all
+from networking_terra.common.exceptions import BadRequestException, \
+    NotFoundException, TeardownException
+from base import ControllerTestCase
+from fakes import RecordingDriver
+
+
+class FakeMl2(object):
+
+    def __init__(self, links):
+        self.links = links
+        self.calls = []
+        self.lookups = []
+        self.lock = threading.Lock()
+        self.busy = collections.defaultdict(int)
+        self.peak = 0
+
+    def get_host_switch_connection(self, host):
+        with self.lock:
+            self.lookups.append(host)
+        if host not in self.links:
+            raise BadRequestException(msg="no link for %s" % host)
+        return self.links[host], "po1"
+
+    def _call(self, name, context):
+        host = context.host
+        link = context.current["binding:profile"][
+            "local_link_information"][0]
+        switch = link["switch_info"]
+        with self.lock:
+            self.busy[switch] += 1
+            self.peak = max(self.peak, self.busy[switch])
+            self.calls.append((name, host, switch))
+        time.sleep(0.02)
+        with self.lock:
+            self.busy[switch] -= 1
+
+    def bind_port(self, context):
+        self._call("bind_port", context)
+
+    def delete_port_precommit(self, context):
+        pass
+
+    def delete_port_postcommit(self, context):
+        self._call("delete_port", context)
+
+
+class NeutronDriverTestCases(unittest.TestCase):
+
+    def setUp(self):
+        super(NeutronDriverTestCases, self).setUp()
+        links = {}
+        for i in range(12):
+            links["host%d" % i] = "leaf%d" % (i % 3)
+        self.ml2 = FakeMl2(links)
+        self.driver = NeutronDriver(None, self.ml2, None)
+
+    def test_add_nodes(self):
+        hosts = ["host%d" % i for i in range(12)] + ["unknown"]
+        ret = self.driver.add_nodes("vxnet-1", 1001, hosts, "usr-1", 10,
+                                    max_workers=3)
+        self.assertEqual(len(self.ml2.calls), 12)
+        self.assertIsInstance(ret.pop("unknown"), BadRequestException)
+        self.assertEqual(ret, dict((host, None) for host in hosts[:-1]))
+        # links are looked up once, bindings on one switch never overlap
+        self.assertEqual(sorted(hosts), sorted(self.ml2.lookups))
+        self.assertTrue(all(self.ml2.links[host] == switch
+                            for _, host, switch in self.ml2.calls))
+        self.assertEqual(1, self.ml2.peak)
+
+    def test_switch_workers(self):
+        cfg.CONF.set_override("bulk_switch_workers", 2, "ml2_terra")
+        self.addCleanup(cfg.CONF.clear_override, "bulk_switch_workers",
+                        "ml2_terra")
+        hosts = ["host%d" % i for i in range(12)]
+        self.driver.add_nodes("vxnet-1", 1001, hosts, "usr-1", 10,
+                              max_workers=6)
+        self.assertEqual(len(self.ml2.calls), 12)
+        self.assertEqual(2, self.ml2.peak)
+
+    def test_remove_nodes(self):
+        hosts = ["host%d" % i for i in range(4)]
+        ret = self.driver.remove_nodes("vxnet-1", hosts, "usr-1")
+        self.assertEqual(sorted(call[:2] for call in self.ml2.calls),
+                         [("delete_port", host) for host in hosts])
+        self.assertEqual(ret, dict((host, None) for host in hosts))
+
+
+class ProvisionVpcTestCases(unittest.TestCase):
+
+    border_leaves = [{"switch_name": "leaf%d" % i,
+                      "interface_name": "Ethernet1/48",
+                      "network_id": "bgp-%d" % i,
+                      "ip_network": "169.254.%d.0/24" % i,
+                      "ip_address": "169.254.%d.1" % i,
+                      "vlan_id": 2,
+                      "nexthop": "169.254.%d.2" % i,
+                      "routes": ["0.0.0.0/0"]} for i in range(2)]
+    vxnets = [{"vxnet_id": "vxnet-1", "vni": 1001,
+               "ip_network": "172.31.21.0/24",
+               "gateway_ip": "172.31.21.1"}]
+
+    def test_provision(self):
+        driver = RecordingDriver()
+        steps = driver.provision_vpc("vpc-1", 1000, "usr-1",
+                                     self.border_leaves, self.vxnets)
+        self.assertEqual(len(steps), 9)
+        calls = driver.calls
+        self.assertEqual(len(calls), 9)
+        for i in range(2):
+            self.assertTrue(calls.index(("create_vpc", "vpc-1")) <
+                            calls.index(("add_subintf", "bgp-%d" % i)) <
+                            calls.index(("add_route", "leaf%d" % i,
+                                         "0.0.0.0/0")))
+        self.assertTrue(calls.index(("create_vxnet", "vxnet-1")) <
+                        calls.index(("join_vpc", "vxnet-1")))
+
+    def test_rollback(self):
+        driver = RecordingDriver(fail=("join_vpc", "vxnet-1"))
+        try:
+            driver.provision_vpc("vpc-1", 1000, "usr-1",
+                                 self.border_leaves, self.vxnets)
+            self.fail("provision should fail")
+        except Exception as e:
+            self.assertEqual(e.task, "join:vxnet-1")
+        undo = [c for c in driver.calls
+                if c[0] in ("delete_vpc", "delete_vxnet", "leave_vpc",
+                            "delete_subintf", "delete_routes")]
+        self.assertNotIn(("leave_vpc", "vxnet-1"), undo)
+        self.assertIn(("delete_vxnet", "vxnet-1"), undo)
+        # vpc created first is deleted last
+        self.assertEqual(driver.calls[-1], ("delete_vpc", "vpc-1"))
+
+
+class DriverExecutorTestCases(unittest.TestCase):
+
+    def test_keys(self):
+        executor = DriverExecutor(RecordingDriver())
+        self.assertEqual(executor.get_keys("join_vpc", "vpc-1", "vxnet-1",
+                                           "usr-1"),
+                         (["vxnet:vxnet-1"], ["vpc:vpc-1"]))
+        self.assertEqual(executor.get_keys("add_node", "vxnet-1", 1001,
+                                           "host1", "usr-1", 10),
+                         (["node:vxnet-1:host1"], ["vxnet:vxnet-1"]))
+        self.assertRaises(ValueError, executor.get_keys, "get_routes")
+        executor.shutdown()
+
+    def test_order(self):
+        driver = RecordingDriver()
+        executor = DriverExecutor(driver, max_workers=4)
+        futures = []
+        for i in range(4):
+            vxnet_id = "vxnet-%d" % i
+            futures.append(executor.submit("create_vxnet", vxnet_id, 1000 + i,
+                                           "10.0.%d.0/24" % i, "10.0.%d.1" % i,
+                                           "usr-1"))
+            futures.append(executor.submit("join_vpc", "vpc-1", vxnet_id,
+                                           "usr-1"))
+        wait_all(futures)
+        for i in range(4):
+            vxnet_id = "vxnet-%d" % i
+            self.assertTrue(driver.calls.index(("create_vxnet", vxnet_id)) <
+                            driver.calls.index(("join_vpc", vxnet_id)))
+        executor.shutdown()
+
+
+class FakeTeardownClient(object):
+
+    def __init__(self, fail=()):
+        self.calls = []
+        self.fail = fail
+        self.lock = threading.Lock()
+
+    def _record(self, *call):
+        with self.lock:
+            self.calls.append(call)
+        if call[0] in self.fail:
+            raise BadRequestException(msg="fail %s" % (call,))
+
+    def get_id_by_original_id(self, resource, original_id):
+        return "r1"
+
+    def list_router_routes(self, router_id):
+        self._record("list_routes", router_id)
+        return [{"id": "rt%d" % i, "destination": "10.%d.0.0/16" % i}
+                for i in range(3)]
+
+    def get_router_bgp_peers(self, vpc_id):
+        self._record("list_bgp_peers", vpc_id)
+        return [{"id": "bgp0"}]
+
+    def get_router_interfaces(self, router_id):
+        self._record("list_interfaces", router_id)
+        return [{"subnet_id": "s1", "port_id": "p1"},
+                {"subnet_id": "s2"}]
+
+    def delete_router_route(self, router_id, route_id):
+        self._record("delete_route", route_id)
+
+    def delete_router_bgp_peer(self, vpc_id, peer_id):
+        self._record("delete_bgp_peer", peer_id)
+
+    def del_router_interface_by_id(self, router_id, subnet_id, port_id=None):
+        self._record("remove_interface", subnet_id)
+
+    def delete_port_by_id(self, id):
+        self._record("delete_port", id)
+
+
+class FakeQcext(object):
+
+    def __init__(self, client):
+        self.client = client
+
+
+class FakeL3(object):
+
+    def __init__(self):
+        self.deleted = []
+
+    def delete_router(self, context, id):
+        self.deleted.append(id)
+
+
+class DeleteVpcTestCases(unittest.TestCase):
+
+    def setUp(self):
+        super(DeleteVpcTestCases, self).setUp()
+        self._sleep = retry.cooperative_sleep
+        retry.cooperative_sleep = lambda seconds: None
+
+    def tearDown(self):
+        retry.cooperative_sleep = self._sleep
+        super(DeleteVpcTestCases, self).tearDown()
+
+    def test_cascade(self):
+        client = FakeTeardownClient()
+        l3 = FakeL3()
+        driver = NeutronDriver(l3, None, FakeQcext(client))
+        done = []
+        results = driver.delete_vpc("vpc-1", "usr-1", cascade=True,
+                                    max_workers=4,
+                                    progress=lambda s, e: done.append(s))
+        self.assertEqual(6, len(results))
+        self.assertEqual(sorted(results), sorted(done))
+        self.assertEqual(["vpc-1"], l3.deleted)
+        ops = [c[0] for c in client.calls]
+        # each kind is listed once, interfaces go after routes and peers
+        self.assertEqual(1, ops.count("list_routes"))
+        self.assertEqual(3, ops.count("delete_route"))
+        self.assertTrue(max(i for i, op in enumerate(ops)
+                            if op in ("delete_route", "delete_bgp_peer")) <
+                        min(i for i, op in enumerate(ops)
+                            if op == "remove_interface"))
+        self.assertEqual(1, ops.count("delete_port"))
+
+    def test_partial_failure(self):
+        client = FakeTeardownClient(fail=("delete_bgp_peer",))
+        l3 = FakeL3()
+        driver = NeutronDriver(l3, None, FakeQcext(client))
+        try:
+            driver.delete_vpc("vpc-1", "usr-1", cascade=True)
+            self.fail("TeardownException not raised")
+        except TeardownException as e:
+            self.assertTrue(e.results["bgp_peer:bgp0"])
+            self.assertEqual(None, e.results["interface:s1"])
+        self.assertEqual([], l3.deleted)
+
+
+class CascadeTestCases(ControllerTestCase):
+    '''
+    cascade delete against a fake controller
+    '''
+
+    def setUp(self):
+        super(CascadeTestCases, self).setUp()
+        self._sleep = retry.cooperative_sleep
+        retry.cooperative_sleep = lambda seconds: None
+
+    def tearDown(self):
+        retry.cooperative_sleep = self._sleep
+        super(CascadeTestCases, self).tearDown()
+
+    def test_device_busy(self):
+        driver = self._driver()
+        driver.create_vpc("vpc-1", 3001, "usr-1")
+        for i in range(3):
+            vxnet_id = "vxnet-%d" % i
+            driver.create_vxnet(vxnet_id, 2000 + i, "10.0.%d.0/24" % i,
+                                "10.0.%d.1" % i, "usr-1")
+            driver.join_vpc("vpc-1", vxnet_id, "usr-1")
+            driver.add_route("vpc-1", "172.16.%d.0/24" % i,
+                             "10.0.%d.254" % i, "leaf1")
+        self.controller.busy_rate = 0.5
+        results = driver._delete_vpc_children("vpc-1", max_workers=4)
+        self.assertEqual([None] * 6, list(results.values()))
+        router = self.controller.get_items("routers")[0]["id"]
+        self.assertEqual([], driver.qcext.client.list_router_routes(router))
+        self.assertEqual([], driver.qcext.client.get_router_interfaces(
+            router))
+
+
+class SlowDeleteClient(FakeTeardownClient):
+    '''
+    router stays in terra dc for polls_left polls after delete
+    '''
+
+    def __init__(self, polls_left):
+        super(SlowDeleteClient, self).__init__()
+        self.polls_left = polls_left
+        self.deleted = threading.Event()
+
+    def get_router(self, id):
+        self._record("get_router", id)
+        if self.deleted.is_set():
+            if self.polls_left == 0:
+                raise NotFoundException(msg="router %s" % id)
+            self.polls_left -= 1
+        return {"id": id, "cisco:l3_vni": 3001}
+
+
+class SlowDeleteL3(FakeL3):
+
+    def __init__(self, client):
+        super(SlowDeleteL3, self).__init__()
+        self.client = client
+        self.created = []
+
+    def delete_router(self, context, id):
+        super(SlowDeleteL3, self).delete_router(context, id)
+        self.client.deleted.set()
+
+    def create_router(self, context, id):
+        self.created.append((id, self.client.polls_left))
+
+
+class PlanClient(SlowDeleteClient):
+    '''
+    client planning calls against itself
+    '''
+
+    def __init__(self):
+        super(PlanClient, self).__init__(polls_left=0)
+        self.recorder = []
+
+    def plan_client(self, snapshot=None):
+        return self
+
+
+class DeleteVpcAsyncTestCases(unittest.TestCase):
+
+    def setUp(self):
+        super(DeleteVpcAsyncTestCases, self).setUp()
+        cfg.CONF.set_override("vpc_delete_poll_interval", 0.01, "ml2_terra")
+
+    def tearDown(self):
+        cfg.CONF.clear_override("vpc_delete_poll_interval", "ml2_terra")
+
+    def test_create_waits_tombstone(self):
+        client = SlowDeleteClient(polls_left=3)
+        l3 = SlowDeleteL3(client)
+        driver = NeutronDriver(l3, None, FakeQcext(client))
+        future = driver.delete_vpc_async("vpc-1", "usr-1")
+        # another vpc reusing the l3vni waits for the router to go
+        driver.create_vpc("vpc-2", 3001, "usr-1")
+        self.assertTrue(future.done())
+        self.assertEqual([("vpc-2", 0)], l3.created)
+        self.assertEqual(["vpc-1"], l3.deleted)
+        self.assertEqual({}, driver._tombstones)
+
+    def test_unrelated_create(self):
+        client = SlowDeleteClient(polls_left=0)
+        l3 = SlowDeleteL3(client)
+        driver = NeutronDriver(l3, None, FakeQcext(client))
+        driver.delete_vpc_async("vpc-1", "usr-1", l3vni=3001).result(5)
+        driver.create_vpc("vpc-2", 3002, "usr-1")
+        self.assertEqual(1, len(l3.created))
+        # l3vni given, router is read only by polling
+        self.assertEqual(1, [c[0] for c in client.calls].count("get_router"))
+
+    def test_plan_tombstones(self):
+        client = PlanClient()
+        l3 = SlowDeleteL3(client)
+        driver = NeutronDriver(l3, FakeQcext(client), FakeQcext(client))
+        tombstone = Tombstone("vpc-1", 3001, Future())
+        driver._tombstones["vpc-1"] = tombstone
+        plans = []
+        planner = threading.Thread(target=lambda: plans.append(driver.plan(
+            "create_vpc", "vpc-1", 3001, "usr-1")))
+        planner.daemon = True
+        planner.start()
+        planner.join(5)
+        # the plan does not wait for the live delete
+        self.assertEqual([client.recorder], plans)
+        self.assertEqual([("vpc-1", 0)], l3.created)
+        tombstone.future.set_result(None)
+        self.assertEqual({"vpc-1": tombstone}, driver._tombstones)
@@ -0,0 +1,173 @@
+#!/usr/bin/evn python
+# -*- coding: utf-8 -*-
+import unittest
+from common.reconciler import Reconciler
+from networking_terra.common.exceptions import ClientException, \
+    SkippedException
+from fakes import FakeClient, PagedClient, RecordingDriver
+
+
+class ListResourcesTestCases(unittest.TestCase):
+
+    def test_pages(self):
+        client = PagedClient({"networks": [{"id": "n%d" % i}
+                                           for i in range(5)]})
+        items = client.list_resources("networks", origin="qingcloud")
+        self.assertEqual(["n0", "n1", "n2", "n3", "n4"],
+                         [i["id"] for i in items])
+        self.assertEqual(3, len(client.urls))
+        self.assertEqual("http://terra/networks?origin=qingcloud&limit=2"
+                         "&marker=n1", client.urls[1])
+
+    def test_paging_ignored(self):
+        client = PagedClient({"networks": [{"id": "n%d" % i}
+                                           for i in range(5)]},
+                             ignore_paging=True)
+        self.assertEqual(5, len(client.list_resources("networks")))
+        self.assertEqual(1, len(client.urls))
+
+    def test_marker_ignored(self):
+        client = PagedClient({"networks": [{"id": "n%d" % i}
+                                           for i in range(5)]},
+                             ignore_marker=True)
+        self.assertRaises(ClientException, client.list_resources,
+                          "networks")
+        self.assertEqual(2, len(client.urls))
+
+
+class ReconcilerTestCases(unittest.TestCase):
+
+    def setUp(self):
+        super(ReconcilerTestCases, self).setUp()
+        self.client = FakeClient({
+            "tenants": [
+                {"id": "t1", "original_id": "usr-1"},
+                {"id": "t2", "original_id": "usr-old"}],
+            "routers": [
+                {"id": "r1", "original_id": "vpc-1", "cisco:l3_vni": 3001,
+                 "tenant_id": "t1"},
+                {"id": "r2", "original_id": "vpc-old", "tenant_id": "t2"}],
+            "networks": [
+                {"id": "n1", "original_id": "vxnet-1",
+                 "segment:global_id": 2001, "tenant_id": "t1"},
+                {"id": "n2", "original_id": "vxnet-partial",
+                 "tenant_id": "t1"},
+                {"id": "n3", "original_id": "vxnet-old",
+                 "tenant_id": "t2"}],
+            "subnets": [
+                {"id": "s1", "original_id": "vxnet-1",
+                 "cidr": "10.0.1.0/24"},
+                {"id": "s3", "original_id": "vxnet-old"}],
+            "host_links": [
+                {"host_name": "hyper1", "host_interface_name": "eth0",
+                 "switch_name": "leaf1", "switch_interface_name": "Eth1"},
+                {"host_name": "hyper2", "host_interface_name": "eth0",
+                 "switch_name": "leaf1", "switch_interface_name": "Eth2"}],
+            "port_bindings": [
+                {"network_id": "n1", "switch_name": "leaf1",
+                 "interface_name": "Eth1"},
+                {"network_id": "n3", "switch_name": "leaf1",
+                 "interface_name": "Eth2"},
+                {"network_id": "other", "switch_name": "leaf1",
+                 "interface_name": "Eth1"}],
+        }, routes={"r1": [
+            {"id": "rt1", "destination": "0.0.0.0/0",
+             "nexthop": "10.0.1.254", "device_id": "dev-leaf1"},
+            {"id": "rt2", "destination": "172.16.0.0/16",
+             "nexthop": "10.0.1.253", "device_id": "dev-leaf1"}]})
+        self.desired = {
+            "vpcs": {"vpc-1": {"l3vni": 3001, "user_id": "usr-1"},
+                     "vpc-2": {"l3vni": 3002, "user_id": "usr-1"}},
+            "vxnets": {
+                "vxnet-1": {"vni": 2001, "ip_network": "10.0.1.0/24",
+                            "gateway_ip": "10.0.1.1", "user_id": "usr-1"},
+                "vxnet-partial": {"vni": 2002, "ip_network": "10.0.2.0/24",
+                                  "gateway_ip": "10.0.2.1",
+                                  "user_id": "usr-1"}},
+            "nodes": {("vxnet-1", "hyper1"): {"vlan_id": 10},
+                      ("vxnet-1", "hyper2"): {"vlan_id": 10}},
+            "routes": {"vpc-1": [{"destination": "0.0.0.0/0",
+                                  "nexthop": "10.0.1.254",
+                                  "device_name": "leaf1"}],
+                       "vpc-2": [{"destination": "0.0.0.0/0",
+                                  "nexthop": "10.0.2.254",
+                                  "device_name": "leaf1"}]},
+        }
+
+    def test_plan(self):
+        reconciler = Reconciler(RecordingDriver(), self.client, max_workers=2)
+        plan = reconciler.plan(self.desired)
+        steps = [str(s) for phase in plan.phases() for s in phase]
+        self.assertEqual([
+            "remove_node('vxnet-old', 'hyper2', 'usr-old')",
+            "delete_routes('vpc-1', destination='172.16.0.0/16')",
+            "delete_vxnet('vxnet-partial', 'usr-1')",
+            "delete_vxnet('vxnet-old', 'usr-old')",
+            "delete_vpc('vpc-old', 'usr-old', cascade=True)",
+            "create_vpc('vpc-2', 3002, 'usr-1')",
+            "create_vxnet('vxnet-partial', 2002, '10.0.2.0/24', "
+            "'10.0.2.1', 'usr-1')",
+            "add_node('vxnet-1', 2001, 'hyper2', 'usr-1', 10, "
+            "native_vlan=True)",
+            "add_route('vpc-2', '0.0.0.0/0', '10.0.2.254', 'leaf1')",
+        ], steps)
+        self.assertEqual([], plan.conflicts)
+        # routes are listed only for vpcs present and desired, tenants
+        # once for the owners of what is removed
+        self.assertEqual(["routers", "networks", "subnets", "host_links",
+                          "port_bindings", "routes:r1", "tenants"],
+                         self.client.listed)
+
+    def test_validate(self):
+        reconciler = Reconciler(RecordingDriver(), self.client)
+        del self.desired["vxnets"]
+        self.assertRaises(ValueError, reconciler.plan, self.desired)
+        desired = {"vpcs": {"vpc-1": {"l3vni": 3001}},
+                   "routes": {"vpc-1": [{"destination": "0.0.0.0/0"}]}}
+        self.assertRaises(ValueError, reconciler.plan, desired)
+        # nothing is listed for an invalid desired state
+        self.assertEqual([], self.client.listed)
+
+    def test_in_sync(self):
+        desired = {"vpcs": {"vpc-1": {"l3vni": 3001, "user_id": "usr-1"},
+                            "vpc-old": {"l3vni": 3003, "user_id": "usr-1"}}}
+        plan = Reconciler(RecordingDriver(), self.client).plan(desired)
+        self.assertEqual(0, len(plan))
+
+    def test_conflict(self):
+        desired = {"vpcs": {"vpc-1": {"l3vni": 3009, "user_id": "usr-1"},
+                            "vpc-old": {"l3vni": 3003, "user_id": "usr-1"}}}
+        plan = Reconciler(RecordingDriver(), self.client).plan(desired)
+        self.assertEqual(0, len(plan))
+        self.assertEqual(1, len(plan.conflicts))
+
+    def test_apply(self):
+        driver = RecordingDriver(fail_operations=("delete_vxnet",
+                                                  "create_vpc"))
+        reconciler = Reconciler(driver, self.client, max_workers=2)
+        plan, results = reconciler.reconcile(self.desired)
+        failed = [step for step, e in results.items() if e]
+        self.assertEqual(5, len(failed))
+        # steps whose dependencies failed are not run
+        skipped = sorted(step for step, e in results.items()
+                         if isinstance(e, SkippedException))
+        self.assertEqual([
+            "add_route('vpc-2', '0.0.0.0/0', '10.0.2.254', 'leaf1')",
+            "create_vxnet('vxnet-partial', 2002, '10.0.2.0/24', "
+            "'10.0.2.1', 'usr-1')"], skipped)
+        self.assertEqual(len(plan) - 2, len(driver.calls))
+        # creates run after all deletes are done
+        ops = [c[0] for c in driver.calls]
+        self.assertTrue(max(ops.index("delete_vpc"), ops.index("delete_vxnet"))
+                        < ops.index("create_vpc"))
+
+    def test_dry_run(self):
+        driver = RecordingDriver()
+        plan, results = Reconciler(driver, self.client).reconcile(
+            self.desired, dry_run=True)
+        self.assertEqual(None, results)
+        self.assertEqual([], driver.calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/evn python
+# -*- coding: utf-8 -*-
+import unittest
+from oslo_config import cfg
+from networking_terra.common import retry
+from networking_terra.common.client import TerraRestClient
+from networking_terra.common.exceptions import BadRequestException, \
+    NotFoundException
+from networking_terra.common.retry import RetryPolicy, call_with_retry
+from networking_terra.common.utils import call_client
+from networking_terra.testing.fake_controller import FakeTerraController
+
+
+class RetryPolicyTestCases(unittest.TestCase):
+
+    def setUp(self):
+        super(RetryPolicyTestCases, self).setUp()
+        self.sleeps = []
+        self._sleep = retry.cooperative_sleep
+        retry.cooperative_sleep = self.sleeps.append
+
+    def tearDown(self):
+        retry.cooperative_sleep = self._sleep
+
+    def failing(self, errors):
+        def method():
+            if errors:
+                raise errors.pop(0)
+            return "done"
+        method.__name__ = "method"
+        return method
+
+    def test_backoff(self):
+        policy = RetryPolicy(max_retries=5, initial_delay=1, max_delay=4,
+                             jitter=0)
+        method = self.failing([BadRequestException(msg="busy")] * 4)
+        self.assertEqual(call_with_retry(policy, "op", method), "done")
+        self.assertEqual(self.sleeps, [1, 2, 4, 4])
+
+    def test_jitter(self):
+        policy = RetryPolicy(initial_delay=10, jitter=0.5)
+        for i in range(100):
+            self.assertTrue(5 <= policy.get_delay(1) <= 10)
+
+    def test_max_retries(self):
+        policy = RetryPolicy(max_retries=1, jitter=0)
+        method = self.failing([BadRequestException(msg="busy")] * 2)
+        self.assertRaises(BadRequestException,
+                          call_with_retry, policy, "op", method)
+        self.assertEqual(len(self.sleeps), 1)
+
+    def test_fatal(self):
+        policy = RetryPolicy(max_retries=5,
+                             fatal_patterns=["already exists"])
+        method = self.failing([NotFoundException(msg="port")])
+        self.assertRaises(NotFoundException,
+                          call_with_retry, policy, "op", method)
+        method = self.failing([BadRequestException(msg="vni already exists")])
+        self.assertRaises(BadRequestException,
+                          call_with_retry, policy, "op", method)
+        self.assertEqual(self.sleeps, [])
+
+    def test_deadline(self):
+        policy = RetryPolicy(max_retries=5, initial_delay=10, jitter=0,
+                             deadline=15)
+        method = self.failing([BadRequestException(msg="busy")] * 5)
+        self.assertRaises(BadRequestException,
+                          call_with_retry, policy, "op", method)
+        self.assertEqual(self.sleeps, [10])
+
+
+
+class ClientRetryTestCases(unittest.TestCase):
+    '''
+    retries of client calls to a fake controller
+    '''
+
+    def setUp(self):
+        super(ClientRetryTestCases, self).setUp()
+        self.sleeps = []
+        self._sleep = retry.cooperative_sleep
+        retry.cooperative_sleep = self.sleeps.append
+        self.controller = FakeTerraController(seed=1).start()
+        self.client = TerraRestClient(self.controller.url,
+                                      self.controller.auth_url, "admin",
+                                      "pass", 5, "qingcloud",
+                                      lookup_concurrency=0)
+
+    def tearDown(self):
+        retry.cooperative_sleep = self._sleep
+        cfg.CONF.clear_override("retry_fatal_patterns", "ml2_terra")
+        self.client.close()
+        self.controller.stop()
+
+    def test_stats(self):
+        self.controller.errors = {"POST routers": (1, 400)}
+        policy = RetryPolicy(max_retries=2, jitter=0)
+        self.assertRaises(BadRequestException, call_client,
+                          self.client.create_router, name="vpc-1",
+                          tenant_id="usr-1", original_id="vpc-1",
+                          retry_policy=policy)
+        self.assertEqual(2, self.client.get_stats()["create_router_retries"])
+        self.assertEqual(3, self.controller.get_stats()["POST routers"])
+        counters = self.client.metrics.snapshot()["counters"]
+        self.assertEqual(2, counters[("retries", "POST", "routers", None)])
+
+    def test_fatal_patterns(self):
+        cfg.CONF.set_override("retry_fatal_patterns", ["already exists"],
+                              "ml2_terra")
+        self.client.create_router(name="vpc-1", tenant_id="usr-1",
+                                  original_id="vpc-1")
+        self.assertRaises(BadRequestException, call_client,
+                          self.client.create_router, name="vpc-1",
+                          tenant_id="usr-1", original_id="vpc-1",
+                          retry_badreq=10)
+        self.assertEqual([], self.sleeps)
+        self.assertEqual(2, self.controller.get_stats()["POST routers"])
+        self.assertFalse("create_router_retries" in self.client.get_stats())
@@ -0,0 +1,120 @@
+#!/usr/bin/evn python
+# -*- coding: utf-8 -*-
+import logging as std_logging
+import unittest
+from oslo_config import cfg
+from networking_terra.common import utils
+
+cfg.CONF.import_group("ml2_terra", "networking_terra.common.config")
+
+
+class ListHandler(std_logging.Handler):
+
+    def __init__(self):
+        std_logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class Context(object):
+
+    def __init__(self):
+        self.formatted = 0
+        self.network = {"id": "vxnet-1"}
+
+    def __getattribute__(self, name):
+        if name == "__dict__":
+            object.__setattr__(self, "formatted",
+                               object.__getattribute__(self, "formatted") + 1)
+        return object.__getattribute__(self, name)
+
+
+class Driver(object):
+
+    @utils.log_context(True)
+    def create_network(self, context, name, shared=False):
+        return name
+
+    @utils.log_parameter
+    def add_route(self, destination, nexthop):
+        return destination
+
+    @utils.log_parameter
+    def delete_route(self, destination):
+        raise ValueError(destination)
+
+
+class LogTestCases(unittest.TestCase):
+
+    def setUp(self):
+        super(LogTestCases, self).setUp()
+        self.handler = ListHandler()
+        utils.LOG.addHandler(self.handler)
+        self.level = utils.LOG.level
+        utils.LOG.setLevel(std_logging.INFO)
+
+    def tearDown(self):
+        utils.LOG.removeHandler(self.handler)
+        utils.LOG.setLevel(self.level)
+        for opt in ("log_sample_rate", "log_payload_max_length"):
+            cfg.CONF.clear_override(opt, "ml2_terra")
+
+    def test_truncate(self):
+        self.assertEqual("abc", utils.truncate("abc", 3))
+        self.assertEqual("ab...(2 more)", utils.truncate("abcd", 2))
+        self.assertEqual("abcd", utils.truncate("abcd", 0))
+
+    def test_one_record(self):
+        context = Context()
+        self.assertEqual("vxnet-1",
+                         Driver().create_network(context, "vxnet-1",
+                                                 shared=True))
+        self.assertEqual(1, len(self.handler.records))
+        record = self.handler.records[0]
+        self.assertTrue(record.getMessage().startswith(
+            "called create_network(vxnet-1, shared=True) in "))
+        self.assertTrue("'network': {'id': 'vxnet-1'}" in record.getMessage())
+        # fields are set on the record for structured handlers
+        self.assertEqual("create_network", record.operation)
+        self.assertEqual("vxnet-1, shared=True", record.call_args)
+        self.assertTrue(record.duration >= 0)
+        self.assertTrue("'network': {'id': 'vxnet-1'}" in
+                        record.call_context)
+
+    def test_failed_call(self):
+        self.assertRaises(ValueError, Driver().delete_route, "0.0.0.0/0")
+        record = self.handler.records[0]
+        self.assertEqual("delete_route", record.operation)
+        self.assertFalse(hasattr(record, "call_context"))
+
+    def test_disabled(self):
+        utils.LOG.setLevel(std_logging.WARNING)
+        context = Context()
+        Driver().create_network(context, "vxnet-1")
+        Driver().add_route("0.0.0.0/0", "10.0.0.1")
+        self.assertEqual([], self.handler.records)
+        self.assertEqual(0, context.formatted)
+
+    def test_sampling(self):
+        cfg.CONF.set_override("log_sample_rate", 0, "ml2_terra")
+        for _ in range(10):
+            Driver().add_route("0.0.0.0/0", "10.0.0.1")
+        self.assertEqual([], self.handler.records)
+        cfg.CONF.set_override("log_sample_rate", 1, "ml2_terra")
+        Driver().add_route("0.0.0.0/0", "10.0.0.1")
+        self.assertEqual(1, len(self.handler.records))
+
+    def test_max_length(self):
+        cfg.CONF.set_override("log_payload_max_length", 8, "ml2_terra")
+        Driver().add_route("10.0.0.0/24", "10.0.0.1")
+        record = self.handler.records[0]
+        self.assertEqual(8, record.call_args.index("...("))
+        self.assertTrue(record.call_args.endswith(" more)"))
+        self.assertTrue(record.getMessage().startswith(
+            "called add_route(%s) in " % record.call_args))
+
+
+if __name__ == '__main__':
+    unittest.main()